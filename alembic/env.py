@@ -10,6 +10,7 @@ from alembic import context
 from app.core.config import settings
 from app.db.models.event import BaseORM
 import app.db.models.users
+import app.db.models.api_keys
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,32 @@
+"""add events occurred_at index
+
+Revision ID: 5b1e0c7f9a42
+Revises: a5cd69b1b86f
+Create Date: 2026-10-19 01:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e0c7f9a42'
+down_revision: Union[str, Sequence[str], None] = 'a5cd69b1b86f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY: a plain CREATE INDEX holds a SHARE lock on events and blocks ingest for the whole build.
+    # It cannot run in a transaction; if it fails it leaves an INVALID index to drop before retrying.
+    with op.get_context().autocommit_block():
+        op.create_index('idx_events_occurred_at', 'events', ['occurred_at'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_events_occurred_at', table_name='events', postgresql_concurrently=True)
@@ -0,0 +1,69 @@
+import csv
+import io
+from typing import Optional
+
+import orjson
+from starlette.responses import Response
+
+from app.core.tracing import span
+from app.services.query_result import QueryResult
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+CSV_MEDIA_TYPE = "text/csv"
+JSON_MEDIA_TYPE = "application/json"
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """Picks the response format from the Accept header; JSON unless Arrow or CSV is asked for."""
+    if accept:
+        if ARROW_STREAM_MEDIA_TYPE in accept:
+            return ARROW_STREAM_MEDIA_TYPE
+        if CSV_MEDIA_TYPE in accept:
+            return CSV_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def encode_json(result: QueryResult, elapsed_sec: float, **extra) -> bytes:
+    return orjson.dumps({
+        "data": result.records(),
+        "response_time_sec": round(elapsed_sec, 3),
+        **extra,
+    })
+
+
+def encode_csv(result: QueryResult) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(result.columns)
+    writer.writerows(result.rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def encode_arrow(result: QueryResult) -> bytes:
+    return result.to_arrow()
+
+
+def batch_response(items: list[dict], elapsed_sec: float) -> Response:
+    """Batch results are always JSON: several tables do not fit a single CSV or Arrow stream."""
+    with span("serialize"):
+        content = orjson.dumps({"results": items, "response_time_sec": round(elapsed_sec, 3)})
+    return Response(content=content, media_type=JSON_MEDIA_TYPE)
+
+
+def analytics_response(result: QueryResult, elapsed_sec: float, accept: Optional[str] = None, **extra) -> Response:
+    """
+    Serializes an analytics result once, in the format requested by the Accept header.
+    For CSV and Arrow the timing and extra fields travel in headers instead of the body.
+    """
+    media_type = negotiate_media_type(accept)
+    if media_type == JSON_MEDIA_TYPE:
+        with span("serialize"):
+            content = encode_json(result, elapsed_sec, **extra)
+        return Response(content=content, media_type=JSON_MEDIA_TYPE)
+
+    headers = {"X-Response-Time-Sec": str(round(elapsed_sec, 3))}
+    if extra:
+        headers["X-Result-Meta"] = orjson.dumps(extra).decode("utf-8")
+    with span("serialize"):
+        body = encode_csv(result) if media_type == CSV_MEDIA_TYPE else encode_arrow(result)
+    return Response(content=body, media_type=media_type, headers=headers)
@@ -1,63 +1,386 @@
-import pandas as pd
-from fastapi import APIRouter, Query, Depends
-from fastapi_limiter.depends import RateLimiter
-from starlette.responses import JSONResponse
+from fastapi import APIRouter, Query, Depends, Request, HTTPException
+from fastapi.responses import JSONResponse
 from datetime import date
+from contextlib import contextmanager
+from typing import Callable, Optional
 import asyncio
-import json
 import time
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from app.services.analytics_service import analytics_service
+from app.api.responses import analytics_response, batch_response
+from app.core.tracing import span
+from app.schemas.analytics import BatchRequest, MetricSpec
+from app.services.analytics_batch import plan_query, run_batch
+from app.services.analytics_executor import ClientDisconnected, QueryTimeout, QueueTimeout, analytics_executor
+from app.services.analytics_jobs import analytics_jobs
+from app.services.analytics_service import Granularity, analytics_service
+from app.services.live_counters import live_counters
+from app.services.query_result import QueryResult
+from app.services.rate_limiter import rate_limit
+from app.services.result_cache import result_cache
+from app.services.retention_engine import RetentionMode
+from app.services.segments import Segment
 from app.db.models.users import User as DBUser
-from app.services.jwt_service import get_current_user
+from app.services.api_key_service import get_read_principal
 
 analytics_router = APIRouter(prefix="/stats")
 
+MAX_ROLLING_DAYS = 90
+MAX_HOURLY_DAYS = 31
 
-def df_to_json_response(df: pd.DataFrame, elapsed_sec: float):
-    """Converts a Pandas DataFrame to a JSON API response with elapsed time."""
-    content = {
-        "data": json.loads(df.to_json(orient="records", date_format='iso')),
-        "response_time_sec": round(elapsed_sec, 3)
-    }
-    return JSONResponse(content=content)
 
+def get_segment(
+        segment: Optional[list[str]] = Query(
+            None,
+            description="Filter as field:value, repeatable (e.g. event_type:purchase, properties.country:UA,PL)",
+        ),
+) -> Segment:
+    try:
+        return Segment.parse(segment)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-@analytics_router.get("/dau", dependencies=[Depends(RateLimiter(times=5, seconds=60))])
+
+@contextmanager
+def query_errors():
+    """Maps interrupted analytics queries to HTTP errors."""
+    try:
+        yield
+    except QueryTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except QueueTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client closed request")
+
+
+async def cached_query(request: Request, metric: str, func: Callable[..., QueryResult], **params) -> QueryResult:
+    """Runs a blocking analytics query on the analytics executor, memoized per DuckDB snapshot version."""
+    with query_errors(), span("result_cache", metric=metric):
+        return await result_cache.get_or_compute(
+            metric, params, lambda: analytics_executor.run(metric, func, request=request, **params)
+        )
+
+
+async def fresh_query(request: Request, metric: str, func: Callable[..., QueryResult],
+                      **params) -> tuple[QueryResult, dict]:
+    """
+    Lambda-style query: DuckDB snapshot up to its watermark plus the Postgres tail after it.
+    Not cached, the tail changes with every ingest.
+    """
+    with span("tail"):
+        with query_errors():
+            watermark, time_zone = await analytics_executor.run("tail", analytics_service.snapshot_state, request=request)
+        tail = await analytics_service.fetch_tail(watermark, time_zone)
+    with query_errors():
+        result = await analytics_executor.run(metric, func, request=request, heavy=True, **params, tail=tail)
+    return result, {"watermark": tail.effective_watermark}
+
+
+async def merge_live_top_events(request: Request, result: QueryResult, from_date: date, to_date: date,
+                                 limit: int, segment: Segment) -> QueryResult:
+    """Adds events counted by the streaming counters since the last sync to a snapshot top."""
+    recent = await live_counters.top_events(from_date, to_date, limit, segment.event_types)
+    missing = sorted({event_type for event_type, _ in recent} - set(result.column("event_type")))
+    if missing:
+        # Snapshot totals for live event types that are outside the snapshot top
+        extra = await cached_query(
+            request, "top_events", analytics_service.get_top_events,
+            from_date=from_date, to_date=to_date, limit=len(missing),
+            segment=Segment({"event_type": tuple(missing)}),
+        )
+        result = QueryResult(result.columns, result.rows + extra.rows)
+    return live_counters.merge_top_events(result, recent, limit)
+
+
+def error_bound(segment: Segment) -> dict:
+    """Sketch error bound for the response; segments on properties are counted exactly."""
+    return {"error_bound": analytics_service.hll_error_bound()} if segment.sketchable else {}
+
+
+@analytics_router.get("/dau", dependencies=[Depends(rate_limit("analytics", get_read_principal))])
 async def get_dau(
-        current_user: DBUser = Depends(get_current_user),
+        request: Request,
+        current_user: DBUser = Depends(get_read_principal),
         from_date: date = Query(..., description="Start date (YYYY-MM-DD)"),
         to_date: date = Query(..., description="End date (YYYY-MM-DD)"),
+        segment: Segment = Depends(get_segment),
+        approx: bool = Query(False, description="Estimate from per-day HyperLogLog sketches"),
+        fresh: bool = Query(False, description="Include events ingested after the last sync (reads the Postgres tail)"),
 ):
     """Number of unique user_id per day (Daily Active Users)."""
     start_time = time.perf_counter()
-    df = await asyncio.to_thread(analytics_service.get_dau, from_date, to_date)
+    if fresh:
+        # Exact counts: sketches cannot absorb the tail
+        result, meta = await fresh_query(
+            request, "dau", analytics_service.get_dau,
+            from_date=from_date, to_date=to_date, segment=segment,
+        )
+        elapsed = time.perf_counter() - start_time
+        return analytics_response(result, elapsed, request.headers.get("accept"), **meta)
+
+    if approx:
+        result = await cached_query(
+            request, "dau_approx", analytics_service.get_dau_approx,
+            from_date=from_date, to_date=to_date, segment=segment,
+        )
+        elapsed = time.perf_counter() - start_time
+        return analytics_response(result, elapsed, request.headers.get("accept"), **error_bound(segment))
+
+    result = await cached_query(
+        request, "dau", analytics_service.get_dau,
+        from_date=from_date, to_date=to_date, segment=segment,
+    )
+    elapsed = time.perf_counter() - start_time
+    return analytics_response(result, elapsed, request.headers.get("accept"))
+
+
+@analytics_router.get("/wau", dependencies=[Depends(rate_limit("analytics", get_read_principal))])
+async def get_wau(
+        request: Request,
+        current_user: DBUser = Depends(get_read_principal),
+        from_date: date = Query(..., description="Start date (YYYY-MM-DD)"),
+        to_date: date = Query(..., description="End date (YYYY-MM-DD)"),
+        segment: Segment = Depends(get_segment),
+):
+    """Number of unique user_id per ISO week (Weekly Active Users), estimated from sketches."""
+    start_time = time.perf_counter()
+    result = await cached_query(
+        request, "wau", analytics_service.get_wau,
+        from_date=from_date, to_date=to_date, segment=segment,
+    )
+    elapsed = time.perf_counter() - start_time
+    return analytics_response(result, elapsed, request.headers.get("accept"), **error_bound(segment))
+
+
+@analytics_router.get("/mau", dependencies=[Depends(rate_limit("analytics", get_read_principal))])
+async def get_mau(
+        request: Request,
+        current_user: DBUser = Depends(get_read_principal),
+        from_date: date = Query(..., description="Start date (YYYY-MM-DD)"),
+        to_date: date = Query(..., description="End date (YYYY-MM-DD)"),
+        segment: Segment = Depends(get_segment),
+):
+    """Number of unique user_id per calendar month (Monthly Active Users), estimated from sketches."""
+    start_time = time.perf_counter()
+    result = await cached_query(
+        request, "mau", analytics_service.get_mau,
+        from_date=from_date, to_date=to_date, segment=segment,
+    )
+    elapsed = time.perf_counter() - start_time
+    return analytics_response(result, elapsed, request.headers.get("accept"), **error_bound(segment))
+
+
+@analytics_router.get("/active-users", dependencies=[Depends(rate_limit("analytics", get_read_principal))])
+async def get_active_users(
+        request: Request,
+        current_user: DBUser = Depends(get_read_principal),
+        from_date: date = Query(..., description="Start date (YYYY-MM-DD), in the tz calendar"),
+        to_date: date = Query(..., description="End date (YYYY-MM-DD), in the tz calendar"),
+        granularity: Granularity = Query("day", description="Bucket size"),
+        rolling: Optional[str] = Query(
+            None, pattern=r"^\d{1,2}d$", description="Trailing window per day, e.g. 7d (rolling WAU) or 28d"
+        ),
+        tz: str = Query("UTC", description="IANA time zone for bucketing, e.g. Europe/Kyiv"),
+        segment: Segment = Depends(get_segment),
+):
+    """Unique users per hour/day/week/month in a time zone, or rolling per-day windows; estimated from sketches."""
+    try:
+        ZoneInfo(tz)
+    except (ValueError, ZoneInfoNotFoundError):
+        raise HTTPException(status_code=422, detail=f"Unknown time zone: {tz}")
+    rolling_days = int(rolling[:-1]) if rolling else None
+    if rolling_days is not None and not (1 <= rolling_days <= MAX_ROLLING_DAYS and granularity == "day"):
+        raise HTTPException(
+            status_code=422, detail=f"rolling must be 1d..{MAX_ROLLING_DAYS}d and requires granularity=day"
+        )
+    if granularity == "hour" and (to_date - from_date).days >= MAX_HOURLY_DAYS:
+        raise HTTPException(status_code=422, detail=f"granularity=hour supports at most {MAX_HOURLY_DAYS} days")
+    if not segment.sketchable:
+        raise HTTPException(status_code=422, detail="active-users supports event_type segments only")
+
+    start_time = time.perf_counter()
+    result = await cached_query(
+        request, "active_users", analytics_service.get_active_users,
+        from_date=from_date, to_date=to_date, granularity=granularity,
+        rolling_days=rolling_days, tz=tz, segment=segment,
+    )
     elapsed = time.perf_counter() - start_time
-    return df_to_json_response(df, elapsed)
+    return analytics_response(result, elapsed, request.headers.get("accept"), **error_bound(segment))
 
 
-@analytics_router.get("/top-events", dependencies=[Depends(RateLimiter(times=5, seconds=60))])
+@analytics_router.get("/top-events", dependencies=[Depends(rate_limit("analytics", get_read_principal))])
 async def get_top_events(
-        current_user: DBUser = Depends(get_current_user),
+        request: Request,
+        current_user: DBUser = Depends(get_read_principal),
         from_date: date = Query(..., description="Start date (YYYY-MM-DD)"),
         to_date: date = Query(..., description="End date (YYYY-MM-DD)"),
         limit: int = Query(10, gt=0, description="Limit for the number of events in the top list"),
+        segment: Segment = Depends(get_segment),
+        live: bool = Query(True, description="Add events ingested since the last sync (streaming counters)"),
+        fresh: bool = Query(False, description="Include events ingested after the last sync (reads the Postgres tail)"),
 ):
     """Top event_type by count."""
     start_time = time.perf_counter()
-    df = await asyncio.to_thread(analytics_service.get_top_events, from_date, to_date, limit)
+    if fresh:
+        result, meta = await fresh_query(
+            request, "top_events", analytics_service.get_top_events,
+            from_date=from_date, to_date=to_date, limit=limit, segment=segment,
+        )
+        elapsed = time.perf_counter() - start_time
+        return analytics_response(result, elapsed, request.headers.get("accept"), **meta)
+
+    result = await cached_query(
+        request, "top_events", analytics_service.get_top_events,
+        from_date=from_date, to_date=to_date, limit=limit, segment=segment,
+    )
+    # Streaming counters only know event_type, so property segments stay snapshot-only
+    if live and segment.sketchable:
+        result = await merge_live_top_events(request, result, from_date, to_date, limit, segment)
     elapsed = time.perf_counter() - start_time
-    return df_to_json_response(df, elapsed)
+    return analytics_response(result, elapsed, request.headers.get("accept"))
 
 
-@analytics_router.get("/retention", dependencies=[Depends(RateLimiter(times=5, seconds=60))])
+@analytics_router.get("/retention", dependencies=[Depends(rate_limit("analytics", get_read_principal))])
 async def get_retention(
-        current_user: DBUser = Depends(get_current_user),
+        request: Request,
+        current_user: DBUser = Depends(get_read_principal),
         start_date: date = Query(..., description="Start date for cohort calculation (YYYY-MM-DD)"),
-        windows: int = Query(4, ge=2, description="Number of weekly windows for analysis (including week 0)"),
+        windows: int = Query(4, ge=2, description="Number of windows for analysis (including window 0)"),
+        mode: RetentionMode = Query("weekly", description="Window size: daily or weekly"),
+        segment: Segment = Depends(get_segment),
+        fresh: bool = Query(False, description="Include events ingested after the last sync (reads the Postgres tail)"),
+):
+    """Cohort retention (daily or weekly cohorts). Window 0 - the period of the first activity."""
+    start_time = time.perf_counter()
+    if fresh:
+        result, meta = await fresh_query(
+            request, "retention", analytics_service.get_retention,
+            start_date=start_date, windows=windows, mode=mode, segment=segment,
+        )
+        elapsed = time.perf_counter() - start_time
+        return analytics_response(result, elapsed, request.headers.get("accept"), **meta)
+
+    result = await cached_query(
+        request, "retention", analytics_service.get_retention,
+        start_date=start_date, windows=windows, mode=mode, segment=segment,
+    )
+    elapsed = time.perf_counter() - start_time
+    return analytics_response(result, elapsed, request.headers.get("accept"))
+
+
+@analytics_router.get("/funnel", dependencies=[Depends(rate_limit("analytics", get_read_principal))])
+async def get_funnel(
+        request: Request,
+        current_user: DBUser = Depends(get_read_principal),
+        from_date: date = Query(..., description="Start date for the first step (YYYY-MM-DD)"),
+        to_date: date = Query(..., description="End date for the first step (YYYY-MM-DD)"),
+        steps: list[str] = Query(..., min_length=2, max_length=10, description="Ordered event types, repeatable"),
+        window_hours: int = Query(24, gt=0, le=24 * 90, description="Max time from the first to the last step"),
+        segment: Segment = Depends(get_segment),
+):
+    """Ordered conversion funnel: users reaching each step within the window after step 1."""
+    start_time = time.perf_counter()
+    result = await cached_query(
+        request, "funnel", analytics_service.get_funnel,
+        from_date=from_date, to_date=to_date, steps=steps, window_hours=window_hours, segment=segment,
+    )
+    elapsed = time.perf_counter() - start_time
+    return analytics_response(result, elapsed, request.headers.get("accept"))
+
+
+@analytics_router.get("/sessions", dependencies=[Depends(rate_limit("analytics", get_read_principal))])
+async def get_sessions(
+        request: Request,
+        current_user: DBUser = Depends(get_read_principal),
+        from_date: date = Query(..., description="Start date (YYYY-MM-DD)"),
+        to_date: date = Query(..., description="End date (YYYY-MM-DD)"),
+):
+    """Sessions per day, average session length and events per session."""
+    start_time = time.perf_counter()
+    result = await cached_query(
+        request, "sessions", analytics_service.get_sessions,
+        from_date=from_date, to_date=to_date,
+    )
+    elapsed = time.perf_counter() - start_time
+    return analytics_response(result, elapsed, request.headers.get("accept"))
+
+
+@analytics_router.post("/batch", dependencies=[Depends(rate_limit("analytics", get_read_principal))])
+async def get_batch(
+        request: Request,
+        body: BatchRequest,
+        current_user: DBUser = Depends(get_read_principal),
+):
+    """
+    Several metrics in one request (e.g. a dashboard page). Cached metrics are served from the
+    result cache; the rest run together on one DuckDB connection, sharing scans where possible.
+    Top events include the streaming counters unless `live` is false, like GET /top-events.
+    """
+    start_time = time.perf_counter()
+    try:
+        queries = [plan_query(spec) for spec in body.metrics]
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    results = list(await asyncio.gather(*(result_cache.peek(q.metric, q.params) for q in queries)))
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        with query_errors():
+            computed = await analytics_executor.run(
+                "batch", run_batch, request=request, queries=[queries[i] for i in misses]
+            )
+        for i, result in zip(misses, computed):
+            results[i] = result
+            await result_cache.store(queries[i].metric, queries[i].params, result)
+
+    # The cache keeps snapshot results; live counts are added per request, as in GET /top-events
+    for i, query in enumerate(queries):
+        if query.live:
+            results[i] = await merge_live_top_events(request, results[i], **query.params)
+
+    items = [
+        {"metric": spec.metric, "data": result.records(), **query.extra}
+        for spec, query, result in zip(body.metrics, queries, results)
+    ]
+    elapsed = time.perf_counter() - start_time
+    return batch_response(items, elapsed)
+
+
+@analytics_router.post("/jobs", status_code=202, dependencies=[Depends(rate_limit("analytics", get_read_principal))])
+async def submit_job(
+        request: Request,
+        spec: MetricSpec,
+        current_user: DBUser = Depends(get_read_principal),
 ):
-    """Simple cohort retention (weekly cohorts). Week 0 - the week of the first activity."""
+    """
+    Submits a metric (same body as one item of /batch) as a background job and returns its id.
+    Identical jobs over the same snapshot share one id and one execution.
+    """
+    try:
+        job = await analytics_jobs.submit(spec)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {**job, "location": str(request.url_for("get_job", job_id=job["job_id"]))}
+
+
+@analytics_router.get("/jobs/{job_id}", name="get_job", dependencies=[Depends(rate_limit("job_status", get_read_principal))])
+async def get_job(
+        request: Request,
+        job_id: str,
+        current_user: DBUser = Depends(get_read_principal),
+        wait: float = Query(0, ge=0, le=30, description="Seconds to wait for the job to finish (long polling)"),
+):
+    """Job status; once done, the result in the format negotiated by Accept (like the GET endpoints)."""
     start_time = time.perf_counter()
-    df = await asyncio.to_thread(analytics_service.get_retention, start_date, windows)
+    job = await analytics_jobs.wait(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if job["status"] != "done":
+        return JSONResponse(job, status_code=202 if job["status"] in ("queued", "running") else 200)
+
+    result = await analytics_jobs.result(job_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Job result expired")
     elapsed = time.perf_counter() - start_time
-    return df_to_json_response(df, elapsed)
+    return analytics_response(result, elapsed, request.headers.get("accept"), job_id=job_id, **job["extra"])
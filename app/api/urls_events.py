@@ -1,27 +1,58 @@
 import time
 
-from fastapi import APIRouter, status, Depends
-from pydantic import conlist
+from fastapi import APIRouter, status, Depends, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError, conlist
+from app.core.tracing import span
 from app.schemas.events import EventSchema
 from app.services import event_processor
-from fastapi_limiter.depends import RateLimiter
 
-from app.services.jwt_service import get_current_user
+from app.services.api_key_service import get_ingest_principal
+from app.services.rate_limiter import charge_ingest, client_identity
 from app.db.models.users import User as DBUser
 
 events_router = APIRouter()
 
+EventBatch = conlist(EventSchema, min_length=1)
+event_batch_adapter = TypeAdapter(EventBatch)
+
+
 @events_router.post(
     "/events",
     status_code=status.HTTP_202_ACCEPTED,
-    dependencies=[Depends(RateLimiter(times=5, seconds=60))]
+    # The body is parsed in the handler (to time it), so its schema is declared here
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": {
+                "type": "array", "minItems": 1, "items": EventSchema.model_json_schema(),
+            }}},
+        }
+    },
 )
 async def ingest_events(
-    events: conlist(EventSchema, min_length=1),
-    current_user: DBUser = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    current_user: DBUser = Depends(get_ingest_principal)
 ):
     """Accepts a JSON array of events and triggers their asynchronous processing."""
 
+    with span("body"):
+        body = await request.body()
+    with span("validate"):
+        try:
+            # Parses and validates in one pass, without building intermediate Python objects
+            events = event_batch_adapter.validate_json(body)
+        except ValidationError as e:
+            # Same error shape as FastAPI's own body validation
+            raise RequestValidationError(
+                [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)], body=body
+            )
+
+    # Quotas are charged by batch size (events and body bytes), not per request
+    with span("quota"):
+        response.headers.update(charge_ingest(client_identity(request, current_user), len(events), len(body)))
+
     start_time = time.perf_counter()
     rows_processed = await event_processor.process_events(events=events)
     elapsed = time.perf_counter() - start_time
@@ -31,4 +62,4 @@ async def ingest_events(
         "obj_count": rows_processed,
         "response_time_sec": round(elapsed, 4),
         "user_id": current_user.id
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends
+
+from app.db.db_helper import db_helper
+from app.db.models.users import User as DBUser
+from app.services.analytics_executor import analytics_executor
+from app.services.analytics_jobs import analytics_jobs
+from app.services.api_key_service import api_key_index
+from app.services.jwt_service import get_admin_user
+from app.services.password_hasher import password_hasher
+from app.services.principal_cache import principal_cache
+from app.services.rate_limiter import rate_limiter
+from app.services.result_cache import result_cache
+
+# Runtime internals (backends, queues, cache and key counters): administrators only
+system_router = APIRouter(prefix="/system")
+
+
+@system_router.get("/analytics")
+async def analytics_runtime_stats(admin_user: DBUser = Depends(get_admin_user)):
+    """Analytics executor lanes (queue depth, wait times, timeouts, cancellations), background jobs and result cache counters."""
+    return {
+        "executor": analytics_executor.stats(),
+        "jobs": analytics_jobs.stats(),
+        "result_cache": result_cache.stats(),
+    }
+
+
+@system_router.get("/auth")
+async def auth_runtime_stats(admin_user: DBUser = Depends(get_admin_user)):
+    """Password hashing pool (queue, wait times, rejections), principal cache, API key and rate limiter counters."""
+    return {
+        "password_hasher": password_hasher.stats(),
+        "principal_cache": principal_cache.stats(),
+        "api_keys": api_key_index.stats(),
+        "rate_limiter": rate_limiter.stats(),
+    }
+
+
+@system_router.get("/db")
+async def db_runtime_stats(admin_user: DBUser = Depends(get_admin_user)):
+    """
+    Postgres pool utilization, checkouts and connection wait times per engine (default and temporary),
+    the per-process connection ceiling and the app's backends on the server by state.
+    """
+    try:
+        backends = await db_helper.backend_usage()
+    except Exception as e:
+        backends = {"error": str(e)}
+    return {**db_helper.stats(), "backends": backends}
@@ -4,12 +4,20 @@ from fastapi.security import OAuth2PasswordRequestForm
 from loguru import logger
 
 from app.db.models.users import User as DBUser
+from app.services.api_key_service import api_key_index
 from app.services.auth_service import auth_service
-from app.services.jwt_service import get_current_user, get_current_refresh_user
-from app.schemas.users import UserCreate, User, Token
+from app.services.jwt_service import get_admin_user, get_current_user, get_current_refresh_user
+from app.services.password_hasher import HasherBusy
+from app.schemas.users import UserCreate, User, Token, UserStatusUpdate, ApiKeyCreate, ApiKey, ApiKeyCreated
 
 user_router = APIRouter(prefix="/stats")
 
+HASHER_BUSY_EXCEPTION = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Too many authentication requests, retry later",
+    headers={"Retry-After": "1"},
+)
+
 
 @user_router.post("/register", response_model=User, status_code=status.HTTP_201_CREATED)
 async def register_user_endpoint(user_data: UserCreate):
@@ -26,6 +34,8 @@ async def register_user_endpoint(user_data: UserCreate):
 
     except HTTPException:
         raise  # handled by FastAPI
+    except HasherBusy:
+        raise HASHER_BUSY_EXCEPTION
     except Exception as e:
         logger.exception(f"Failed to register user: {user_data.username}")
         raise HTTPException(
@@ -58,6 +68,8 @@ async def login_for_access_token(
 
     except HTTPException:
         raise
+    except HasherBusy:
+        raise HASHER_BUSY_EXCEPTION
     except Exception as e:
         logger.exception(f"Failed to login user: {form_data.username}")
         raise HTTPException(
@@ -78,3 +90,40 @@ async def read_users_me(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error occurred while fetching user information"
         ) from e
+
+
+@user_router.patch("/users/{username}", status_code=status.HTTP_204_NO_CONTENT)
+async def update_user_status(
+        username: str,
+        status_data: UserStatusUpdate,
+        admin_user: Annotated[DBUser, Depends(get_admin_user)]
+):
+    """Disables or re-enables a user; its tokens and API keys stop working on every worker right away."""
+    if not await auth_service.set_user_disabled(username, status_data.disabled):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+
+@user_router.post("/api-keys", response_model=ApiKeyCreated, status_code=status.HTTP_201_CREATED)
+async def create_api_key(
+        key_data: ApiKeyCreate,
+        current_user: Annotated[DBUser, Depends(get_current_user)]
+):
+    """Creates an API key for a machine client; the key is returned only in this response."""
+    db_key, api_key = await api_key_index.create_key(current_user.id, key_data.name, key_data.scopes)
+    return ApiKeyCreated(**ApiKey.model_validate(db_key).model_dump(), api_key=api_key)
+
+
+@user_router.get("/api-keys", response_model=list[ApiKey])
+async def list_api_keys(
+        current_user: Annotated[DBUser, Depends(get_current_user)]
+):
+    return await api_key_index.list_keys(current_user.id)
+
+
+@user_router.delete("/api-keys/{key_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_api_key(
+        key_id: str,
+        current_user: Annotated[DBUser, Depends(get_current_user)]
+):
+    if not await api_key_index.revoke_key(current_user.id, key_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="API key not found")
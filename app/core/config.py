@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from pydantic import PostgresDsn
 from pathlib import Path
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -18,8 +19,12 @@ class DatabaseConfig(BaseModel):
     url: PostgresDsn
     echo: bool = False
     echo_pool: bool = False
+    # Потолок соединений с postgres на процесс: pool_size + max_overflow + sync_connections
     max_overflow: int = 10
-    pool_size: int = 50
+    pool_size: int = 10
+    pool_timeout: float = 10 # сколько ждать свободное соединение из пула, сек.
+    sync_connections: int = 2 # соединения postgres_scan при синке в DuckDB (столько потоков DuckDB читает postgres)
+    application_name: str = "event-analytics" # видно в pg_stat_activity, по нему считаются соединения приложения
     naming_convention: dict[str, str] = {
           "ix": "ix_%(column_0_label)s",
           "uq": "uq_%(table_name)s_%(column_0_name)s",
@@ -29,6 +34,13 @@ class DatabaseConfig(BaseModel):
     }
     temp_engine_ttl: int = 1800 # время хранения отдельного подключения к отдельной бд через апи в сек.
     connection_check_interval: int = 60 # как часто проверять когда нужно удалить старые подключения в сек.
+    temp_engine_max: int = 8 # сколько отдельных подключений держать одновременно (самое давно неиспользуемое закрывается)
+    temp_pool_size: int = 2 # пул соединений отдельного подключения
+    temp_max_overflow: int = 3
+
+    @property
+    def max_connections(self) -> int:
+        return self.pool_size + self.max_overflow + self.sync_connections
 
 
 class AuthConfig(BaseModel):
@@ -36,6 +48,84 @@ class AuthConfig(BaseModel):
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     refresh_token_expire_days: int = 7
+    bcrypt_rounds: int = 12 # стоимость bcrypt; при изменении пароли перехешируются при следующем входе
+    hasher_workers: int = 2 # процессы для bcrypt (одновременно выполняемые хеширования)
+    hasher_max_pending: int = 64 # сколько запросов может ждать хеширования, дальше — 503
+    token_cache_size: int = 10000 # сколько проверенных токенов держать в памяти воркера (до их exp)
+    principal_cache_size: int = 10000 # пользователи в локальном кэше воркера
+    principal_cache_local_ttl: int = 60 # сек.; ограничивает устаревание, если сообщение об инвалидации потеряно
+    principal_cache_ttl: int = 600 # время жизни пользователя в redis, сек.
+    api_key_quota_per_minute: int = 600 # квота запросов в минуту для нового api-ключа (в бд можно изменить для ключа)
+    api_key_refresh_interval: int = 60 # как часто воркер перечитывает api-ключи из бд, сек. (если сообщение об изменении потеряно)
+    admin_usernames: list[str] = [] # пользователи с правами администратора (блокировка пользователей, /system/*)
+
+
+class RedisConfig(BaseModel):
+    url: str = "redis://redis:6379"
+    retry_after: int = 30 # сколько сек. не обращаться к redis после ошибки подключения
+
+
+class RateLimit(BaseModel):
+    times: int # запросов (для квот инжеста — событий или байт) за период
+    seconds: int = 60
+    burst: int | None = None # сколько можно потратить подряд (ёмкость бакета), по умолчанию times
+
+
+class RateLimitConfig(BaseModel):
+    sync_interval: float = 0.5 # как часто воркер сверяет свой расход лимитов с redis, сек.
+    max_buckets: int = 100000 # бакетов (лимит × клиент) в памяти воркера
+    # квоты POST /events на клиента, списываются по размеру пачки; пачка больше burst отклоняется (413)
+    ingest_events: RateLimit = RateLimit(times=5000, seconds=1, burst=50000) # событий в сек.
+    ingest_bytes: RateLimit = RateLimit(times=4 * 1024 * 1024, seconds=1, burst=32 * 1024 * 1024) # байт тела запроса в сек.
+    analytics: RateLimit = RateLimit(times=5, seconds=60) # аналитические запросы, batch, постановка задач
+    job_status: RateLimit = RateLimit(times=120, seconds=60) # опрос статуса фоновой задачи
+
+
+class AnalyticsConfig(BaseModel):
+    hll_precision: int = 14 # 2^14 регистров на скетч, стандартная погрешность ~0.8%
+    cache_max_bytes: int = 64 * 1024 * 1024 # лимит памяти локального кэша результатов
+    cache_max_entries: int = 1024
+    cache_ttl: int = 6 * 3600 # время жизни результата в redis в сек. (версия снапшота меняется раньше)
+    cache_local_ttl: int = 3600 # ограничивает устаревание локального кэша воркера, если redis недоступен
+    cache_lock_timeout: int = 30 # сколько сек. другие воркеры ждут результат вместо повторного расчёта
+    segment_properties: list[str] = ["country"] # ключи properties_json, которые синк выносит в колонки для сегментов
+    session_gap_minutes: int = 30 # пауза без событий, после которой начинается новая сессия (если нет session_id)
+    row_group_size: int = 122880 # строк в row group synced_events: меньше — точнее zone maps, больше — лучше сжатие
+    executor_cheap_workers: int = 4 # потоки для лёгких запросов (сводки, скетчи, сессии)
+    executor_heavy_workers: int = 2 # потоки для тяжёлых запросов (retention по SQL, воронки, batch, fresh)
+    query_timeout: float = 30 # таймаут лёгкого запроса, сек. (по истечении вызывается interrupt DuckDB)
+    heavy_query_timeout: float = 120 # таймаут тяжёлого запроса, сек.
+    queue_timeout: float = 10 # сколько запрос может ждать свободный поток, сек. (дальше — 503, время выполнения не съедает)
+    executor_job_workers: int = 2 # потоки для фоновых задач POST /stats/jobs
+    job_timeout: float = 1800 # таймаут фоновой задачи, сек.
+    job_ttl: int = 24 * 3600 # сколько хранится статус и результат задачи в redis, сек.
+    live_top_capacity: int = 1000 # максимум счётчиков (день, event_type) в минутном бакете живого топа событий
+    live_window_minutes: int = 120 # сколько минут хранятся живые бакеты (должно перекрывать интервал синка)
+    live_flush_interval: float = 1.0 # как часто воркер публикует свои бакеты в redis, сек.
+
+
+class TracingConfig(BaseModel):
+    server_timing: bool = True # заголовок Server-Timing с длительностью этапов запроса
+    exporter: Literal["none", "otlp", "file"] = "none" # экспорт спанов OpenTelemetry (нужен opentelemetry-sdk)
+    otlp_endpoint: str = "http://localhost:4318/v1/traces" # коллектор OTLP/HTTP (нужен opentelemetry-exporter-otlp-proto-http)
+    file: str = "traces.jsonl" # куда писать спаны при exporter=file, по одному JSON в строке
+    service_name: str = "event-analytics"
+
+
+class LoggingConfig(BaseModel):
+    # уровни loguru; DEBUG пишет каждый запрос и обращение к пулу — только для отладки
+    level: Literal["TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL"] = "INFO"
+    format: Literal["json", "text"] = "json" # json — по объекту в строке (для сборщиков логов), text — для консоли
+    file: str | None = None # писать в файл вместо stdout
+    # не больше N записей в секунду от логгера (или пакета) уровня ниже WARNING, остальные отбрасываются
+    sample_rates: dict[str, float] = {
+        "uvicorn.access": 20,
+        "app.services.event_processor": 20,
+        "app.services.auth_service": 20,
+    }
+    batch_size: int = 512 # записей в одной записи в поток
+    flush_interval: float = 0.5 # как часто фоновый поток пишет накопленные записи, сек.
+    max_pending: int = 100000 # сколько записей может ждать записи, дальше новые отбрасываются
 
 
 class Settings(BaseSettings):
@@ -50,6 +140,11 @@ class Settings(BaseSettings):
     api: ApiPrefixConfig = ApiPrefixConfig()
     db: DatabaseConfig
     auth: AuthConfig
+    redis: RedisConfig = RedisConfig()
+    rate_limit: RateLimitConfig = RateLimitConfig()
+    analytics: AnalyticsConfig = AnalyticsConfig()
+    tracing: TracingConfig = TracingConfig()
+    logging: LoggingConfig = LoggingConfig()
 
 settings = Settings()
 
@@ -1,19 +1,17 @@
+import atexit
 import sys
 import logging
-from pathlib import Path
-from loguru import logger
+import threading
+import time
+import traceback
+from typing import BinaryIO, Optional
 
-# Global log level switcher
-# Possible values: "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"
-DEFAULT_LEVEL = "DEBUG"
+import orjson
+from loguru import logger
 
-# Paths
-LOG_DIR = Path(__file__).parent / "logs"
-LOG_DIR.mkdir(exist_ok=True)
-LOG_FILE = LOG_DIR / "project.log"
+from app.core.config import settings
 
-# Remove default handlers
-logger.remove()
+WARNING_NO = logger.level("WARNING").no
 
 # Formatters
 CONSOLE_FORMAT = (
@@ -28,63 +26,237 @@ FILE_FORMAT = (
     "{file}:{function}:{line} | {message}"
 )
 
-# Console output
-logger.add(
-    sys.stdout,
-    level=DEFAULT_LEVEL,
-    format=CONSOLE_FORMAT,
-    colorize=True,
-)
+# External loggers uvicorn, asyncpg, sqlalchemy ...
+external_loggers = [
+    "uvicorn",
+    "uvicorn.error",
+    "uvicorn.access",
+    "asyncpg",
+    "sqlalchemy",
+]
+
+
+class RateSampler:
+    """
+    Keeps at most `rate` records per second from each configured logger (a logger name or
+    a package prefix); WARNING and above always pass. The next record that passes carries
+    the number dropped before it as `sampled_out`.
+
+    Used as the handler filter for loguru calls and checked by InterceptHandler before a stdlib
+    record (e.g. uvicorn.access) becomes a loguru record, so dropped access lines cost next to nothing.
+    Counting is not locked: with threads logging at once the limit is approximate.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        self.rates = rates
+        self._resolved: dict[str, Optional[float]] = {}
+        # logger name -> [window start, records passed, records dropped]
+        self._windows: dict[str, list] = {}
+
+    def _rate(self, name: str) -> Optional[float]:
+        rate = self._resolved.get(name, False)
+        if rate is False:
+            parts = name.split(".")
+            prefixes = (".".join(parts[:i]) for i in range(len(parts), 0, -1))
+            rate = next((self.rates[p] for p in prefixes if p in self.rates), None)
+            self._resolved[name] = rate
+        return rate
+
+    def allow(self, name: str, level_no: int) -> Optional[int]:
+        """None if the record is dropped, otherwise how many were dropped before it."""
+        if level_no >= WARNING_NO:
+            return 0
+        rate = self._rate(name)
+        if rate is None:
+            return 0
+
+        now = time.monotonic()
+        window = self._windows.get(name)
+        if window is None:
+            window = self._windows[name] = [now, 0, 0]
+        elif now - window[0] >= 1.0:
+            window[0], window[1] = now, 0
+        if window[1] >= rate:
+            window[2] += 1
+            return None
+        window[1] += 1
+        dropped, window[2] = window[2], 0
+        return dropped
+
+    def __call__(self, record) -> bool:
+        if "logger" in record["extra"]:
+            # Came through InterceptHandler, already sampled there
+            return True
+        dropped = self.allow(record["name"], record["level"].no)
+        if dropped:
+            record["extra"]["sampled_out"] = dropped
+        return dropped is not None
+
+
+class BatchedJsonSink:
+    """
+    Loguru sink writing one JSON object per line. The logging call only appends the record's
+    fields to a buffer; a background thread serializes and writes them every `flush_interval`
+    seconds or `batch_size` records, so request handlers never wait on stdout or the disk.
+    Beyond `max_pending` buffered records new ones are dropped (and counted) instead of growing
+    memory while the output is stalled.
+    """
+
+    def __init__(self, stream: BinaryIO, batch_size: int, flush_interval: float, max_pending: int):
+        self._stream = stream
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._buffer: list[tuple] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self.written = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, message):
+        record = message.record
+        entry = (
+            record["time"], record["level"].name, record["extra"].get("logger", record["name"]),
+            record["function"], record["line"], record["message"], record["extra"], record["exception"],
+        )
+        with self._lock:
+            if len(self._buffer) >= self._max_pending:
+                self.dropped += 1
+                return
+            self._buffer.append(entry)
+            if len(self._buffer) >= self._batch_size:
+                self._wakeup.set()
+
+    @staticmethod
+    def serialize(entry: tuple) -> bytes:
+        timestamp, level, name, function, line, message, extra, exception = entry
+        data = {
+            "ts": timestamp.isoformat(), "level": level, "logger": name,
+            "func": function, "line": line, "msg": message,
+        }
+        for key, value in extra.items():
+            if key != "logger":
+                data.setdefault(key, value)
+        if exception is not None:
+            data["exc"] = "".join(traceback.format_exception(exception.type, exception.value, exception.traceback))
+        return orjson.dumps(data, default=str) + b"\n"
+
+    def _drain(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        try:
+            self._stream.write(b"".join(self.serialize(entry) for entry in batch))
+            self._stream.flush()
+            self.written += len(batch)
+        except Exception as e:
+            # Nowhere left to log it
+            print(f"Log sink failed, {len(batch)} records lost: {e!r}", file=sys.stderr)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            self._drain()
+
+    def stop(self):
+        """Called by loguru when the handler is removed: writes what is left."""
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+        self._drain()
 
-# File logging
-logger.add(
-    str(LOG_FILE),
-    level=DEFAULT_LEVEL,
-    rotation="5 MB",
-    retention=10,
-    compression="zip",
-    encoding="utf-8",
-    format=FILE_FORMAT,
-    backtrace=True,
-    diagnose=True,
-    enqueue=True,
-)
 
 # Intercept standard logging → loguru
 class InterceptHandler(logging.Handler):
+    sampler: Optional[RateSampler] = None
+
     def emit(self, record):
+        dropped = self.sampler.allow(record.name, record.levelno) if self.sampler is not None else 0
+        if dropped is None:
+            return
         try:
             level = logger.level(record.levelname).name
         except ValueError:
             level = record.levelno
-        logger.opt(depth=6, exception=record.exc_info).log(
+        # Keep the stdlib logger name (e.g. uvicorn.access) for the JSON "logger" field
+        extra = {"logger": record.name, "sampled_out": dropped} if dropped else {"logger": record.name}
+        logger.bind(**extra).opt(depth=6, exception=record.exc_info).log(
             level, record.getMessage()
         )
 
-# Redirect all stdlib logging to loguru
-logging.basicConfig(handlers=[InterceptHandler()], level=0, force=True)
 
-# External loggers uvicorn, asyncpg, sqlalchemy ...
-external_loggers = [
-    "uvicorn",
-    "uvicorn.error",
-    "uvicorn.access",
-    "asyncpg",
-    "tortoise",
-    "sqlalchemy",
-    "sqlalchemy.engine",
-]
+def setup_logging():
+    """
+    Replaces loguru's default DEBUG handler with the configured one (settings.logging) and routes
+    stdlib logging (uvicorn, asyncpg, sqlalchemy) through it. Called once at startup; buffered
+    records are flushed at interpreter exit, after uvicorn's last shutdown messages.
+
+    Calls below the level return before formatting, so hot paths log with loguru's lazy style
+    (logger.debug("... {}", value)) rather than f-strings.
+    """
+    cfg = settings.logging
+    sampler = InterceptHandler.sampler = RateSampler(cfg.sample_rates)
+
+    # Remove default handlers
+    logger.remove()
+
+    if cfg.format == "json":
+        stream = open(cfg.file, "ab") if cfg.file else sys.stdout.buffer
+        logger.add(
+            BatchedJsonSink(stream, cfg.batch_size, cfg.flush_interval, cfg.max_pending),
+            level=cfg.level,
+            # Callable format: the message only, exceptions are serialized by the sink
+            format=lambda record: "{message}",
+            filter=sampler,
+            backtrace=False,
+            diagnose=False,
+        )
+    elif cfg.file:
+        logger.add(
+            cfg.file,
+            level=cfg.level,
+            rotation="5 MB",
+            retention=10,
+            compression="zip",
+            encoding="utf-8",
+            format=FILE_FORMAT,
+            filter=sampler,
+            diagnose=False,
+            enqueue=True,
+        )
+    else:
+        logger.add(sys.stdout, level=cfg.level, format=CONSOLE_FORMAT, filter=sampler, colorize=True, diagnose=False)
+
+    # Numeric level for stdlib loggers: loguru-only names (TRACE, SUCCESS) are unknown to logging
+    level_no = logger.level(cfg.level).no
+
+    # Redirect all stdlib logging to loguru
+    logging.basicConfig(handlers=[InterceptHandler()], level=level_no, force=True)
+
+    for name in external_loggers:
+        ext_logger = logging.getLogger(name)
+        ext_logger.handlers.clear()
+        ext_logger.addHandler(InterceptHandler())
+        # SQL statements are logged only with db.echo (SQLAlchemy sets sqlalchemy.engine to INFO itself)
+        ext_logger.setLevel(max(level_no, logging.WARNING) if name == "sqlalchemy" else level_no)
+        ext_logger.propagate = False
+
+    atexit.register(shutdown_logging)
+
 
-for name in external_loggers:
-    ext_logger = logging.getLogger(name)
-    ext_logger.handlers.clear()
-    ext_logger.addHandler(InterceptHandler())
-    ext_logger.setLevel(DEFAULT_LEVEL)
-    ext_logger.propagate = False
+def shutdown_logging():
+    """Flushes buffered records and removes the handlers."""
+    logger.remove()
 
 
 # Usage example
 if __name__ == "__main__":
+    setup_logging()
     logger.debug("Debug message")
     logger.info("Info message")
     logger.warning("Warning message")
@@ -94,3 +266,4 @@ if __name__ == "__main__":
     # stdlib logging (redirected to loguru)
     std_logger = logging.getLogger("test")
     std_logger.warning("This warning from logging will be redirected to loguru")
+    shutdown_logging()
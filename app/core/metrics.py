@@ -0,0 +1,128 @@
+"""
+Prometheus metrics of the service, exposed on GET /metrics.
+
+With several uvicorn workers set PROMETHEUS_MULTIPROC_DIR to an empty directory (cleared before
+the server starts): every worker then writes its samples to files there and /metrics merges
+them (prometheus_client multiprocess mode), so counters and histograms cover all workers.
+"""
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+# --- Ingest ----------------------------------------------------------------
+
+EVENTS_INGESTED = Counter("events_ingested_total", "Events inserted into Postgres")
+EVENTS_DUPLICATED = Counter("events_duplicated_total", "Events skipped because their event_id was already stored")
+INGEST_BATCH_SIZE = Histogram(
+    "ingest_batch_events", "Events per ingest batch",
+    buckets=(1, 10, 100, 1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000),
+)
+INGEST_INSERT_DURATION = Histogram("ingest_insert_duration_seconds", "Time to insert one batch into Postgres")
+
+# --- HTTP ------------------------------------------------------------------
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Request latency by route template and status",
+    ["method", "route", "status"],
+)
+
+# --- Postgres pool ---------------------------------------------------------
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections", "Connections checked out of the Postgres pool", multiprocess_mode="livesum"
+)
+DB_POOL_CAPACITY = Gauge(
+    "db_pool_capacity_connections", "pool_size + max_overflow of the Postgres pool", multiprocess_mode="livesum"
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds", "Time to get a connection from the Postgres pool",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+# --- Analytics -------------------------------------------------------------
+
+ANALYTICS_QUERY_DURATION = Histogram(
+    "analytics_query_duration_seconds", "DuckDB query execution time by metric and executor lane",
+    ["metric", "lane"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+SYNCS = Counter("analytics_syncs_total", "Postgres -> DuckDB syncs by result", ["result"])
+SYNC_DURATION = Histogram(
+    "analytics_sync_duration_seconds", "Duration of a successful Postgres -> DuckDB sync",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+SYNC_ROWS = Gauge("analytics_sync_rows", "Events in the DuckDB snapshot", multiprocess_mode="mostrecent")
+# Sync lag: time() - analytics_sync_watermark_timestamp_seconds
+SYNC_WATERMARK = Gauge(
+    "analytics_sync_watermark_timestamp_seconds", "Latest event time in the DuckDB snapshot", multiprocess_mode="max"
+)
+SYNC_LAST_SUCCESS = Gauge(
+    "analytics_sync_last_success_timestamp_seconds", "When the last sync finished", multiprocess_mode="max"
+)
+
+# --- Caches ----------------------------------------------------------------
+
+# Hit ratio: sum by (cache) (rate(cache_lookups_total{result!="miss"}[5m])) / sum by (cache) (rate(cache_lookups_total[5m]))
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and outcome", ["cache", "result"])
+
+
+def cache_lookups(cache: str) -> tuple[Counter, Counter, Counter]:
+    """Pre-bound (local_hit, shared_hit, miss) children, so hot paths skip the label lookup."""
+    return tuple(CACHE_LOOKUPS.labels(cache, result) for result in ("local_hit", "shared_hit", "miss"))
+
+
+class MetricsMiddleware:
+    """Records request latency per route template (not raw path, to keep label cardinality bounded)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status_code)
+            ).observe(time.perf_counter() - started)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Exposition of this process' metrics, or of all workers in multiprocess mode."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """Drops this worker's live gauges (pool usage) from the multiprocess directory on shutdown."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,138 @@
+"""
+Per-stage timing of requests.
+
+`span(name)` times a block of a hot path (auth, body read, validation, connection acquisition,
+insert, DuckDB query, serialization...). Within an HTTP request the durations are returned in the
+`Server-Timing` header, so a slow response shows where its time went (browser dev tools, curl -v).
+
+With tracing.exporter set the same blocks become OpenTelemetry spans under one span per request,
+exported to an OTLP collector or a JSON-lines file. OpenTelemetry is optional: without
+opentelemetry-sdk installed only Server-Timing is recorded.
+"""
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from loguru import logger
+from starlette.datastructures import MutableHeaders
+
+from app.core.config import settings
+
+# (stage, seconds) of the current request; None outside requests or with Server-Timing off
+_timings: ContextVar[Optional[list[tuple[str, float]]]] = ContextVar("server_timings", default=None)
+
+_tracer = None
+_tracer_provider = None
+_server_span_kind = None
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[None]:
+    """Times the block as a request stage (and an OpenTelemetry span if export is on)."""
+    timings = _timings.get()
+    if timings is None and _tracer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        with _tracer.start_as_current_span(name, attributes=attributes) if _tracer is not None else nullcontext():
+            yield
+    finally:
+        if timings is not None:
+            timings.append((name, time.perf_counter() - started))
+
+
+def record(name: str, seconds: float):
+    """Adds a stage measured elsewhere that just ended (e.g. waiting for a pooled connection)."""
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+    if _tracer is not None:
+        end = time.time_ns()
+        _tracer.start_span(name, start_time=end - int(seconds * 1e9)).end(end_time=end)
+
+
+def server_timing_header(timings: list[tuple[str, float]]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings)
+
+
+class ServerTimingMiddleware:
+    """Collects the stages of each request into the Server-Timing header; opens the request's root span."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (not settings.tracing.server_timing and _tracer is None):
+            await self.app(scope, receive, send)
+            return
+
+        timings = [] if settings.tracing.server_timing else None
+        token = _timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and timings is not None:
+                timings.append(("total", time.perf_counter() - started))
+                MutableHeaders(scope=message).append("Server-Timing", server_timing_header(timings))
+            await send(message)
+
+        root = (
+            _tracer.start_as_current_span(scope["method"], kind=_server_span_kind)
+            if _tracer is not None else nullcontext()
+        )
+        try:
+            with root as root_span:
+                try:
+                    await self.app(scope, receive, send_with_timing)
+                finally:
+                    if root_span is not None:
+                        route = scope.get("route")
+                        route_path = route.path if route is not None else "unmatched"
+                        root_span.update_name(f"{scope['method']} {route_path}")
+                        root_span.set_attribute("http.route", route_path)
+        finally:
+            _timings.reset(token)
+
+
+def setup_tracing():
+    """Enables OpenTelemetry export if configured and the SDK is installed (called at startup)."""
+    global _tracer, _tracer_provider, _server_span_kind
+    cfg = settings.tracing
+    if cfg.exporter == "none":
+        return
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+        if cfg.exporter == "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter(endpoint=cfg.otlp_endpoint)
+        else:
+            exporter = ConsoleSpanExporter(
+                out=open(cfg.file, "a", encoding="utf-8"),
+                formatter=lambda s: s.to_json(indent=None) + "\n",
+            )
+    except ImportError as e:
+        logger.warning(f"Tracing exporter '{cfg.exporter}' needs OpenTelemetry packages ({e}); only Server-Timing is recorded.")
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": cfg.service_name}))
+    # Spans are exported in batches from a background thread, off the request path
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer_provider = provider
+    _tracer = provider.get_tracer("app")
+    _server_span_kind = trace.SpanKind.SERVER
+    logger.info(f"Exporting OpenTelemetry spans ({cfg.exporter}).")
+
+
+def shutdown_tracing():
+    """Flushes spans still waiting for export."""
+    global _tracer, _tracer_provider
+    if _tracer_provider is not None:
+        _tracer_provider.shutdown()
+        _tracer_provider = None
+        _tracer = None
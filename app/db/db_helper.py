@@ -1,8 +1,13 @@
 import asyncio
 import time
-from typing import Dict, Any, Tuple, Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, NamedTuple, Optional
 
+import asyncpg
 from loguru import logger
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -11,11 +16,84 @@ from sqlalchemy.ext.asyncio import (
 )
 
 from app.core.config import settings
+from app.core.metrics import DB_POOL_CAPACITY, DB_POOL_CHECKED_OUT, DB_POOL_WAIT
+from app.core.tracing import record
+
+
+class PoolStats:
+    """
+    Checkout counters and connection wait times of one engine's pool.
+    With `export` they are also published as Prometheus metrics (only the default pool is).
+    """
+
+    def __init__(self, engine: AsyncEngine, pool_size: int, max_overflow: int, export: bool = False):
+        self.engine = engine
+        self.capacity = pool_size + max_overflow
+        self.export = export
+        self.checkouts = 0
+        self.connects = 0
+        self.waits = 0
+        self.total_wait_sec = 0.0
+        self.max_wait_sec = 0.0
+        event.listen(engine.sync_engine, "checkout", self._on_checkout)
+        event.listen(engine.sync_engine, "connect", self._on_connect)
+        if export:
+            event.listen(engine.sync_engine, "checkin", self._on_checkin)
+            DB_POOL_CAPACITY.inc(self.capacity)
+
+    def _on_checkout(self, *args):
+        self.checkouts += 1
+        if self.export:
+            DB_POOL_CHECKED_OUT.inc()
+
+    def _on_checkin(self, *args):
+        # Fired before the connection is back in the pool, so pool.checkedout() would still count it
+        DB_POOL_CHECKED_OUT.dec()
+
+    def _on_connect(self, *args):
+        self.connects += 1
+
+    def record_wait(self, seconds: float):
+        self.waits += 1
+        self.total_wait_sec += seconds
+        self.max_wait_sec = max(self.max_wait_sec, seconds)
+        if self.export:
+            DB_POOL_WAIT.observe(seconds)
+
+    def stats(self) -> dict:
+        pool = self.engine.pool
+        checked_out = pool.checkedout()
+        return {
+            "capacity": self.capacity,
+            "checked_out": checked_out,
+            "idle": pool.checkedin(),
+            "utilization": round(checked_out / self.capacity, 3) if self.capacity else 0.0,
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "avg_wait_ms": round(1000 * self.total_wait_sec / self.waits, 2) if self.waits else 0.0,
+            "max_wait_ms": round(1000 * self.max_wait_sec, 2),
+        }
+
+
+class TempEngine(NamedTuple):
+    engine: AsyncEngine
+    session_factory: async_sessionmaker
+    pool_stats: PoolStats
+    last_used: float
 
 
 class DataBaseHelper:
+    """
+    The process' only access to the application Postgres: one pool (pool_size + max_overflow) shared
+    by ORM sessions (`connection` decorator) and raw asyncpg connections for bulk paths
+    (`raw_connection`). The DuckDB sync reads Postgres through postgres_scan with at most
+    sync_connections connections on top, so a process never holds more than db.max_connections.
+    Sessions for other databases (db_params) use the temporary engines below.
+    """
+
     TEMP_ENGINE_TTL: int = settings.db.temp_engine_ttl
     CONNECTION_CHECK_INTERVAL: int = settings.db.connection_check_interval
+    TEMP_ENGINE_MAX: int = settings.db.temp_engine_max
 
     def __init__(self):
         # Default engine
@@ -25,6 +103,8 @@ class DataBaseHelper:
             echo_pool=settings.db.echo_pool,
             pool_size=settings.db.pool_size,
             max_overflow=settings.db.max_overflow,
+            pool_timeout=settings.db.pool_timeout,
+            connect_args={"server_settings": {"application_name": settings.db.application_name}},
         )
         self.session_factory: async_sessionmaker[AsyncSession] = async_sessionmaker(
             bind=self.engine,
@@ -32,45 +112,80 @@ class DataBaseHelper:
             autocommit=False,
             expire_on_commit=False,
         )
+        self.pool_stats = PoolStats(self.engine, settings.db.pool_size, settings.db.max_overflow, export=True)
 
-        # Stores temporary engines: {url: (engine, session_factory, last_used_timestamp)}
-        self._temp_engines: Dict[str, Tuple[AsyncEngine, async_sessionmaker, float]] = {}
+        # Temporary engines for other databases, least recently used first (at most TEMP_ENGINE_MAX)
+        self._temp_engines: "OrderedDict[str, TempEngine]" = OrderedDict()
+        self.temp_engines_created = 0
+        self.temp_engines_evicted = 0
 
-        # Cleanup task
+        # Cleanup task, started with the first temporary engine
         self._cleanup_task: Optional[asyncio.Task] = None
         logger.info("DataBaseHelper initialized with default engine.")
 
-    async def _start_cleanup_loop_if_needed(self):
-        """Start background cleanup loop for temporary engines if not running"""
-        if self._cleanup_task is None:
-            loop = asyncio.get_running_loop()
-            self._cleanup_task = loop.create_task(self._cleanup_loop())
-            logger.info("Started cleanup loop for temporary engines.")
+    async def start(self):
+        """Opens the first pooled connection at startup, so a wrong DSN shows up in the logs right away."""
+        try:
+            async with self.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            logger.info(f"Postgres pool ready, at most {settings.db.max_connections} connections per process.")
+        except Exception as e:
+            logger.error(f"Postgres is not reachable at startup: {e}")
+
+    @asynccontextmanager
+    async def raw_connection(self) -> AsyncIterator[asyncpg.Connection]:
+        """asyncpg connection from the shared pool for bulk paths (executemany, COPY); autocommit."""
+        started = time.perf_counter()
+        async with self.engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            waited = time.perf_counter() - started
+            self.pool_stats.record_wait(waited)
+            record("db_acquire", waited)
+            yield raw.driver_connection
+
+    @staticmethod
+    def duckdb_dsn() -> str:
+        """libpq URL for DuckDB's postgres_scan, tagged so its connections are told apart in pg_stat_activity."""
+        url = make_url(str(settings.db.url)).set(drivername="postgresql")
+        url = url.update_query_dict({"application_name": f"{settings.db.application_name}-sync"})
+        return url.render_as_string(hide_password=False)
+
+    async def backend_usage(self) -> dict[str, int]:
+        """Server-side view: connections of all processes of this app by state (pg_stat_activity)."""
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                text("""
+                    SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity
+                    WHERE application_name LIKE :app || '%'
+                    GROUP BY 1
+                """),
+                {"app": settings.db.application_name},
+            )
+            return dict(result.all())
 
     async def _cleanup_loop(self):
         """Dispose expired temporary engines in background"""
         try:
             while True:
+                await asyncio.sleep(self.CONNECTION_CHECK_INTERVAL)
                 now = time.time()
-                expired = []
-                for url, (engine, _, last_used) in list(self._temp_engines.items()):
-                    if now - last_used > self.TEMP_ENGINE_TTL:
-                        expired.append(url)
-
+                expired = [url for url, temp in self._temp_engines.items() if now - temp.last_used > self.TEMP_ENGINE_TTL]
                 for url in expired:
-                    engine, _, _ = self._temp_engines.pop(url)
-                    await engine.dispose()
-                    logger.info(f"Disposed temporary engine for {url} due to TTL expiration.")
-
-                await asyncio.sleep(self.CONNECTION_CHECK_INTERVAL)
+                    await self._temp_engines.pop(url).engine.dispose()
+                    logger.info(f"Disposed temporary engine for {self._display_url(url)} due to TTL expiration.")
         except asyncio.CancelledError:
             logger.info("Cleanup loop stopped.")
             raise
 
-    def _get_or_create_temp_engine(self, db_params: Dict[str, Any]):
+    @staticmethod
+    def _display_url(url: str) -> str:
+        return make_url(url).render_as_string(hide_password=True)
+
+    async def _get_or_create_temp_engine(self, db_params: Dict[str, Any]) -> TempEngine:
         """
         Create or reuse a temporary engine.
-        All important settings (echo, pool_size, etc.) come from global config.
+        Echo settings come from global config; pools are small (temp_pool_size + temp_max_overflow)
+        and at most TEMP_ENGINE_MAX engines are kept, so many target DBs can't exhaust connections.
         """
         url = db_params.get("url")
         if not url:
@@ -78,39 +193,67 @@ class DataBaseHelper:
 
         now = time.time()
 
-        if url in self._temp_engines:
-            engine, factory, _ = self._temp_engines[url]
-            self._temp_engines[url] = (engine, factory, now)
-            logger.debug(f"Reusing temporary engine for {url}, updated last_used timestamp.")
-        else:
-            engine: AsyncEngine = create_async_engine(
-                url=url,
-                echo=settings.db.echo,
-                echo_pool=settings.db.echo_pool,
-                pool_size=settings.db.pool_size,
-                max_overflow=settings.db.max_overflow,
+        temp = self._temp_engines.get(url)
+        if temp is not None:
+            temp = self._temp_engines[url] = temp._replace(last_used=now)
+            self._temp_engines.move_to_end(url)
+            logger.opt(lazy=True).debug(
+                "Reusing temporary engine for {}, updated last_used timestamp.", lambda: self._display_url(url)
             )
-            factory = async_sessionmaker(
-                bind=engine,
-                autoflush=False,
-                autocommit=False,
-                expire_on_commit=False,
+            return temp
+
+        engine: AsyncEngine = create_async_engine(
+            url=url,
+            echo=settings.db.echo,
+            echo_pool=settings.db.echo_pool,
+            pool_size=settings.db.temp_pool_size,
+            max_overflow=settings.db.temp_max_overflow,
+        )
+        factory = async_sessionmaker(
+            bind=engine,
+            autoflush=False,
+            autocommit=False,
+            expire_on_commit=False,
+        )
+        temp = self._temp_engines[url] = TempEngine(
+            engine, factory, PoolStats(engine, settings.db.temp_pool_size, settings.db.temp_max_overflow), now
+        )
+        self.temp_engines_created += 1
+        logger.info(f"Created new temporary engine for {self._display_url(url)}.")
+
+        while len(self._temp_engines) > self.TEMP_ENGINE_MAX:
+            # Prefer the least recently used engine without checked out connections
+            victim = next(
+                (u for u, t in self._temp_engines.items() if u != url and t.engine.pool.checkedout() == 0),
+                next(iter(self._temp_engines)),
             )
-            self._temp_engines[url] = (engine, factory, now)
-            logger.info(f"Created new temporary engine for {url}.")
+            await self._temp_engines.pop(victim).engine.dispose()
+            self.temp_engines_evicted += 1
+            logger.info(f"Disposed temporary engine for {self._display_url(victim)} (engine cache full).")
 
-        # Start cleanup loop if not running
-        asyncio.create_task(self._start_cleanup_loop_if_needed())
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.get_running_loop().create_task(self._cleanup_loop())
+            logger.info("Started cleanup loop for temporary engines.")
 
-        return self._temp_engines[url][0], self._temp_engines[url][1]
+        return temp
+
+    def stats(self) -> dict:
+        return {
+            "max_connections": settings.db.max_connections,
+            "sync_connections": settings.db.sync_connections,
+            "default": self.pool_stats.stats(),
+            "temp_engines": {self._display_url(url): temp.pool_stats.stats() for url, temp in self._temp_engines.items()},
+            "temp_engines_created": self.temp_engines_created,
+            "temp_engines_evicted": self.temp_engines_evicted,
+        }
 
     async def dispose(self):
         """Dispose default engine and all temporary engines, stop cleanup"""
         await self.engine.dispose()
         logger.info("Disposed default engine.")
 
-        for engine, _, _ in self._temp_engines.values():
-            await engine.dispose()
+        for temp in self._temp_engines.values():
+            await temp.engine.dispose()
         self._temp_engines.clear()
         logger.info("Disposed all temporary engines.")
 
@@ -128,26 +271,29 @@ class DataBaseHelper:
             db_params: Optional[Dict[str, Any]] = kwargs.pop("db_params", None)
 
             if db_params:
-                engine, temp_factory = self._get_or_create_temp_engine(db_params)
-                async with temp_factory() as session:
-                    try:
-                        logger.debug(f"Using temporary engine for session with {db_params['url']}")
-                        return await method(*args, session=session, **kwargs)
-                    except Exception as e:
-                        if session.in_transaction():
-                            await session.rollback()
-                        logger.error(f"Error in temporary session: {e}")
-                        raise
+                temp = await self._get_or_create_temp_engine(db_params)
+                factory, pool_stats, kind = temp.session_factory, temp.pool_stats, "temporary"
+                logger.opt(lazy=True).debug(
+                    "Using temporary engine for session with {}", lambda: self._display_url(db_params["url"])
+                )
             else:
-                async with self.session_factory() as session:
-                    try:
-                        logger.debug("Using default engine for session.")
-                        return await method(*args, session=session, **kwargs)
-                    except Exception as e:
-                        if session.in_transaction():
-                            await session.rollback()
-                        logger.error(f"Error in default session: {e}")
-                        raise
+                factory, pool_stats, kind = self.session_factory, self.pool_stats, "default"
+                logger.debug("Using default engine for session.")
+
+            async with factory() as session:
+                try:
+                    # Acquire the connection up front to measure the pool wait
+                    started = time.perf_counter()
+                    await session.connection()
+                    waited = time.perf_counter() - started
+                    pool_stats.record_wait(waited)
+                    record("db_acquire", waited)
+                    return await method(*args, session=session, **kwargs)
+                except Exception as e:
+                    if session.in_transaction():
+                        await session.rollback()
+                    logger.error(f"Error in {kind} session: {e}")
+                    raise
 
         return wrapper
 
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, Boolean, String, DateTime, ForeignKey, func
+
+from app.db.models.event import BaseORM
+
+
+class ApiKey(BaseORM):
+    __tablename__ = "api_keys"
+
+    id = Column(Integer, primary_key=True)
+    # Public part of the key (ek_<key_id>_<secret>), used to find the key without scanning
+    key_id = Column(String(16), unique=True, index=True, nullable=False)
+    # sha256 of the whole key; the key itself is shown once on creation and never stored
+    key_hash = Column(String(64), nullable=False)
+    name = Column(String, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    scopes = Column(String, nullable=False)  # comma separated: ingest, read
+    quota_per_minute = Column(Integer, nullable=False)
+    revoked = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -18,4 +18,6 @@ class Event(BaseORM):
 
     __table_args__ = (
         Index("idx_user_time_type", "user_id", "occurred_at", "event_type"),
+        # Range scans of events after the DuckDB snapshot watermark (fresh analytics)
+        Index("idx_events_occurred_at", "occurred_at"),
     )
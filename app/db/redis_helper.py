@@ -0,0 +1,57 @@
+import time
+
+import redis.asyncio as redis
+from loguru import logger
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+
+
+class RedisHelper:
+    RETRY_AFTER: int = settings.redis.retry_after
+
+    def __init__(self):
+        # Text client (rate limiter, counters) and binary client (Arrow IPC payloads)
+        self.client: redis.Redis = redis.from_url(
+            settings.redis.url,
+            encoding="utf-8",
+            decode_responses=True,
+        )
+        self.binary_client: redis.Redis = redis.from_url(settings.redis.url)
+
+        # Monotonic timestamp until which optional Redis features are skipped
+        self._unavailable_until: float = 0.0
+        logger.info("RedisHelper initialized.")
+
+    @property
+    def available(self) -> bool:
+        """False for a short period after a failed call, so callers can fall back to local state."""
+        return time.monotonic() >= self._unavailable_until
+
+    def mark_unavailable(self, error: Exception):
+        if self.available:
+            logger.warning(f"Redis unavailable, using local fallback for {self.RETRY_AFTER}s: {error}")
+        self._unavailable_until = time.monotonic() + self.RETRY_AFTER
+
+    async def call(self, method, *args, **kwargs):
+        """
+        Calls an optional Redis feature: None while Redis is unavailable or on error
+        (marking it unavailable), False for a SET NX whose key already exists.
+        """
+        if not self.available:
+            return None
+        try:
+            result = await method(*args, **kwargs)
+        except (RedisError, OSError) as e:
+            self.mark_unavailable(e)
+            return None
+        return False if result is None and kwargs.get("nx") else result
+
+    async def dispose(self):
+        await self.client.aclose()
+        await self.binary_client.aclose()
+        logger.info("Closed Redis clients.")
+
+
+# Global helper
+redis_helper = RedisHelper()
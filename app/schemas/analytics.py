@@ -0,0 +1,65 @@
+from datetime import date
+from typing import Annotated, Literal, Union
+
+from pydantic import BaseModel, Field
+
+from app.services.retention_engine import RetentionMode
+
+
+class MetricSpecBase(BaseModel):
+    """Common fields of a metric in POST /stats/batch."""
+    segment: list[str] = Field(default_factory=list, description="Segment filters, as in the GET endpoints.")
+
+
+class RangeMetricSpec(MetricSpecBase):
+    from_date: date = Field(..., description="Start date (YYYY-MM-DD).")
+    to_date: date = Field(..., description="End date (YYYY-MM-DD).")
+
+
+class DauSpec(RangeMetricSpec):
+    metric: Literal["dau"]
+    approx: bool = Field(False, description="Estimate from per-day HyperLogLog sketches.")
+
+
+class ActiveUsersSpec(RangeMetricSpec):
+    metric: Literal["wau", "mau"]
+
+
+class TopEventsSpec(RangeMetricSpec):
+    metric: Literal["top_events"]
+    limit: int = Field(10, gt=0, description="Limit for the number of events in the top list.")
+    live: bool = Field(
+        True,
+        description="Add events ingested since the last sync (streaming counters), as GET /stats/top-events does. "
+                    "Background jobs use the snapshot only.",
+    )
+
+
+class RetentionSpec(MetricSpecBase):
+    metric: Literal["retention"]
+    start_date: date = Field(..., description="Start date for cohort calculation (YYYY-MM-DD).")
+    windows: int = Field(4, ge=2, description="Number of windows for analysis (including window 0).")
+    mode: RetentionMode = "weekly"
+
+
+class FunnelSpec(RangeMetricSpec):
+    metric: Literal["funnel"]
+    steps: list[str] = Field(..., min_length=2, max_length=10, description="Ordered event types.")
+    window_hours: int = Field(24, gt=0, le=24 * 90)
+
+
+class SessionsSpec(BaseModel):
+    metric: Literal["sessions"]
+    from_date: date = Field(..., description="Start date (YYYY-MM-DD).")
+    to_date: date = Field(..., description="End date (YYYY-MM-DD).")
+
+
+MetricSpec = Annotated[
+    Union[DauSpec, ActiveUsersSpec, TopEventsSpec, RetentionSpec, FunnelSpec, SessionsSpec],
+    Field(discriminator="metric"),
+]
+
+
+class BatchRequest(BaseModel):
+    """Several analytics metrics computed together and returned in one response."""
+    metrics: list[MetricSpec] = Field(..., min_length=1, max_length=20)
@@ -1,4 +1,7 @@
-from pydantic import EmailStr, BaseModel
+from datetime import datetime
+from typing import Literal
+
+from pydantic import EmailStr, BaseModel, Field, field_validator
 
 
 class Token(BaseModel):
@@ -33,3 +36,37 @@ class User(UserBase):
 
     class Config:
         from_attributes = True
+
+
+class UserStatusUpdate(BaseModel):
+    """Schema for enabling or disabling a user (administrators only)."""
+    disabled: bool
+
+
+class ApiKeyCreate(BaseModel):
+    """Schema for creating an API key for a machine client."""
+    name: str = Field(min_length=1, max_length=100)
+    scopes: list[Literal["ingest", "read"]] = Field(min_length=1)
+
+
+class ApiKey(BaseModel):
+    """API key metadata (the key itself is only returned on creation)."""
+    key_id: str
+    name: str
+    scopes: list[str]
+    quota_per_minute: int
+    revoked: bool
+    created_at: datetime
+
+    @field_validator("scopes", mode="before")
+    @classmethod
+    def split_scopes(cls, value):
+        return value.split(",") if isinstance(value, str) else value
+
+    class Config:
+        from_attributes = True
+
+
+class ApiKeyCreated(ApiKey):
+    """Response to creating an API key: the only time the plain key is shown."""
+    api_key: str
@@ -0,0 +1,81 @@
+from collections import defaultdict
+from typing import Callable, NamedTuple, Optional
+
+import duckdb
+
+from app.schemas.analytics import MetricSpec
+from app.services.analytics_service import AnalyticsService, read_connection
+from app.services.query_result import QueryResult
+from app.services.segments import Segment
+
+
+class BatchQuery(NamedTuple):
+    """
+    One metric of a batch: cache metric name, service function and its keyword arguments.
+    `live`: top events to merge with the streaming counters after the snapshot result.
+    """
+    metric: str
+    func: Callable[..., QueryResult]
+    params: dict
+    extra: dict
+    live: bool = False
+
+
+def plan_query(spec: MetricSpec) -> BatchQuery:
+    """
+    Maps a batch metric spec to the same (metric, params) the GET endpoints use,
+    so batch and single requests share result cache entries. Raises ValueError on a bad segment.
+    """
+    fields = spec.model_dump(exclude={"metric", "approx", "segment", "live"})
+    if spec.metric == "sessions":
+        return BatchQuery("sessions", AnalyticsService.get_sessions, fields, {})
+
+    segment = Segment.parse(spec.segment)
+    params = {**fields, "segment": segment}
+    error_bound = {"error_bound": AnalyticsService.hll_error_bound()} if segment.sketchable else {}
+
+    if spec.metric == "dau" and spec.approx:
+        return BatchQuery("dau_approx", AnalyticsService.get_dau_approx, params, error_bound)
+    if spec.metric in ("wau", "mau"):
+        func = AnalyticsService.get_wau if spec.metric == "wau" else AnalyticsService.get_mau
+        return BatchQuery(spec.metric, func, params, error_bound)
+
+    funcs = {
+        "dau": AnalyticsService.get_dau,
+        "top_events": AnalyticsService.get_top_events,
+        "retention": AnalyticsService.get_retention,
+        "funnel": AnalyticsService.get_funnel,
+    }
+    # Streaming counters only know event_type, so property segments stay snapshot-only
+    live = spec.metric == "top_events" and spec.live and segment.sketchable
+    return BatchQuery(spec.metric, funcs[spec.metric], params, {}, live)
+
+
+def run_batch(queries: list[BatchQuery], conn: Optional[duckdb.DuckDBPyConnection] = None) -> list[QueryResult]:
+    """
+    Executes uncached batch queries on one DuckDB connection (one thread hop for the whole batch).
+    DAU and top events over the same range and segment are answered from a single rollup scan.
+    """
+    results: list[QueryResult | None] = [None] * len(queries)
+    with read_connection(conn) as conn:
+        shared_scans: dict[tuple, list[int]] = defaultdict(list)
+        for i, query in enumerate(queries):
+            if query.metric in ("dau", "top_events"):
+                key = (query.params["from_date"], query.params["to_date"], query.params["segment"])
+                shared_scans[key].append(i)
+
+        for (from_date, to_date, segment), indexes in shared_scans.items():
+            if {queries[i].metric for i in indexes} != {"dau", "top_events"}:
+                continue
+            limits = [queries[i].params["limit"] for i in indexes if queries[i].metric == "top_events"]
+            dau, top = AnalyticsService.get_dau_and_top_events(from_date, to_date, max(limits), segment, conn)
+            for i in indexes:
+                if queries[i].metric == "dau":
+                    results[i] = dau
+                else:
+                    results[i] = QueryResult(top.columns, top.rows[:queries[i].params["limit"]])
+
+        for i, query in enumerate(queries):
+            if results[i] is None:
+                results[i] = query.func(**query.params, conn=conn)
+    return results
@@ -0,0 +1,219 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import duckdb
+from loguru import logger
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.metrics import ANALYTICS_QUERY_DURATION
+from app.core.tracing import record, span
+from app.services.analytics_service import read_connection
+
+# Queries whose cost grows with history (SQL retention, funnels, batches, fresh tails)
+HEAVY_METRICS = {"retention", "funnel", "batch"}
+
+
+class QueryTimeout(Exception):
+    """The query ran longer than its lane allows and was interrupted."""
+
+
+class QueueTimeout(Exception):
+    """The query waited for a free worker longer than its lane allows and was dropped unstarted."""
+
+
+class ClientDisconnected(asyncio.CancelledError):
+    """
+    The HTTP client went away and the query was interrupted. A CancelledError subclass,
+    so the result cache lets requests waiting on the same key compute for themselves.
+    """
+
+
+class _QueryState:
+    __slots__ = ("conn", "aborted", "started_at")
+
+    def __init__(self):
+        self.conn: Optional[duckdb.DuckDBPyConnection] = None
+        self.aborted = False
+        self.started_at: Optional[float] = None
+
+
+class AnalyticsLane:
+    """Thread pool of bounded size plus queue/run metrics for one class of queries."""
+
+    DISCONNECT_POLL_INTERVAL = 0.5
+
+    def __init__(self, name: str, workers: int, timeout: float, queue_timeout: float):
+        self.name = name
+        self.workers = workers
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"analytics-{name}")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.queue_timeouts = 0
+        self.cancelled = 0
+        self.total_wait_sec = 0.0
+        self.max_wait_sec = 0.0
+
+    def _execute(self, metric: str, func: Callable[..., Any], params: dict, state: _QueryState,
+                 submitted_at: float) -> Any:
+        state.started_at = time.monotonic()
+        waited = state.started_at - submitted_at
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_wait_sec += waited
+            self.max_wait_sec = max(self.max_wait_sec, waited)
+        record("queue", waited)
+        try:
+            with read_connection() as conn:
+                state.conn = conn
+                if state.aborted:
+                    raise duckdb.InterruptException("Query aborted before start")
+                with ANALYTICS_QUERY_DURATION.labels(metric, self.name).time():
+                    with span("duckdb", metric=metric, lane=self.name):
+                        return func(**params, conn=conn)
+        finally:
+            state.conn = None
+            with self._lock:
+                self.running -= 1
+
+    def _dequeue(self, future: Future) -> bool:
+        """Cancels a query that has not started yet; False if a worker already took it."""
+        if not future.cancel():
+            return False
+        # Never started: it still counts as queued
+        with self._lock:
+            self.queued -= 1
+        return True
+
+    def _abort(self, future: Future, state: _QueryState):
+        state.aborted = True
+        if self._dequeue(future):
+            return
+        conn = state.conn
+        if conn is not None:
+            conn.interrupt()
+
+    async def run(self, func: Callable[..., Any], params: dict, request: Optional[Request] = None,
+                  metric: str = "unknown") -> Any:
+        """
+        Runs func(**params, conn=<read-only DuckDB connection>) in this lane's pool.
+        The timeout counts from the moment a worker starts the query; a query still queued after
+        `queue_timeout` is dropped with QueueTimeout. On timeout or client disconnect the query is
+        interrupted instead of left running.
+        """
+        state = _QueryState()
+        with self._lock:
+            self.queued += 1
+        # The request's context goes along, so stages timed in the worker thread land in its Server-Timing
+        context = contextvars.copy_context()
+        submitted_at = time.monotonic()
+        future = self._executor.submit(context.run, self._execute, metric, func, params, state, submitted_at)
+        wrapped = asyncio.wrap_future(future)
+        try:
+            while True:
+                now = time.monotonic()
+                if state.started_at is None:
+                    remaining = submitted_at + self.queue_timeout - now
+                    if remaining <= 0:
+                        if self._dequeue(future):
+                            self.queue_timeouts += 1
+                            raise QueueTimeout(
+                                f"Analytics query waited over {self.queue_timeout}s for a worker ({self.name} lane)"
+                            )
+                        # A worker took it just now; its run time starts here
+                        remaining = self.timeout
+                else:
+                    remaining = state.started_at + self.timeout - now
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise QueryTimeout(f"Analytics query exceeded {self.timeout}s ({self.name} lane)")
+                done, _ = await asyncio.wait({wrapped}, timeout=min(remaining, self.DISCONNECT_POLL_INTERVAL))
+                if done:
+                    break
+                if request is not None and await request.is_disconnected():
+                    raise ClientDisconnected()
+        except (QueryTimeout, asyncio.CancelledError) as e:
+            # Timeout, client gone, or the awaiting task itself was cancelled
+            if not isinstance(e, QueryTimeout):
+                self.cancelled += 1
+            if not wrapped.done():
+                self._abort(future, state)
+                # Retrieve the interrupted result so it is not reported as unhandled
+                wrapped.add_done_callback(lambda f: f.cancelled() or f.exception())
+            raise
+
+        try:
+            result = wrapped.result()
+        except Exception:
+            self.failed += 1
+            raise
+        self.completed += 1
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.completed + self.failed + self.timeouts + self.queue_timeouts + self.cancelled
+            return {
+                "workers": self.workers,
+                "timeout_sec": self.timeout,
+                "queue_timeout_sec": self.queue_timeout,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timeouts": self.timeouts,
+                "queue_timeouts": self.queue_timeouts,
+                "cancelled": self.cancelled,
+                "avg_wait_ms": round(1000 * self.total_wait_sec / finished, 2) if finished else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait_sec, 2),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AnalyticsExecutor:
+    """
+    Dedicated pools for DuckDB queries, separate from the event loop's default executor.
+
+    Cheap queries (rollups, sketches, sessions) and heavy ones (SQL retention, funnels, batches,
+    fresh tails) get separate lanes, so a burst of slow queries never blocks fast ones.
+    Background jobs (POST /stats/jobs) have their own lane with a much longer timeout.
+    """
+
+    def __init__(self):
+        cfg = settings.analytics
+        self.lanes = {
+            "cheap": AnalyticsLane("cheap", cfg.executor_cheap_workers, cfg.query_timeout, cfg.queue_timeout),
+            "heavy": AnalyticsLane("heavy", cfg.executor_heavy_workers, cfg.heavy_query_timeout, cfg.queue_timeout),
+            # Jobs are expected to queue behind each other: they may wait as long as they may run
+            "jobs": AnalyticsLane("jobs", cfg.executor_job_workers, cfg.job_timeout, cfg.job_timeout),
+        }
+
+    async def run(self, metric: str, func: Callable[..., Any], *, request: Optional[Request] = None,
+                  heavy: bool = False, lane: Optional[str] = None, **params) -> Any:
+        """Runs func on `lane` if given, otherwise on the heavy or cheap lane by metric."""
+        lane = lane or ("heavy" if heavy or metric in HEAVY_METRICS else "cheap")
+        return await self.lanes[lane].run(func, params, request, metric)
+
+    def stats(self) -> dict:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    def shutdown(self):
+        for lane in self.lanes.values():
+            lane.shutdown()
+        logger.info("Analytics executor shut down.")
+
+
+analytics_executor = AnalyticsExecutor()
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+from app.db.redis_helper import redis_helper
+from app.schemas.analytics import MetricSpec
+from app.services.analytics_batch import BatchQuery, plan_query
+from app.services.analytics_executor import analytics_executor
+from app.services.query_result import QueryResult
+from app.services.result_cache import result_cache
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class AnalyticsJobs:
+    """
+    Background analytics jobs: POST /stats/jobs returns an id at once, the query runs on the
+    executor's `jobs` lane and GET /stats/jobs/{id} polls for the result.
+
+    The job id is derived from the result cache key (metric, normalized params, snapshot version),
+    so identical submissions get the same id and share one execution, across workers too
+    (the job record is claimed in Redis with SET NX). Job state and the result (Arrow IPC) are kept
+    in Redis for `job_ttl` seconds and mirrored locally, so polling the submitting worker works
+    without Redis. Results also land in the result cache for the regular GET endpoints.
+    """
+
+    KEY_PREFIX = "analytics:job"
+
+    def __init__(self):
+        self._ttl: int = settings.analytics.job_ttl
+        # A job still unfinished after this long lost its worker (restart) and may be resubmitted
+        self._stale_after: float = settings.analytics.job_timeout + 60
+        self._local: dict[str, tuple[float, dict, Optional[QueryResult]]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    @classmethod
+    def _key(cls, job_id: str) -> str:
+        return f"{cls.KEY_PREFIX}:{job_id}"
+
+    async def submit(self, spec: MetricSpec) -> dict:
+        """Returns the job record, starting the job unless an identical one exists. ValueError on bad input."""
+        query = plan_query(spec)
+        cache_key = result_cache.make_key(query.metric, query.params, await result_cache.current_version())
+        job_id = hashlib.sha1(cache_key.encode("utf-8")).hexdigest()[:24]
+
+        existing = await self.get(job_id)
+        if existing is not None and not self._restartable(existing):
+            return existing
+
+        job = {
+            "job_id": job_id,
+            "metric": query.metric,
+            "status": QUEUED,
+            "submitted_at": time.time(),
+            "finished_at": None,
+            "error": None,
+            "extra": query.extra,
+        }
+        claimed = await redis_helper.call(
+            redis_helper.client.set, self._key(job_id), json.dumps(job), nx=existing is None, ex=self._ttl
+        )
+        if claimed is False:
+            # Another worker submitted the same job a moment ago
+            return await self.get(job_id) or job
+
+        self._save_local(job)
+        task = asyncio.create_task(self._run(job, query))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info(f"Submitted analytics job {job_id} ({query.metric}).")
+        return dict(job)
+
+    def _restartable(self, job: dict) -> bool:
+        if job["status"] == FAILED:
+            return True
+        return job["status"] != DONE and time.time() - job["submitted_at"] > self._stale_after
+
+    async def _run(self, job: dict, query: BatchQuery):
+        await self._update(job, status=RUNNING)
+        try:
+            result = await result_cache.get_or_compute(
+                query.metric, query.params,
+                lambda: analytics_executor.run(query.metric, query.func, lane="jobs", **query.params),
+            )
+        except Exception as e:
+            logger.error(f"Analytics job {job['job_id']} failed: {e!r}")
+            await self._update(job, status=FAILED, finished_at=time.time(), error=str(e) or type(e).__name__)
+            return
+
+        payload = result.to_arrow()
+        stored = await redis_helper.call(
+            redis_helper.binary_client.set, f"{self._key(job['job_id'])}:result", payload, ex=self._ttl
+        )
+        # The local copy is only needed when Redis could not take the result
+        await self._update(job, None if stored else result, status=DONE, finished_at=time.time())
+
+    async def _update(self, job: dict, result: Optional[QueryResult] = None, **changes):
+        job.update(changes)
+        self._save_local(job, result)
+        await redis_helper.call(redis_helper.client.set, self._key(job["job_id"]), json.dumps(job), ex=self._ttl)
+
+    def _save_local(self, job: dict, result: Optional[QueryResult] = None):
+        now = time.monotonic()
+        for job_id in [job_id for job_id, (expires, _, _) in self._local.items() if expires <= now]:
+            del self._local[job_id]
+        self._local[job["job_id"]] = (now + self._ttl, dict(job), result)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        """Job record, or None if unknown or expired."""
+        raw = await redis_helper.call(redis_helper.client.get, self._key(job_id))
+        if raw is not None:
+            return json.loads(raw)
+        local = self._local.get(job_id)
+        return dict(local[1]) if local is not None and local[0] > time.monotonic() else None
+
+    async def result(self, job_id: str) -> Optional[QueryResult]:
+        local = self._local.get(job_id)
+        if local is not None and local[2] is not None:
+            return local[2]
+        payload = await redis_helper.call(redis_helper.binary_client.get, f"{self._key(job_id)}:result")
+        return QueryResult.from_arrow(payload) if payload is not None else None
+
+    async def wait(self, job_id: str, timeout: float, poll_interval: float = 0.25) -> Optional[dict]:
+        """Job record once it is finished or `timeout` seconds have passed (long polling)."""
+        deadline = time.monotonic() + timeout
+        job = await self.get(job_id)
+        while job is not None and job["status"] in (QUEUED, RUNNING) and time.monotonic() < deadline:
+            await asyncio.sleep(poll_interval)
+            job = await self.get(job_id)
+        return job
+
+    def stats(self) -> dict[str, Any]:
+        return {"running": len(self._tasks), "local_jobs": len(self._local)}
+
+
+analytics_jobs = AnalyticsJobs()
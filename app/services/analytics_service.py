@@ -1,21 +1,128 @@
 import duckdb
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import pandas as pd
 import asyncio
-from datetime import date
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from contextlib import contextmanager
+from functools import cached_property
+from typing import Callable, Iterator, Literal, Optional
+from zoneinfo import ZoneInfo
 
 from loguru import logger
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.core.metrics import SYNC_DURATION, SYNC_LAST_SUCCESS, SYNC_ROWS, SYNC_WATERMARK, SYNCS
+from app.db.db_helper import db_helper
+from app.services.live_counters import live_counters
+from app.services.query_result import QueryResult
+from app.services.result_cache import result_cache
+from app.services.retention_engine import RetentionEngine, RetentionMode, period_start
+from app.services.segments import PROPERTY_COLUMNS, SEGMENT_PROPERTIES, Segment, property_column
+from app.utils.hyperloglog import HyperLogLog, estimate_counts, hash_user_ids, register_updates
 
-PG_CONN_STRING = str(settings.db.url)
 DUCKDB_FILE = "analytics.duckdb"
+HLL_PRECISION = settings.analytics.hll_precision
+SESSION_GAP_MINUTES = settings.analytics.session_gap_minutes
+ROW_GROUP_SIZE = settings.analytics.row_group_size
+SYNC_CONNECTIONS = settings.db.sync_connections
+Granularity = Literal["hour", "day", "week", "month"]
+# Changes whenever derived tables change shape; a mismatch forces a full rebuild
+ANALYTICS_LAYOUT = "v4:" + ",".join(PROPERTY_COLUMNS)
 
 
-class AnalyticsService:
+class AnalyticsDatabase:
+    """
+    The process's only handle on DUCKDB_FILE: an in-memory DuckDB instance with the file attached
+    (tables get ROW_GROUP_SIZE rows per row group). The sync and the queries use cursors of this one
+    instance, so a query sees the last committed snapshot and the next one sees a new sync at once;
+    two instances on one file would keep serving whatever each had cached.
+
+    The instance is opened on first use and closed when its last cursor is returned, so the file
+    lock is only held while the process is querying or syncing.
+    """
+
     def __init__(self):
-        self.pg_engine: AsyncEngine = create_async_engine(PG_CONN_STRING)
+        self._lock = threading.Lock()
+        self._instance: Optional[duckdb.DuckDBPyConnection] = None
+        self._cursors = 0
+
+    @contextmanager
+    def cursor(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        with self._lock:
+            if self._instance is None:
+                instance = duckdb.connect()
+                try:
+                    instance.execute(f"ATTACH '{DUCKDB_FILE}' AS analytics (ROW_GROUP_SIZE {ROW_GROUP_SIZE})")
+                except Exception:
+                    instance.close()
+                    raise
+                self._instance = instance
+            self._cursors += 1
+            conn = self._instance.cursor()
+        try:
+            conn.execute("USE analytics")
+            yield conn
+        finally:
+            conn.close()
+            with self._lock:
+                self._cursors -= 1
+                if self._cursors == 0:
+                    self._instance.close()
+                    self._instance = None
+
+
+analytics_database = AnalyticsDatabase()
+
+
+@contextmanager
+def read_connection(conn: Optional[duckdb.DuckDBPyConnection] = None) -> Iterator[duckdb.DuckDBPyConnection]:
+    """Uses the caller's connection (batch requests) or a cursor of the shared instance for a single query."""
+    if conn is not None:
+        yield conn
+        return
+    with analytics_database.cursor() as read_conn:
+        yield read_conn
+
+
+@contextmanager
+def write_connection() -> Iterator[duckdb.DuckDBPyConnection]:
+    """Connection for the sync: a cursor of the same instance the queries read from."""
+    with analytics_database.cursor() as write_conn:
+        yield write_conn
 
+
+class EventTail:
+    """
+    Postgres events newer than the DuckDB snapshot watermark, aggregated by Postgres to the grain
+    of daily_user_segments: one row per (day, event_type, segment properties, user_id) with the
+    event count and first/last event time. `rows` is None when there are none.
+    """
+
+    COLUMNS = ["day", "event_type", *PROPERTY_COLUMNS, "user_id", "events", "first_ts", "last_ts"]
+
+    def __init__(self, watermark: Optional[datetime], rows: Optional[list] = None):
+        self.watermark = watermark
+        self.rows = rows or None
+
+    @cached_property
+    def frame(self) -> pd.DataFrame:
+        """Built on first use, i.e. by the query in the executor thread, not on the event loop."""
+        return pd.DataFrame(self.rows, columns=self.COLUMNS)
+
+    @property
+    def effective_watermark(self) -> Optional[datetime]:
+        """Latest event time the merged result covers."""
+        if self.rows is None:
+            return self.watermark
+        return max(self.watermark, max(row[-1] for row in self.rows))
+
+
+class AnalyticsService:
     @staticmethod
     async def sync_data_from_postgres():
         """
@@ -23,114 +130,903 @@ class AnalyticsService:
         Uses a separate connection for writing.
         """
 
-        clean_pg_url = PG_CONN_STRING.replace("+asyncpg", "")
+        pg_dsn = db_helper.duckdb_dsn()
 
         def execute_sync_query():
-            with duckdb.connect(database=DUCKDB_FILE, read_only=False) as write_conn:
-                sql_query = f"""
-                    INSTALL postgres;
-                    LOAD postgres;
-
-                    -- Use postgres_scan to read from PostgreSQL.
-                    -- CREATE OR REPLACE TABLE creates the table if it doesn’t exist
-                    -- and fully replaces its contents, eliminating the need for
-                    -- separate CREATE TABLE IF NOT EXISTS logic.
-                    CREATE OR REPLACE TABLE synced_events AS
-                    SELECT 
-                        event_id AS event_id, 
-                        occurred_at AS occurred_at, 
-                        CAST(user_id AS INTEGER) AS user_id, 
-                        event_type AS event_type
-                    FROM postgres_scan('{clean_pg_url}', 'public', 'events');
-                """
-                write_conn.execute(sql_query)
-                count = write_conn.execute('SELECT COUNT(*) FROM synced_events').fetchone()[0]
-                return count
+            with write_connection() as write_conn:
+                write_conn.execute("INSTALL postgres; LOAD postgres;")
+                # One transaction: readers never see a snapshot without its derived tables
+                write_conn.execute("BEGIN TRANSACTION")
+                # Use postgres_scan to read from PostgreSQL; it opens about one connection per
+                # DuckDB thread, so the scan runs with sync_connections threads
+                AnalyticsService._replace_synced_events(
+                    write_conn, f"postgres_scan('{pg_dsn}', 'public', 'events')", source_threads=SYNC_CONNECTIONS
+                )
+                since = AnalyticsService._incremental_watermark(write_conn)
+                AnalyticsService._update_user_cohorts(write_conn, since)
+                RetentionEngine.build_bitmaps(write_conn, since)
+                AnalyticsService._build_segment_rollups(write_conn, since)
+                AnalyticsService._build_sessions(write_conn, since)
+                AnalyticsService._build_daily_sketches(write_conn, since)
+                AnalyticsService._build_hourly_sketches(write_conn, since)
+                count = AnalyticsService._save_sync_state(write_conn)
+                watermark = write_conn.execute("SELECT watermark FROM sync_state").fetchone()[0]
+                write_conn.execute("COMMIT")
+                return count, watermark
 
         try:
-            record_count = await asyncio.to_thread(execute_sync_query)
+            started_at = time.time()
+            record_count, watermark = await asyncio.to_thread(execute_sync_query)
+            finished_at = time.time()
+            SYNCS.labels("success").inc()
+            SYNC_DURATION.observe(finished_at - started_at)
+            SYNC_ROWS.set(record_count)
+            SYNC_LAST_SUCCESS.set(finished_at)
+            if watermark is not None:
+                SYNC_WATERMARK.set(watermark.timestamp())
             logger.success(f"✅ Synchronization completed. Record count: {record_count}")
+            await result_cache.publish_version()
+            await live_counters.advance(started_at)
         except duckdb.IOException as e:
             if "Conflicting lock is held" in str(e):
+                SYNCS.labels("skipped").inc()
                 logger.warning("⚠️ Synchronization skipped: DuckDB file is locked by another process (Uvicorn worker).")
             else:
+                SYNCS.labels("failed").inc()
                 logger.error(f"!!! Synchronization error: {e}")
         except Exception as e:
+            SYNCS.labels("failed").inc()
             logger.error(f"!!! Synchronization error: {e}")
 
     @staticmethod
-    def get_dau(from_date: date, to_date: date) -> pd.DataFrame:
-        """GET /stats/dau: Number of unique user_id per day."""
-        query = f"""
+    def _replace_synced_events(write_conn: duckdb.DuckDBPyConnection, source: str, source_threads: Optional[int] = None):
+        """
+        Replaces synced_events with the analytics copy of `source` (a relation with the columns
+        of the Postgres events table). Only the columns queries use are kept; event_type is
+        dictionary-encoded as an ENUM built from this snapshot's values, and rows are ordered by
+        (occurred_at, user_id) so every row group covers a narrow time range: zone maps let
+        date-range scans and the incremental tail (occurred_at > watermark) skip the rest.
+        `source_threads` caps DuckDB's threads while the source is read (postgres_scan holds one
+        Postgres connection per thread).
+        """
+        property_columns = "".join(
+            f"\n                properties_json->>'{key}' AS {property_column(key)}," for key in SEGMENT_PROPERTIES
+        )
+        if source_threads:
+            write_conn.execute(f"SET threads = {source_threads}")
+        write_conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE source_events AS
+            SELECT
+                occurred_at,
+                CAST(user_id AS INTEGER) AS user_id, {property_columns}
+                properties_json->>'session_id' AS session_id,
+                event_type
+            FROM {source};
+        """)
+        if source_threads:
+            write_conn.execute("RESET threads")
+        # ENUM values are stored in the column type, so replacing the type never touches older tables
+        write_conn.execute("""
+            CREATE OR REPLACE TYPE event_type_enum AS ENUM (
+                SELECT DISTINCT event_type FROM source_events WHERE event_type IS NOT NULL ORDER BY 1
+            );
+            CREATE OR REPLACE TABLE synced_events AS
+            SELECT * REPLACE (CAST(event_type AS event_type_enum) AS event_type)
+            FROM source_events
+            ORDER BY occurred_at, user_id;
+            DROP TABLE source_events;
+        """)
+
+    @staticmethod
+    def _incremental_watermark(write_conn: duckdb.DuckDBPyConnection) -> Optional[datetime]:
+        """
+        Returns the previous sync watermark if the new snapshot only appended events after it,
+        so derived tables can be updated from the tail alone. Returns None when a full rebuild
+        is needed (first sync, or late/backfilled events landed at or before the watermark).
+        """
+        write_conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                watermark TIMESTAMPTZ,
+                row_count BIGINT,
+                synced_at TIMESTAMPTZ
+            );
+            ALTER TABLE sync_state ADD COLUMN IF NOT EXISTS layout VARCHAR;
+        """)
+        state = write_conn.execute("SELECT watermark, row_count, layout FROM sync_state").fetchone()
+        if state is None or state[0] is None:
+            return None
+
+        watermark, row_count, layout = state
+        if layout != ANALYTICS_LAYOUT:
+            logger.info(f"Analytics layout changed ({layout} -> {ANALYTICS_LAYOUT}), full rebuild.")
+            return None
+        covered = write_conn.execute(
+            "SELECT COUNT(*) FROM synced_events WHERE occurred_at <= ?", [watermark]
+        ).fetchone()[0]
+        if covered != row_count:
+            logger.info(f"Late events before watermark {watermark} ({covered} vs {row_count} rows), full rebuild.")
+            return None
+        return watermark
+
+    @staticmethod
+    def _save_sync_state(write_conn: duckdb.DuckDBPyConnection) -> int:
+        write_conn.execute("""
+            DELETE FROM sync_state;
+            INSERT INTO sync_state (watermark, row_count, synced_at, layout)
+            SELECT MAX(occurred_at), COUNT(*), now(), $layout FROM synced_events;
+        """, {"layout": ANALYTICS_LAYOUT})
+        return write_conn.execute("SELECT row_count FROM sync_state").fetchone()[0]
+
+    @staticmethod
+    def _update_user_cohorts(write_conn: duckdb.DuckDBPyConnection, since: Optional[datetime]):
+        """
+        Maintains the compact tables behind retention:
+        user_first_seen (one row per user) and user_activity_weeks (one row per user and active week).
+        With a watermark only events after it are applied: they cannot be earlier than any
+        stored first_ts, so existing cohorts never change and new users are simply inserted.
+        """
+        if since is None:
+            write_conn.execute("""
+                CREATE OR REPLACE TABLE user_first_seen (
+                    user_id INTEGER PRIMARY KEY,
+                    first_ts TIMESTAMPTZ NOT NULL,
+                    cohort_day DATE NOT NULL,
+                    cohort_week DATE NOT NULL
+                );
+                CREATE OR REPLACE TABLE user_activity_weeks (
+                    user_id INTEGER NOT NULL,
+                    activity_week DATE NOT NULL
+                );
+            """)
+
+        write_conn.execute("""
+            INSERT INTO user_first_seen
+            SELECT
+                user_id,
+                MIN(occurred_at) AS first_ts,
+                CAST(date_trunc('day', MIN(occurred_at)) AS DATE) AS cohort_day,
+                CAST(date_trunc('week', MIN(occurred_at)) AS DATE) AS cohort_week
+            FROM synced_events
+            WHERE $since IS NULL OR occurred_at > $since
+            GROUP BY user_id
+            ON CONFLICT (user_id) DO NOTHING;
+        """, {"since": since})
+        write_conn.execute("""
+            INSERT INTO user_activity_weeks
+            SELECT DISTINCT se.user_id, CAST(date_trunc('week', se.occurred_at) AS DATE) AS activity_week
+            FROM synced_events se
+            WHERE ($since IS NULL OR se.occurred_at > $since)
+              AND NOT EXISTS (
+                  SELECT 1 FROM user_activity_weeks uaw
+                  WHERE uaw.user_id = se.user_id
+                    AND uaw.activity_week = CAST(date_trunc('week', se.occurred_at) AS DATE)
+              );
+        """, {"since": since})
+        mode = "full rebuild" if since is None else f"events after {since}"
+        logger.info(f"Updated user_first_seen / user_activity_weeks ({mode}).")
+
+    @staticmethod
+    def _build_segment_rollups(write_conn: duckdb.DuckDBPyConnection, since: Optional[datetime]):
+        """
+        Maintains rollups keyed by the common segment columns (event_type + extracted properties):
+        daily_user_segments - distinct users per day and segment (DAU, segmented retention),
+        daily_event_counts - event counts per day and segment (top events).
+        Days from the watermark on are recomputed; earlier days are unchanged by construction.
+        """
+        segment_columns = ", ".join(["event_type", *PROPERTY_COLUMNS])
+        if since is None:
+            write_conn.execute("""
+                DROP TABLE IF EXISTS daily_user_segments;
+                DROP TABLE IF EXISTS daily_event_counts;
+            """)
+            boundary = None
+        else:
+            boundary = since.date() - timedelta(days=1)
+            write_conn.execute("DELETE FROM daily_user_segments WHERE day >= ?", [boundary])
+            write_conn.execute("DELETE FROM daily_event_counts WHERE day >= ?", [boundary])
+
+        # Plain VARCHAR: the event_type ENUM is rebuilt every sync and may gain values
+        source = f"""
             SELECT
-                CAST(date_trunc('day', occurred_at) AS DATE) AS date,
-                COUNT(DISTINCT user_id) AS dau
+                CAST(date_trunc('day', occurred_at) AS DATE) AS day,
+                CAST(event_type AS VARCHAR) AS event_type,
+                {", ".join(PROPERTY_COLUMNS + ["user_id"])},
+                COUNT(*) AS events
             FROM synced_events
-            WHERE occurred_at >= CAST('{from_date}' AS DATE) 
-              AND occurred_at < CAST('{to_date}' AS DATE) + INTERVAL '1 day'
+            WHERE $since IS NULL OR occurred_at >= $since
+            GROUP BY ALL
+            ORDER BY day, {segment_columns}
+        """
+        if since is None:
+            write_conn.execute(f"CREATE TABLE daily_user_segments AS {source}", {"since": boundary})
+            write_conn.execute(f"""
+                CREATE TABLE daily_event_counts AS
+                SELECT day, {segment_columns}, SUM(events) AS events
+                FROM daily_user_segments
+                GROUP BY ALL
+                ORDER BY day, {segment_columns};
+            """)
+        else:
+            write_conn.execute(f"INSERT INTO daily_user_segments {source}", {"since": boundary})
+            write_conn.execute(f"""
+                INSERT INTO daily_event_counts
+                SELECT day, {segment_columns}, SUM(events) AS events
+                FROM daily_user_segments
+                WHERE day >= ?
+                GROUP BY ALL
+                ORDER BY day, {segment_columns};
+            """, [boundary])
+        logger.info("Updated daily segment rollups.")
+
+    @staticmethod
+    def _build_sessions(write_conn: duckdb.DuckDBPyConnection, since: Optional[datetime]):
+        """
+        Maintains `sessions` (one row per user session) for /stats/sessions.
+        Events with properties_json.session_id are grouped by it; events without one are split
+        into sessions by SESSION_GAP of inactivity (key "gap:<start epoch ms>").
+
+        With a watermark only sessions that new events can touch are rebuilt: explicit sessions
+        whose id reappears after the watermark and gap sessions ending within SESSION_GAP of it.
+        Older gap sessions are separated from any new event by more than the gap, so they are final.
+        """
+        params = {"gap": SESSION_GAP_MINUTES}
+        if since is None:
+            write_conn.execute("""
+                CREATE OR REPLACE TABLE sessions (
+                    user_id INTEGER NOT NULL,
+                    session_key VARCHAR NOT NULL,
+                    day DATE NOT NULL,
+                    started_at TIMESTAMPTZ NOT NULL,
+                    ended_at TIMESTAMPTZ NOT NULL,
+                    events BIGINT NOT NULL
+                );
+            """)
+            source = "synced_events"
+        else:
+            params["since"] = since
+            write_conn.execute("""
+                CREATE OR REPLACE TEMP TABLE affected_sessions AS
+                SELECT s.user_id, s.session_key, s.started_at, s.ended_at
+                FROM sessions s
+                WHERE s.ended_at >= $since - to_minutes(CAST($gap AS BIGINT))
+                   OR EXISTS (
+                       SELECT 1 FROM synced_events se
+                       WHERE se.occurred_at > $since
+                         AND se.user_id = s.user_id
+                         AND se.session_id = s.session_key
+                   );
+            """, params)
+            write_conn.execute("""
+                DELETE FROM sessions s
+                WHERE EXISTS (
+                    SELECT 1 FROM affected_sessions a
+                    WHERE a.user_id = s.user_id AND a.session_key = s.session_key
+                );
+            """)
+            # New events plus every event of the sessions being rebuilt
+            source = """(
+                SELECT se.* FROM synced_events se
+                WHERE se.occurred_at > $since
+                   OR EXISTS (
+                       SELECT 1 FROM affected_sessions a
+                       WHERE a.user_id = se.user_id
+                         AND CASE
+                             WHEN se.session_id IS NOT NULL THEN se.session_id = a.session_key
+                             ELSE a.session_key LIKE 'gap:%' AND se.occurred_at BETWEEN a.started_at AND a.ended_at
+                         END
+                   )
+            )"""
+
+        write_conn.execute(f"""
+            INSERT INTO sessions
+            WITH Source AS (
+                SELECT user_id, occurred_at, session_id FROM {source}
+            ),
+            GapEvents AS (
+                SELECT
+                    user_id,
+                    occurred_at,
+                    CASE
+                        WHEN occurred_at - lag(occurred_at) OVER w <= to_minutes(CAST($gap AS BIGINT)) THEN 0
+                        ELSE 1
+                    END AS is_start
+                FROM Source
+                WHERE session_id IS NULL
+                WINDOW w AS (PARTITION BY user_id ORDER BY occurred_at)
+            ),
+            GapNumbered AS (
+                SELECT
+                    user_id,
+                    occurred_at,
+                    SUM(is_start) OVER (PARTITION BY user_id ORDER BY occurred_at ROWS UNBOUNDED PRECEDING) AS number
+                FROM GapEvents
+            ),
+            AllSessions AS (
+                SELECT user_id, 'gap:' || epoch_ms(MIN(occurred_at)) AS session_key,
+                       MIN(occurred_at) AS started_at, MAX(occurred_at) AS ended_at, COUNT(*) AS events
+                FROM GapNumbered
+                GROUP BY user_id, number
+                UNION ALL
+                SELECT user_id, session_id, MIN(occurred_at), MAX(occurred_at), COUNT(*)
+                FROM Source
+                WHERE session_id IS NOT NULL
+                GROUP BY user_id, session_id
+            )
+            SELECT user_id, session_key, CAST(date_trunc('day', started_at) AS DATE), started_at, ended_at, events
+            FROM AllSessions
+            ORDER BY 3;
+        """, params)
+        if since is not None:
+            write_conn.execute("DROP TABLE affected_sessions")
+        mode = "full rebuild" if since is None else f"events after {since}"
+        logger.info(f"Updated sessions ({mode}).")
+
+    @staticmethod
+    def _sketch_rows(rows: dict[str, np.ndarray], key: str) -> pd.DataFrame:
+        """
+        Builds HyperLogLog sketches from distinct (key, event_type, user_id) rows ordered by key:
+        one sketch per (key, event_type) plus an all-events sketch with event_type None.
+
+        Register maxima are reduced over the sorted (sketch, register) cells that occur, so the work
+        follows the rows rather than keys × event types × 2^precision; a dense register array is
+        only materialized for each stored sketch.
+        """
+        keys = rows[key]
+        sketch_keys, sketch_types, sketch_blobs = [], [], []
+        if len(keys):
+            event_types, type_index = np.unique(rows["event_type"].astype(str), return_inverse=True)
+            register_index, rank = register_updates(hash_user_ids(rows["user_id"]), HLL_PRECISION)
+            new_key = np.r_[True, keys[1:] != keys[:-1]]
+            key_starts = np.flatnonzero(new_key)
+            key_index = np.cumsum(new_key) - 1
+
+            # Sketch slots per key: 0 for all events, 1 + type index for each event type
+            slots = len(event_types) + 1
+            sketch_id = np.concatenate([key_index * slots, key_index * slots + 1 + type_index]).astype(np.int64)
+            cells = (sketch_id << HLL_PRECISION) | np.concatenate([register_index, register_index])
+            order = np.argsort(cells, kind="stable")
+            cells, ranks = cells[order], np.concatenate([rank, rank])[order]
+            cell_starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+            cell_ranks = np.maximum.reduceat(ranks, cell_starts)
+            cells = cells[cell_starts]
+
+            cell_sketch = cells >> HLL_PRECISION
+            cell_register = cells & ((1 << HLL_PRECISION) - 1)
+            sketch_starts = np.flatnonzero(np.r_[True, cell_sketch[1:] != cell_sketch[:-1]])
+            sketch_ends = np.r_[sketch_starts[1:], len(cells)]
+            # One register buffer, serialized right away for each sketch
+            registers = np.zeros(1 << HLL_PRECISION, dtype=np.uint8)
+            for start, end in zip(sketch_starts, sketch_ends):
+                key_idx, slot = divmod(int(cell_sketch[start]), slots)
+                registers[cell_register[start:end]] = cell_ranks[start:end]
+
+                sketch_keys.append(keys[key_starts[key_idx]])
+                sketch_types.append(None if slot == 0 else str(event_types[slot - 1]))
+                sketch_blobs.append(HyperLogLog(HLL_PRECISION, registers).to_bytes())
+                registers[cell_register[start:end]] = 0
+
+        return pd.DataFrame({key: sketch_keys, "event_type": sketch_types, "registers": sketch_blobs})
+
+    @staticmethod
+    def _build_daily_sketches(write_conn: duckdb.DuckDBPyConnection, since: Optional[datetime]):
+        """
+        Maintains per-day HyperLogLog sketches of active users: one sketch per
+        (day, event_type) plus an all-events sketch stored with event_type NULL.
+        With a watermark only days from the one containing it are rebuilt.
+        """
+        if since is None:
+            write_conn.execute(
+                "CREATE OR REPLACE TABLE daily_user_sketches (day DATE, event_type VARCHAR, registers BLOB)"
+            )
+        else:
+            write_conn.execute("""
+                DELETE FROM daily_user_sketches
+                WHERE day >= CAST(date_trunc('day', CAST($since AS TIMESTAMPTZ)) AS DATE)
+            """, {"since": since})
+
+        rows = write_conn.execute("""
+            SELECT DISTINCT
+                CAST(date_trunc('day', occurred_at) AS DATE) AS day,
+                event_type,
+                user_id
+            FROM synced_events
+            WHERE $since IS NULL OR occurred_at >= date_trunc('day', CAST($since AS TIMESTAMPTZ))
+            ORDER BY day
+        """, {"since": since}).fetchnumpy()
+
+        sketch_rows = AnalyticsService._sketch_rows(rows, "day")
+        write_conn.register("sketch_rows", sketch_rows)
+        write_conn.execute("INSERT INTO daily_user_sketches SELECT day, event_type, registers FROM sketch_rows")
+        write_conn.unregister("sketch_rows")
+        mode = "full rebuild" if since is None else f"days from {since}"
+        logger.info(f"Built {len(sketch_rows)} daily HyperLogLog sketches ({mode}).")
+
+    @staticmethod
+    def _build_hourly_sketches(write_conn: duckdb.DuckDBPyConnection, since: Optional[datetime]):
+        """
+        Maintains `hourly_user_sketches`: HyperLogLog sketches per UTC hour (and event_type) behind
+        /stats/active-users. Any time zone's hours, days, weeks and months are unions of UTC hours,
+        so bucketing in a zone never rescans events. With a watermark only hours from the one
+        containing it are rebuilt.
+        """
+        if since is None:
+            write_conn.execute(
+                "CREATE OR REPLACE TABLE hourly_user_sketches (hour TIMESTAMP, event_type VARCHAR, registers BLOB)"
+            )
+            boundary = None
+        else:
+            boundary = since.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+            write_conn.execute("DELETE FROM hourly_user_sketches WHERE hour >= ?", [boundary.replace(tzinfo=None)])
+
+        # hour is naive UTC, independent of the session time zone
+        rows = write_conn.execute("""
+            SELECT DISTINCT
+                date_trunc('hour', timezone('UTC', occurred_at)) AS hour,
+                CAST(event_type AS VARCHAR) AS event_type,
+                user_id
+            FROM synced_events
+            WHERE $since IS NULL OR occurred_at >= $since
+            ORDER BY hour
+        """, {"since": boundary}).fetchnumpy()
+
+        sketch_rows = AnalyticsService._sketch_rows(rows, "hour")
+        write_conn.register("sketch_rows", sketch_rows)
+        write_conn.execute("INSERT INTO hourly_user_sketches SELECT hour, event_type, registers FROM sketch_rows")
+        write_conn.unregister("sketch_rows")
+        logger.info(f"Built {len(sketch_rows)} hourly HyperLogLog sketches.")
+
+    @staticmethod
+    def _load_daily_sketches(from_date: date, to_date: date, segment: Segment,
+                             conn: Optional[duckdb.DuckDBPyConnection] = None) -> list[tuple[date, HyperLogLog]]:
+        """Daily sketches for the segment; several event types are merged into one sketch per day."""
+        if segment.event_types is None:
+            type_filter, params = "event_type IS NULL", []
+        else:
+            type_filter, params = segment.where()
+        query = f"""
+            SELECT day, registers
+            FROM daily_user_sketches
+            WHERE day BETWEEN ? AND ?
+              AND {type_filter}
+            ORDER BY day;
+        """
+        with read_connection(conn) as read_conn:
+            rows = read_conn.execute(query, [from_date, to_date, *params]).fetchall()
+        return [(day, HyperLogLog.from_bytes(blob)) for day, blob in rows]
+
+    @staticmethod
+    def _merge_sketches_by_period(
+            from_date: date,
+            to_date: date,
+            segment: Segment,
+            period_key: Callable[[date], date],
+            conn: Optional[duckdb.DuckDBPyConnection] = None,
+    ) -> list[tuple[date, int]]:
+        periods: dict[date, HyperLogLog] = {}
+        for day, sketch in AnalyticsService._load_daily_sketches(from_date, to_date, segment, conn):
+            key = period_key(day)
+            if key in periods:
+                periods[key].merge(sketch)
+            else:
+                periods[key] = sketch
+        return [(key, sketch.count()) for key, sketch in periods.items()]
+
+    @staticmethod
+    def _active_users_by_period(from_date: date, to_date: date, segment: Segment, unit: str,
+                                conn: Optional[duckdb.DuckDBPyConnection] = None) -> list[tuple[date, int]]:
+        """
+        Active users per day/week/month: merged HyperLogLog sketches when the segment only
+        filters event_type, otherwise exact distinct counts from the daily_user_segments rollup.
+        """
+        if segment.sketchable:
+            starts = {
+                "day": lambda day: day,
+                "week": lambda day: period_start(day, "weekly"),
+                "month": lambda day: day.replace(day=1),
+            }
+            return AnalyticsService._merge_sketches_by_period(from_date, to_date, segment, starts[unit], conn)
+
+        where, params = segment.where()
+        query = f"""
+            SELECT
+                CAST(date_trunc('{unit}', day) AS DATE) AS period,
+                COUNT(DISTINCT user_id) AS users
+            FROM daily_user_segments
+            WHERE day BETWEEN ? AND ?
+              AND {where}
             GROUP BY 1
             ORDER BY 1;
         """
-        with duckdb.connect(database=DUCKDB_FILE, read_only=True) as read_conn:
-            return read_conn.execute(query).fetchdf()
+        with read_connection(conn) as read_conn:
+            return read_conn.execute(query, [from_date, to_date, *params]).fetchall()
 
     @staticmethod
-    def get_top_events(from_date: date, to_date: date, limit: int = 10) -> pd.DataFrame:
-        """GET /stats/top-events: Top event_type by count."""
+    def hll_error_bound() -> dict:
+        """Relative error of sketch-based counts at ~95% confidence (two standard errors)."""
+        return {
+            "relative": round(2 * HyperLogLog(HLL_PRECISION).relative_error, 4),
+            "confidence": 0.95,
+        }
+
+    @staticmethod
+    def get_dau_approx(from_date: date, to_date: date, segment: Segment = Segment(),
+                       conn: Optional[duckdb.DuckDBPyConnection] = None) -> QueryResult:
+        """GET /stats/dau?approx=true: DAU estimated from per-day HyperLogLog sketches."""
+        rows = AnalyticsService._active_users_by_period(from_date, to_date, segment, "day", conn)
+        return QueryResult(["date", "dau"], rows)
+
+    @staticmethod
+    def get_wau(from_date: date, to_date: date, segment: Segment = Segment(),
+                conn: Optional[duckdb.DuckDBPyConnection] = None) -> QueryResult:
+        """
+        GET /stats/wau: Weekly active users (ISO weeks, Monday start) from merged daily sketches.
+        The range is widened to whole weeks, so edge weeks are never partial.
+        """
+        from_date = period_start(from_date, "weekly")
+        to_date = period_start(to_date, "weekly") + timedelta(days=6)
+        rows = AnalyticsService._active_users_by_period(from_date, to_date, segment, "week", conn)
+        return QueryResult(["week", "wau"], rows)
+
+    @staticmethod
+    def get_mau(from_date: date, to_date: date, segment: Segment = Segment(),
+                conn: Optional[duckdb.DuckDBPyConnection] = None) -> QueryResult:
+        """
+        GET /stats/mau: Monthly active users (calendar months) from merged daily sketches.
+        The range is widened to whole months, so edge months are never partial.
+        """
+        from_date = from_date.replace(day=1)
+        to_date = (to_date.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        rows = AnalyticsService._active_users_by_period(from_date, to_date, segment, "month", conn)
+        return QueryResult(["month", "mau"], rows)
+
+    @staticmethod
+    def get_active_users(from_date: date, to_date: date, granularity: Granularity = "day",
+                         rolling_days: Optional[int] = None, tz: str = "UTC", segment: Segment = Segment(),
+                         conn: Optional[duckdb.DuckDBPyConnection] = None) -> QueryResult:
+        """
+        GET /stats/active-users: Distinct users per hour/day/week/month of the `tz` calendar or,
+        with rolling_days, per day over the trailing rolling_days days (rolling WAU/MAU).
+
+        Local buckets are unions of hourly sketches, the UTC hour going to the bucket its start
+        falls in (exact for whole-hour offsets, DST included). Rolling windows are a sliding
+        register-wise max over per-day sketches: a year of rolling MAU is one vectorized pass,
+        not 365 distinct counts. Week and month ranges are widened to whole periods.
+        """
+        zone = ZoneInfo(tz)
+        if granularity == "week":
+            from_date = period_start(from_date, "weekly")
+            to_date = period_start(to_date, "weekly") + timedelta(days=6)
+        elif granularity == "month":
+            from_date = from_date.replace(day=1)
+            to_date = (to_date.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        first_day = from_date - timedelta(days=(rolling_days or 1) - 1)
+
+        # Hours whose start can fall inside the local range
+        start = datetime.combine(first_day, datetime.min.time(), zone).astimezone(timezone.utc)
+        end = datetime.combine(to_date + timedelta(days=1), datetime.min.time(), zone).astimezone(timezone.utc)
+        if segment.event_types is None:
+            type_filter, params = "event_type IS NULL", []
+        else:
+            type_filter, params = segment.where()
         query = f"""
+            SELECT hour, registers
+            FROM hourly_user_sketches
+            WHERE hour >= ? AND hour < ?
+              AND {type_filter}
+            ORDER BY hour;
+        """
+        with read_connection(conn) as read_conn:
+            rows = read_conn.execute(
+                query, [start.replace(minute=0, tzinfo=None), end.replace(tzinfo=None), *params]
+            ).fetchall()
+
+        bucket_of = {
+            "hour": lambda local: local,
+            "day": lambda local: local.date(),
+            "week": lambda local: period_start(local.date(), "weekly"),
+            "month": lambda local: local.date().replace(day=1),
+        }["day" if rolling_days else granularity]
+        buckets: dict = {}
+        for hour, blob in rows:
+            local = hour.replace(tzinfo=timezone.utc).astimezone(zone)
+            if not first_day <= local.date() <= to_date:
+                continue
+            registers = HyperLogLog.from_bytes(blob).registers
+            key = bucket_of(local)
+            if key in buckets:
+                np.maximum(buckets[key], registers, out=buckets[key])
+            else:
+                buckets[key] = registers
+
+        if not rolling_days:
+            keys = list(buckets)
+            counts = estimate_counts(np.stack([buckets[key] for key in keys])) if keys else []
+            return QueryResult(["period", "active_users"], list(zip(keys, map(int, counts))))
+
+        days = [first_day + timedelta(days=i) for i in range((to_date - first_day).days + 1)]
+        empty = np.zeros(1 << HLL_PRECISION, dtype=np.uint8)
+        daily = np.stack([buckets.get(day, empty) for day in days])
+        windows = sliding_window_view(daily, rolling_days, axis=0).max(axis=2)
+        counts = estimate_counts(windows)
+        return QueryResult(["period", "active_users"], list(zip(days[rolling_days - 1:], map(int, counts))))
+
+    @staticmethod
+    def get_funnel(from_date: date, to_date: date, steps: list[str], window_hours: int = 24,
+                   segment: Segment = Segment(), conn: Optional[duckdb.DuckDBPyConnection] = None) -> QueryResult:
+        """
+        GET /stats/funnel: Users reaching each step of an ordered funnel within window_hours of step 1.
+        Step 1 must happen in [from_date, to_date]; later steps may spill over by up to the window.
+
+        Single ordered pass per user instead of self-joins: for every step k, a window function
+        carries forward the start time (step 1 timestamp) of the latest chain that reached k - 1,
+        and an event of step k extends it while still inside the window. The latest start is
+        always the best one to extend, so this matches "furthest step reached" exactly.
+        """
+        where, params = segment.where()
+        window = "w AS (PARTITION BY user_id ORDER BY occurred_at ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING)"
+        levels = [f"""
+            Step0 AS (
+                SELECT
+                    user_id, occurred_at, event_type,
+                    CASE WHEN event_type = ? AND occurred_at < CAST(? AS DATE) + 1 THEN occurred_at END AS start_0
+                FROM synced_events
+                WHERE occurred_at >= CAST(? AS DATE)
+                  AND occurred_at < CAST(? AS DATE) + 1 + to_hours(CAST(? AS BIGINT))
+                  AND event_type IN ({", ".join("?" for _ in steps)})
+                  AND {where}
+            )"""]
+        level_params = [steps[0], to_date, from_date, to_date, window_hours, *steps, *params]
+        for k in range(1, len(steps)):
+            carried = ", ".join(f"start_{i}" for i in range(k))
+            levels.append(f"""
+            Carry{k} AS (
+                SELECT
+                    user_id, occurred_at, event_type, {carried},
+                    CASE WHEN event_type = ? THEN last_value(start_{k - 1} IGNORE NULLS) OVER w END AS chain_start
+                FROM Step{k - 1}
+                WINDOW {window}
+            ),
+            Step{k} AS (
+                SELECT
+                    user_id, occurred_at, event_type, {carried},
+                    CASE WHEN occurred_at <= chain_start + to_hours(CAST(? AS BIGINT)) THEN chain_start END AS start_{k}
+                FROM Carry{k}
+            )""")
+            level_params += [steps[k], window_hours]
+
+        reached = ", ".join(
+            f"COUNT(DISTINCT user_id) FILTER (WHERE start_{k} IS NOT NULL)" for k in range(len(steps))
+        )
+        query = f"WITH {','.join(levels)} SELECT {reached} FROM Step{len(steps) - 1};"
+        with read_connection(conn) as read_conn:
+            counts = read_conn.execute(query, level_params).fetchone()
+
+        rows = [
+            (number, event_type, users, round(users / counts[0], 4) if counts[0] else 0.0)
+            for number, (event_type, users) in enumerate(zip(steps, counts), start=1)
+        ]
+        return QueryResult(["step", "event_type", "users", "conversion"], rows)
+
+    @staticmethod
+    def get_sessions(from_date: date, to_date: date, conn: Optional[duckdb.DuckDBPyConnection] = None) -> QueryResult:
+        """
+        GET /stats/sessions: Sessions per day (by start day), average length and events per session.
+        Reads the precomputed `sessions` table, so latency does not grow with event history.
+        """
+        query = """
             SELECT
-                event_type,
-                COUNT(*) AS total_count
-            FROM synced_events
-            WHERE occurred_at >= CAST('{from_date}' AS DATE) 
-              AND occurred_at < CAST('{to_date}' AS DATE) + INTERVAL '1 day'
+                day AS date,
+                COUNT(*) AS sessions,
+                COUNT(DISTINCT user_id) AS users,
+                ROUND(AVG(epoch(ended_at) - epoch(started_at)), 1) AS avg_duration_sec,
+                ROUND(AVG(events), 2) AS avg_events_per_session
+            FROM sessions
+            WHERE day BETWEEN ? AND ?
             GROUP BY 1
-            ORDER BY 2 DESC
-            LIMIT {limit};
+            ORDER BY 1;
+        """
+        with read_connection(conn) as read_conn:
+            return QueryResult.from_cursor(read_conn.execute(query, [from_date, to_date]))
+
+    # --- Fresh mode: snapshot + Postgres tail -------------------------------
+
+    @staticmethod
+    def snapshot_state(conn: Optional[duckdb.DuckDBPyConnection] = None) -> tuple[Optional[datetime], str]:
+        """Snapshot watermark and the DuckDB time zone its days are cut in (run on the analytics executor)."""
+        with read_connection(conn) as read_conn:
+            row = read_conn.execute("SELECT watermark FROM sync_state").fetchone()
+            time_zone = read_conn.execute("SELECT current_setting('TimeZone')").fetchone()[0]
+        return (row[0] if row else None), time_zone
+
+    @staticmethod
+    @db_helper.connection
+    async def _fetch_tail_rows(watermark: datetime, time_zone: str, *, session: AsyncSession) -> list:
+        """
+        Index range scan (idx_events_occurred_at) over events newer than the snapshot, aggregated
+        in Postgres, so even a tail of hours after a missed sync returns one row per user, day and
+        segment instead of every event.
         """
-        with duckdb.connect(database=DUCKDB_FILE, read_only=True) as read_conn:
-            return read_conn.execute(query).fetchdf()
+        property_columns = "".join(
+            f" properties_json->>'{key}' AS {property_column(key)}," for key in SEGMENT_PROPERTIES
+        )
+        result = await session.execute(
+            text(f"""
+                SELECT
+                    CAST(date_trunc('day', occurred_at AT TIME ZONE :time_zone) AS DATE) AS day,
+                    event_type,{property_columns}
+                    user_id,
+                    COUNT(*) AS events,
+                    MIN(occurred_at) AS first_ts,
+                    MAX(occurred_at) AS last_ts
+                FROM events
+                WHERE occurred_at > :watermark
+                GROUP BY {", ".join(["day", "event_type", *PROPERTY_COLUMNS, "user_id"])}
+            """),
+            {"watermark": watermark, "time_zone": time_zone},
+        )
+        return result.all()
+
+    @staticmethod
+    async def fetch_tail(watermark: Optional[datetime], time_zone: str) -> EventTail:
+        """Events ingested after the last sync, to be merged with the DuckDB snapshot (fresh=true)."""
+        if watermark is None:
+            return EventTail(None)
+        rows = await AnalyticsService._fetch_tail_rows(watermark, time_zone)
+        logger.debug("Fetched {} tail rows after {}.", len(rows), watermark)
+        return EventTail(watermark, rows)
+
+    @staticmethod
+    def _user_days(read_conn: duckdb.DuckDBPyConnection, tail: Optional[EventTail]) -> str:
+        """daily_user_segments, extended with the tail when there is one."""
+        if tail is None or tail.rows is None:
+            return "daily_user_segments"
+        read_conn.register("tail_events", tail.frame)
+        columns = ", ".join(["event_type", *PROPERTY_COLUMNS])
+        return f"""(
+            SELECT day, {columns}, user_id, events FROM daily_user_segments
+            UNION ALL
+            SELECT day, {columns}, user_id, events FROM tail_events
+        )"""
+
+    @staticmethod
+    def _event_counts(read_conn: duckdb.DuckDBPyConnection, tail: Optional[EventTail]) -> str:
+        """daily_event_counts, extended with the tail when there is one."""
+        if tail is None or tail.rows is None:
+            return "daily_event_counts"
+        read_conn.register("tail_events", tail.frame)
+        columns = ", ".join(["event_type", *PROPERTY_COLUMNS])
+        return f"""(
+            SELECT day, {columns}, events FROM daily_event_counts
+            UNION ALL
+            SELECT day, {columns}, SUM(events) AS events
+            FROM tail_events
+            GROUP BY ALL
+        )"""
+
+    # --- Exact queries -----------------------------------------------------
+
+    @staticmethod
+    def get_dau(from_date: date, to_date: date, segment: Segment = Segment(),
+                tail: Optional[EventTail] = None, conn: Optional[duckdb.DuckDBPyConnection] = None) -> QueryResult:
+        """GET /stats/dau: Number of unique user_id per day (from the daily segment rollup)."""
+        where, params = segment.where()
+        with read_connection(conn) as read_conn:
+            query = f"""
+                SELECT
+                    day AS date,
+                    COUNT(DISTINCT user_id) AS dau
+                FROM {AnalyticsService._user_days(read_conn, tail)}
+                WHERE day BETWEEN ? AND ?
+                  AND {where}
+                GROUP BY 1
+                ORDER BY 1;
+            """
+            return QueryResult.from_cursor(read_conn.execute(query, [from_date, to_date, *params]))
+
+    @staticmethod
+    def get_top_events(from_date: date, to_date: date, limit: int = 10, segment: Segment = Segment(),
+                       tail: Optional[EventTail] = None, conn: Optional[duckdb.DuckDBPyConnection] = None) -> QueryResult:
+        """GET /stats/top-events: Top event_type by count (from the daily event count rollup)."""
+        where, params = segment.where()
+        with read_connection(conn) as read_conn:
+            query = f"""
+                SELECT
+                    event_type,
+                    SUM(events) AS total_count
+                FROM {AnalyticsService._event_counts(read_conn, tail)}
+                WHERE day BETWEEN ? AND ?
+                  AND {where}
+                GROUP BY 1
+                ORDER BY 2 DESC
+                LIMIT ?;
+            """
+            return QueryResult.from_cursor(read_conn.execute(query, [from_date, to_date, *params, limit]))
 
     @staticmethod
-    def get_retention(start_date: date, windows: int) -> pd.DataFrame:
+    def get_dau_and_top_events(from_date: date, to_date: date, limit: int = 10, segment: Segment = Segment(),
+                               conn: Optional[duckdb.DuckDBPyConnection] = None) -> tuple[QueryResult, QueryResult]:
         """
-        GET /stats/retention: Simple cohort retention (weekly windows).
-        Determines cohorts based on the week of the first activity.
+        DAU and top events for the same range and segment from one scan of daily_user_segments
+        (GROUPING SETS by day and by event_type). Used by batch requests.
         """
+        where, params = segment.where()
         query = f"""
-        WITH 
-        FirstActivity AS (
             SELECT
-                user_id,
-                -- Determine the week of first activity (cohort)
-                date_trunc('week', occurred_at) AS cohort_week
-            FROM synced_events
-            WHERE occurred_at >= CAST('{start_date}' AS DATE)
-            GROUP BY 1, 2
-        ),
+                day,
+                event_type,
+                COUNT(DISTINCT user_id) AS dau,
+                SUM(events) AS total_count
+            FROM daily_user_segments
+            WHERE day BETWEEN ? AND ?
+              AND {where}
+            GROUP BY GROUPING SETS ((day), (event_type));
+        """
+        with read_connection(conn) as read_conn:
+            rows = read_conn.execute(query, [from_date, to_date, *params]).fetchall()
 
-        WeeklyActivity AS (
-            SELECT
-                fa.cohort_week,
-                date_trunc('week', se.occurred_at) AS activity_week,
-                se.user_id
-            FROM synced_events se
-            JOIN FirstActivity fa ON se.user_id = fa.user_id
-            WHERE se.occurred_at >= CAST('{start_date}' AS DATE)
-            GROUP BY 1, 2, 3
-        )
+        dau = sorted((day, users) for day, _, users, _ in rows if day is not None)
+        top = sorted(
+            ((event_type, count) for day, event_type, _, count in rows if day is None),
+            key=lambda row: row[1], reverse=True,
+        )[:limit]
+        return QueryResult(["date", "dau"], dau), QueryResult(["event_type", "total_count"], top)
+
+    @staticmethod
+    def get_retention(start_date: date, windows: int, mode: RetentionMode = "weekly",
+                      segment: Segment = Segment(), tail: Optional[EventTail] = None,
+                      conn: Optional[duckdb.DuckDBPyConnection] = None) -> QueryResult:
+        """
+        GET /stats/retention: Cohort retention with daily or weekly windows.
+        Cohort = period of the user's first ever event, starting with the period containing
+        start_date; computed as bitmap intersections (see RetentionEngine).
+        With a segment, a user counts as retained in a window only with matching activity there.
+        """
+        with read_connection(conn) as read_conn:
+            if not segment and (tail is None or tail.rows is None):
+                return RetentionEngine.get_retention(read_conn, start_date, windows, mode)
+            return AnalyticsService._get_segmented_retention(read_conn, start_date, windows, mode, segment, tail)
 
-        SELECT
-            cohort_week,
-            date_diff('week', cohort_week, activity_week) AS week_number,
-            COUNT(DISTINCT user_id) AS retained_users
-        FROM WeeklyActivity
-        WHERE date_diff('week', cohort_week, activity_week) BETWEEN 0 AND {windows - 1}
-        GROUP BY 1, 2
-        ORDER BY 1, 2;
-        """
-        with duckdb.connect(database=DUCKDB_FILE, read_only=True) as read_conn:
-            return read_conn.execute(query).fetchdf()
+    @staticmethod
+    def _get_segmented_retention(read_conn: duckdb.DuckDBPyConnection, start_date: date, windows: int,
+                                 mode: RetentionMode, segment: Segment,
+                                 tail: Optional[EventTail] = None) -> QueryResult:
+        unit = "week" if mode == "weekly" else "day"
+        where, params = segment.where()
+        first_seen = "user_first_seen"
+        if tail is not None and tail.rows is not None:
+            # Users whose first event is in the tail join their cohort here
+            first_seen = """(
+                SELECT user_id, cohort_day, cohort_week FROM user_first_seen
+                UNION ALL
+                SELECT
+                    user_id,
+                    CAST(date_trunc('day', MIN(first_ts)) AS DATE),
+                    CAST(date_trunc('week', MIN(first_ts)) AS DATE)
+                FROM tail_events
+                WHERE user_id NOT IN (SELECT user_id FROM user_first_seen)
+                GROUP BY user_id
+            )"""
+        query = f"""
+            WITH SegmentActivity AS (
+                SELECT DISTINCT user_id, CAST(date_trunc('{unit}', day) AS DATE) AS period
+                FROM {AnalyticsService._user_days(read_conn, tail)}
+                WHERE day >= ?
+                  AND {where}
+            )
+            SELECT
+                fs.cohort_{unit},
+                date_diff('{unit}', fs.cohort_{unit}, sa.period) AS {unit}_number,
+                COUNT(*) AS retained_users
+            FROM {first_seen} fs
+            JOIN SegmentActivity sa ON sa.user_id = fs.user_id
+            WHERE fs.cohort_{unit} >= ?
+              AND sa.period >= fs.cohort_{unit}
+              AND sa.period < fs.cohort_{unit} + INTERVAL {int(windows)} {unit.upper()}
+            GROUP BY 1, 2
+            ORDER BY 1, 2;
+        """
+        first_period = period_start(start_date, mode)
+        return QueryResult.from_cursor(read_conn.execute(query, [first_period, *params, first_period]))
 
 
 analytics_service = AnalyticsService()
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import hmac
+import secrets
+import time
+from typing import Annotated, NamedTuple, Optional
+
+from fastapi import Depends, HTTPException, Request, Security, status
+from fastapi.security import APIKeyHeader
+from loguru import logger
+from redis.exceptions import RedisError
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import RateLimit, settings
+from app.core.tracing import span
+from app.db.db_helper import db_helper
+from app.db.models.api_keys import ApiKey as DBApiKey
+from app.db.models.users import User as DBUser
+from app.db.redis_helper import redis_helper
+from app.services.jwt_service import CREDENTIALS_EXCEPTION, get_current_user, optional_oauth2_scheme
+from app.services.principal_cache import USER_FIELDS, user_snapshot
+from app.services.rate_limiter import rate_limiter, too_many_requests
+
+SCOPE_INGEST = "ingest"
+SCOPE_READ = "read"
+SCOPES = (SCOPE_INGEST, SCOPE_READ)
+
+API_KEY_HEADER = "X-API-Key"
+KEY_PREFIX = "ek"
+
+api_key_header = APIKeyHeader(name=API_KEY_HEADER, auto_error=False)
+
+INVALID_API_KEY_EXCEPTION = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Invalid or revoked API key",
+)
+
+
+def generate_api_key() -> tuple[str, str]:
+    """New (key_id, key). The key is ek_<key_id>_<secret>; only its sha256 is stored."""
+    key_id = secrets.token_hex(8)
+    return key_id, f"{KEY_PREFIX}_{key_id}_{secrets.token_urlsafe(32)}"
+
+
+def hash_api_key(key: str) -> str:
+    # The secret has 256 bits of entropy, a fast hash is enough (no bcrypt on the ingest path)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class ApiKeyEntry(NamedTuple):
+    key_id: str
+    key_hash: bytes
+    scopes: frozenset[str]
+    quota: RateLimit
+    user: DBUser
+
+
+class ApiKeyIndex:
+    """
+    Active API keys of enabled users, held in memory by every worker, so machine clients are
+    authenticated without touching Postgres: a dict lookup by key_id and a constant-time
+    comparison of the sha256 of the presented key.
+
+    The index is loaded at startup and reloaded when a key is created or revoked, or a user
+    is disabled (a message on a Redis channel), and every `api_key_refresh_interval` seconds
+    in case a message was missed or keys were edited directly in the DB.
+
+    Each key has a requests-per-minute quota, enforced by the shared token-bucket rate limiter.
+    """
+
+    CHANNEL = "auth:api_keys_changed"
+
+    def __init__(self):
+        self._entries: dict[str, ApiKeyEntry] = {}
+        self._refresh_interval: int = settings.auth.api_key_refresh_interval
+        self._dummy_hash = bytes(32)
+        self.loaded_at: Optional[float] = None
+        self.authenticated = 0
+        self.rejected = 0
+        self.throttled = 0
+
+    @db_helper.connection
+    async def load(self, *, session: AsyncSession):
+        """Replaces the index with the active keys from the DB."""
+        stmt = (
+            select(DBApiKey, DBUser)
+            .join(DBUser, DBUser.id == DBApiKey.user_id)
+            .where(DBApiKey.revoked.is_(False), DBUser.disabled.isnot(True))
+        )
+        entries = {}
+        for key, user in (await session.execute(stmt)).all():
+            entries[key.key_id] = ApiKeyEntry(
+                key_id=key.key_id,
+                key_hash=bytes.fromhex(key.key_hash),
+                scopes=frozenset(key.scopes.split(",")),
+                quota=RateLimit(times=key.quota_per_minute, seconds=60),
+                user=user_snapshot({field: getattr(user, field) for field in USER_FIELDS}),
+            )
+        self._entries = entries
+        self.loaded_at = time.time()
+        logger.info(f"Loaded {len(entries)} API keys.")
+
+    def verify(self, key: str) -> Optional[ApiKeyEntry]:
+        """Entry of a valid active key, None otherwise."""
+        parts = key.split("_", 2)
+        entry = self._entries.get(parts[1]) if len(parts) == 3 and parts[0] == KEY_PREFIX else None
+        presented = hashlib.sha256(key.encode("utf-8")).digest()
+        # Compare even for unknown key ids, so both cases take the same time
+        valid = hmac.compare_digest(presented, entry.key_hash if entry is not None else self._dummy_hash)
+        return entry if valid and entry is not None else None
+
+    def authenticate(self, key: str, scope: str) -> ApiKeyEntry:
+        entry = self.verify(key)
+        if entry is None or scope not in entry.scopes:
+            self.rejected += 1
+            raise INVALID_API_KEY_EXCEPTION if entry is None else HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail=f"API key has no '{scope}' scope"
+            )
+        wait = rate_limiter.hit("api_key", entry.key_id, entry.quota)
+        if wait:
+            self.throttled += 1
+            raise too_many_requests(wait, "API key quota exceeded")
+        self.authenticated += 1
+        return entry
+
+    @db_helper.connection
+    async def create_key(
+        self, user_id: int, name: str, scopes: list[str], *, session: AsyncSession
+    ) -> tuple[DBApiKey, str]:
+        """Stores a new key and returns it with the plain key, which cannot be recovered later."""
+        key_id, key = generate_api_key()
+        db_key = DBApiKey(
+            key_id=key_id,
+            key_hash=hash_api_key(key),
+            name=name,
+            user_id=user_id,
+            scopes=",".join(sorted(set(scopes))),
+            quota_per_minute=settings.auth.api_key_quota_per_minute,
+            revoked=False,
+        )
+        session.add(db_key)
+        await session.commit()
+        await session.refresh(db_key)
+        await self.changed()
+        logger.info(f"Created API key {key_id} ({db_key.scopes}) for user {user_id}")
+        return db_key, key
+
+    @db_helper.connection
+    async def list_keys(self, user_id: int, *, session: AsyncSession) -> list[DBApiKey]:
+        stmt = select(DBApiKey).where(DBApiKey.user_id == user_id).order_by(DBApiKey.id)
+        return list((await session.execute(stmt)).scalars().all())
+
+    @db_helper.connection
+    async def revoke_key(self, user_id: int, key_id: str, *, session: AsyncSession) -> bool:
+        result = await session.execute(
+            update(DBApiKey)
+            .where(DBApiKey.user_id == user_id, DBApiKey.key_id == key_id, DBApiKey.revoked.is_(False))
+            .values(revoked=True)
+        )
+        await session.commit()
+        if result.rowcount == 0:
+            return False
+        await self.changed()
+        logger.info(f"Revoked API key {key_id} of user {user_id}")
+        return True
+
+    async def changed(self):
+        """Reloads the index here and tells the other workers to do the same."""
+        await self.load()
+        await redis_helper.call(redis_helper.client.publish, self.CHANNEL, "reload")
+
+    async def listen(self):
+        """Loads the index and keeps it current (runs for the app's lifetime)."""
+        while True:
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error(f"Could not load API keys: {e!r}")
+            try:
+                async with redis_helper.client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.CHANNEL)
+                    deadline = time.monotonic() + self._refresh_interval
+                    while time.monotonic() < deadline:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message is not None:
+                            break
+            except (RedisError, OSError) as e:
+                redis_helper.mark_unavailable(e)
+                # Without Redis the periodic reload is the only way to see changes
+                await asyncio.sleep(self._refresh_interval)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._entries),
+            "loaded_at": self.loaded_at,
+            "authenticated": self.authenticated,
+            "rejected": self.rejected,
+            "throttled": self.throttled,
+        }
+
+
+api_key_index = ApiKeyIndex()
+
+
+def require_scope(scope: str):
+    """
+    Dependency resolving the caller from an X-API-Key header with the given scope,
+    falling back to the bearer token of a regular user.
+    """
+    async def principal(
+        request: Request,
+        api_key: Annotated[Optional[str], Security(api_key_header)],
+        token: Annotated[Optional[str], Depends(optional_oauth2_scheme)],
+    ) -> DBUser:
+        if api_key is not None:
+            with span("auth"):
+                entry = api_key_index.authenticate(api_key, scope)
+            request.state.api_key_id = entry.key_id
+            return entry.user
+        if token is None:
+            raise CREDENTIALS_EXCEPTION
+        return await get_current_user(token)
+
+    return principal
+
+
+get_ingest_principal = require_scope(SCOPE_INGEST)
+get_read_principal = require_scope(SCOPE_READ)
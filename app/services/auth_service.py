@@ -1,25 +1,27 @@
-import bcrypt
 from typing import Union, Tuple
 from loguru import logger
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 from app.db.db_helper import db_helper
 from app.schemas.users import UserCreate
 from app.db.models.users import User as DBUser
+from app.services.api_key_service import api_key_index
 from app.services.jwt_service import jwt_service
+from app.services.password_hasher import password_hasher
+from app.services.principal_cache import principal_cache
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    is_valid = bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-    logger.debug(f"Password verification result: {is_valid}")
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    is_valid = await password_hasher.verify(plain_password, hashed_password)
+    logger.debug("Password verification result: {}", is_valid)
     return is_valid
 
 
-def get_password_hash(password: str) -> str:
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    logger.debug(f"Generated password hash: {hashed[:10]}...")
+async def get_password_hash(password: str) -> str:
+    hashed = await password_hasher.hash(password)
+    logger.debug("Generated password hash: {}...", hashed[:10])
     return hashed
 
 
@@ -27,48 +29,83 @@ class AuthService:
 
     @db_helper.connection
     async def get_user_if_exists(self, username: str, *, session: AsyncSession) -> Union[DBUser, None]:
-        logger.debug(f"Checking if user exists: {username}")
+        logger.debug("Checking if user exists: {}", username)
         stmt = select(DBUser).where(DBUser.username == username)
         result = await session.execute(stmt)
         user = result.scalar_one_or_none()
-        logger.debug(f"User found: {user.username if user else None}")
+        logger.debug("User found: {}", user.username if user else None)
         return user
 
     @db_helper.connection
-    async def create_user_in_db(self, user: UserCreate, *, session: AsyncSession) -> DBUser:
+    async def create_user_in_db(self, user: UserCreate, hashed_password: str, *, session: AsyncSession) -> DBUser:
         logger.info(f"Creating user in DB: {user.username}")
-        hashed_password = get_password_hash(user.password)
         db_user = DBUser(username=user.username, hashed_password=hashed_password)
         session.add(db_user)
         await session.commit()
         logger.info(f"User created: {db_user.username} (ID: {db_user.id})")
         return db_user
 
+    @db_helper.connection
+    async def update_password_hash(self, user_id: int, hashed_password: str, *, session: AsyncSession):
+        await session.execute(update(DBUser).where(DBUser.id == user_id).values(hashed_password=hashed_password))
+        await session.commit()
+
+    async def rehash_password(self, user: DBUser, password: str):
+        """Re-hashes with the current bcrypt cost after a successful login; failures only cost the upgrade."""
+        try:
+            hashed_password = await get_password_hash(password)
+            await self.update_password_hash(user.id, hashed_password)
+            user.hashed_password = hashed_password
+            logger.info(f"Password hash of user {user.username} upgraded to the current cost")
+        except Exception as e:
+            logger.warning(f"Could not rehash password of user {user.username}: {e}")
+
+    @db_helper.connection
+    async def set_user_disabled(self, username: str, disabled: bool, *, session: AsyncSession) -> bool:
+        """Enables/disables a user; cached principals and API key indexes are refreshed on every worker."""
+        result = await session.execute(
+            update(DBUser).where(DBUser.username == username).values(disabled=disabled)
+        )
+        await session.commit()
+        await principal_cache.invalidate(username)
+        await api_key_index.changed()
+        logger.info(f"User {username} {'disabled' if disabled else 'enabled'}")
+        return result.rowcount > 0
+
     async def register_user(self, user_data: UserCreate) -> DBUser:
-        logger.debug(f"Registering user: {user_data.username}")
-        return await self.create_user_in_db(user_data)
+        logger.debug("Registering user: {}", user_data.username)
+        # Hashed before the session opens: a registration waiting for the bcrypt pool holds no DB connection
+        hashed_password = await get_password_hash(user_data.password)
+        return await self.create_user_in_db(user_data, hashed_password)
 
     async def authenticate_user(self, username: str, password: str) -> Union[DBUser, None]:
-        logger.debug(f"Authenticating user: {username}")
+        logger.debug("Authenticating user: {}", username)
         user = await self.get_user_if_exists(username=username)
 
         if not user:
             logger.warning(f"Authentication failed: user {username} not found")
             return None
 
-        if not verify_password(password, user.hashed_password):
+        if not await verify_password(password, user.hashed_password):
             logger.warning(f"Authentication failed: invalid password for user {username}")
             return None
 
-        logger.info(f"User authenticated: {username}")
+        if user.disabled:
+            logger.warning(f"Authentication failed: user {username} is disabled")
+            return None
+
+        if password_hasher.needs_rehash(user.hashed_password):
+            await self.rehash_password(user, password)
+
+        logger.info("User authenticated: {}", username)
         return user
 
     @staticmethod
     def create_token_for_user(user: DBUser) -> Tuple[str, str, int]:
-        logger.debug(f"Creating token pair for user: {user.username}")
+        logger.debug("Creating token pair for user: {}", user.username)
         data = {"sub": user.username}
         access_token, refresh_token, expires_in_seconds = jwt_service.create_token_pair(data)
-        logger.info(f"Token pair created for user: {user.username}, expires in {expires_in_seconds} sec")
+        logger.info("Token pair created for user: {}, expires in {} sec", user.username, expires_in_seconds)
         return access_token, refresh_token, expires_in_seconds
 
 
@@ -1,57 +1,58 @@
+import time
 import uuid
 from typing import List
-import asyncpg
 import json
 
 from loguru import logger
 
-from app.core.config import settings
-
+from app.core.tracing import span
+from app.core.metrics import EVENTS_DUPLICATED, EVENTS_INGESTED, INGEST_BATCH_SIZE, INGEST_INSERT_DURATION
+from app.db.db_helper import db_helper
 from app.schemas.events import EventSchema
+from app.services.live_counters import live_counters
 
 
 async def process_events(events: List[EventSchema]) -> int:
     """
-    High-performance data ingestion using asyncpg.executemany.
+    High-performance data ingestion: the whole batch is sent as column arrays in one
+    INSERT ... SELECT FROM unnest(...) on a connection from the shared pool. RETURNING gives
+    the rows that were new: only those reach the live counters, the rest were duplicates.
     Explicit JSON serialization is applied for compatibility with asyncpg.
     """
 
-    try:
-        dsn = str(settings.db.url).replace("postgresql+asyncpg://", "postgresql://")
-        conn = await asyncpg.connect(dsn=dsn)
-    except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        return 0
+    with span("encode"):
+        columns = (
+            [uuid.uuid4() for _ in events],
+            [event.event_id for event in events],
+            [event.user_id for event in events],
+            [event.occurred_at for event in events],
+            [event.event_type for event in events],
+            [json.dumps(event.properties_json) for event in events],
+        )
+
+    query_insert = """
+        INSERT INTO events (id, event_id, user_id, occurred_at, event_type, properties_json)
+        SELECT * FROM unnest($1::uuid[], $2::uuid[], $3::integer[], $4::timestamptz[], $5::text[], $6::json[])
+        ON CONFLICT (event_id) DO NOTHING
+        RETURNING event_type, occurred_at
+    """
 
+    started = time.perf_counter()
     try:
-        data_to_copy = []
-        for event in events:
-            new_id = uuid.uuid4()
-            properties_json_str = json.dumps(event.properties_json)
-            data_to_copy.append((
-                new_id,
-                event.event_id,
-                event.user_id,
-                event.occurred_at,
-                event.event_type,
-                properties_json_str,
-            ))
-
-        query_insert = """
-            INSERT INTO events (id, event_id, user_id, occurred_at, event_type, properties_json)
-            VALUES ($1, $2, $3, $4, $5, $6)
-            ON CONFLICT (event_id) DO NOTHING
-        """
-
-        await conn.executemany(query_insert, data_to_copy)
-
-        logger.info(f"Attempted to process {len(data_to_copy)} events via asyncpg.executemany.")
-
-        return len(data_to_copy)
-
+        async with db_helper.raw_connection() as conn:
+            with span("insert", events=len(events)):
+                rows = await conn.fetch(query_insert, *columns)
     except Exception as e:
         logger.error(f"Error executing batch asyncpg query: {e}")
         raise
 
-    finally:
-        await conn.close()
+    inserted = len(rows)
+    INGEST_INSERT_DURATION.observe(time.perf_counter() - started)
+    INGEST_BATCH_SIZE.observe(len(events))
+    EVENTS_INGESTED.inc(inserted)
+    EVENTS_DUPLICATED.inc(len(events) - inserted)
+
+    live_counters.record(rows)
+    logger.info("Processed {} events: {} inserted, {} duplicates.", len(events), inserted, len(events) - inserted)
+
+    return len(events)
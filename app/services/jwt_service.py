@@ -1,3 +1,5 @@
+import hashlib
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Annotated, Union, Tuple, Literal
 
@@ -9,10 +11,16 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.core.config import settings
+from app.core.metrics import cache_lookups
+from app.core.tracing import span
 from app.db.db_helper import db_helper
 from app.db.models.users import User as DBUser
+from app.services.principal_cache import principal_cache
+from app.utils.lru_cache import LRUCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/stats/token")
+# For endpoints that also accept an API key instead of a bearer token
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/stats/token", auto_error=False)
 
 CREDENTIALS_EXCEPTION = HTTPException(
     status_code=status.HTTP_401_UNAUTHORIZED,
@@ -30,6 +38,11 @@ class JWTService:
     ACCESS_TOKEN_EXPIRE_MINUTES: int = settings.auth.access_token_expire_minutes
     REFRESH_TOKEN_EXPIRE_DAYS: int = settings.auth.refresh_token_expire_days
 
+    def __init__(self):
+        # sha256(token) -> (sub, token_type), kept until the token's exp
+        self._verified_tokens = LRUCache(max_entries=settings.auth.token_cache_size)
+        self._token_hit, _, self._token_miss = cache_lookups("jwt")
+
     def create_access_token(
         self,
         data: dict,
@@ -84,19 +97,28 @@ class JWTService:
         token: str,
         expected_type: Literal[TOKEN_TYPE_ACCESS, TOKEN_TYPE_REFRESH]
     ) -> str:
-        try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-
-            username: str | None = payload.get("sub")
-            token_type: str | None = payload.get("token_type")
-
-            if username is None or token_type != expected_type:
+        token_hash = hashlib.sha256(token.encode("utf-8")).digest()
+        claims = self._verified_tokens.get(token_hash)
+        if claims is not None:
+            self._token_hit.inc()
+        else:
+            self._token_miss.inc()
+            try:
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            except (InvalidTokenError, JWTError):
                 raise CREDENTIALS_EXCEPTION
 
-            return username
-        except (InvalidTokenError, JWTError):
+            claims = (payload.get("sub"), payload.get("token_type"))
+            ttl = payload["exp"] - time.time() if isinstance(payload.get("exp"), (int, float)) else 0
+            if ttl > 0:
+                self._verified_tokens.set(token_hash, claims, ttl=ttl)
+
+        username, token_type = claims
+        if username is None or token_type != expected_type:
             raise CREDENTIALS_EXCEPTION
 
+        return username
+
 
 jwt_service = JWTService()
 
@@ -104,22 +126,31 @@ jwt_service = JWTService()
 async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)]
 ) -> DBUser:
-    username = jwt_service.decode_token(token, expected_type=TOKEN_TYPE_ACCESS)
-    user = await jwt_service.get_user_from_db(username=username)
+    with span("auth"):
+        username = jwt_service.decode_token(token, expected_type=TOKEN_TYPE_ACCESS)
+        user = await principal_cache.get_user(username, jwt_service.get_user_from_db)
 
-    if user is None:
+    if user is None or user.disabled:
         raise CREDENTIALS_EXCEPTION
 
     return user
 
 
+async def get_admin_user(
+    current_user: Annotated[DBUser, Depends(get_current_user)]
+) -> DBUser:
+    if current_user.username not in settings.auth.admin_usernames:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Administrator privileges required")
+    return current_user
+
+
 async def get_current_refresh_user(
     refresh_token: Annotated[str, Depends(oauth2_scheme)]
 ) -> DBUser:
     username = jwt_service.decode_token(refresh_token, expected_type=TOKEN_TYPE_REFRESH)
-    user = await jwt_service.get_user_from_db(username=username)
+    user = await principal_cache.get_user(username, jwt_service.get_user_from_db)
 
-    if user is None:
+    if user is None or user.disabled:
         raise CREDENTIALS_EXCEPTION
 
     return user
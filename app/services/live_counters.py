@@ -0,0 +1,176 @@
+import os
+import socket
+import time
+from collections import Counter
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.db.redis_helper import redis_helper
+from app.services.query_result import QueryResult
+from app.utils.space_saving import SpaceSaving
+
+
+def _minute(ts: float) -> int:
+    return int(ts // 60)
+
+
+class LiveEventCounters:
+    """
+    Streaming event_type counts for events ingested after the current DuckDB snapshot.
+
+    Every worker keeps per-minute buckets (ingest time) of Space-Saving summaries keyed by
+    (occurred_at day, event_type), so memory stays bounded however many event types arrive.
+    Buckets are flushed to Redis (one hash per minute and worker) and combined at query time,
+    then added to the snapshot history. A successful sync moves the cutoff forward: buckets
+    before the minute the sync started are covered by DuckDB and dropped. The minute that
+    contains the sync start is kept, so counts near the boundary may be slightly high.
+    """
+
+    KEY_PREFIX = "analytics:live:top_events"
+    CUTOFF_KEY = f"{KEY_PREFIX}:cutoff"
+
+    def __init__(self):
+        self.capacity: int = settings.analytics.live_top_capacity
+        self.window_minutes: int = settings.analytics.live_window_minutes
+        self.flush_interval: float = settings.analytics.live_flush_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._buckets: dict[int, SpaceSaving] = {}
+        self._dirty: set[int] = set()
+        self._cutoff_minute: int = 0
+
+    # --- Ingest ------------------------------------------------------------
+
+    def record(self, inserted: Iterable[tuple[str, datetime]]):
+        """
+        Called by process_events with the (event_type, occurred_at) of the rows the insert actually
+        wrote, so duplicates and client retries are not counted twice.
+        """
+        minute = _minute(time.time())
+        bucket = self._buckets.get(minute)
+        if bucket is None:
+            bucket = self._buckets[minute] = SpaceSaving(self.capacity)
+            self._expire_local(minute)
+        for (day, event_type), count in Counter(
+                (occurred_at.date(), event_type) for event_type, occurred_at in inserted
+        ).items():
+            bucket.add((day, event_type), count)
+        self._dirty.add(minute)
+
+    def _expire_local(self, now_minute: int):
+        oldest = max(self._cutoff_minute, now_minute - self.window_minutes)
+        for minute in [m for m in self._buckets if m < oldest]:
+            del self._buckets[minute]
+            self._dirty.discard(minute)
+
+    async def flush(self):
+        """Publishes this worker's changed buckets to Redis (whole bucket, so retries are idempotent)."""
+        if not self._dirty or not redis_helper.available:
+            return
+        dirty, self._dirty = self._dirty, set()
+        ttl = self.window_minutes * 60
+        try:
+            async with redis_helper.client.pipeline(transaction=False) as pipe:
+                for minute in dirty:
+                    bucket = self._buckets.get(minute)
+                    if bucket is None:
+                        continue
+                    key = f"{self.KEY_PREFIX}:{minute}:{self.worker_id}"
+                    pipe.delete(key)
+                    pipe.hset(key, mapping={
+                        f"{day.isoformat()}|{event_type}": count for (day, event_type), count in bucket.counts.items()
+                    })
+                    pipe.expire(key, ttl)
+                    pipe.sadd(f"{self.KEY_PREFIX}:{minute}", self.worker_id)
+                    pipe.expire(f"{self.KEY_PREFIX}:{minute}", ttl)
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            self._dirty |= dirty
+            redis_helper.mark_unavailable(e)
+
+    # --- Snapshot boundary -------------------------------------------------
+
+    async def advance(self, snapshot_started_at: float):
+        """Called after a successful sync that read Postgres starting at `snapshot_started_at`."""
+        self._cutoff_minute = max(self._cutoff_minute, _minute(snapshot_started_at))
+        self._expire_local(_minute(time.time()))
+        if redis_helper.available:
+            try:
+                await redis_helper.client.set(self.CUTOFF_KEY, self._cutoff_minute, ex=self.window_minutes * 60)
+            except (RedisError, OSError) as e:
+                redis_helper.mark_unavailable(e)
+
+    # --- Query -------------------------------------------------------------
+
+    async def _shared_counts(self, first_minute: int, last_minute: int) -> tuple[Counter, Optional[int]]:
+        """Counts flushed by other workers, plus the shared cutoff minute (None if Redis is down)."""
+        counts: Counter = Counter()
+        if not redis_helper.available:
+            return counts, None
+        client = redis_helper.client
+        minutes = range(first_minute, last_minute + 1)
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.get(self.CUTOFF_KEY)
+                for minute in minutes:
+                    pipe.smembers(f"{self.KEY_PREFIX}:{minute}")
+                cutoff, *workers = await pipe.execute()
+            cutoff = int(cutoff) if cutoff is not None else None
+
+            keys = [
+                f"{self.KEY_PREFIX}:{minute}:{worker}"
+                for minute, minute_workers in zip(minutes, workers)
+                if cutoff is None or minute >= cutoff
+                for worker in minute_workers
+                if worker != self.worker_id
+            ]
+            if keys:
+                async with client.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        pipe.hgetall(key)
+                    for fields in await pipe.execute():
+                        for field, count in fields.items():
+                            day, event_type = field.split("|", 1)
+                            counts[(date.fromisoformat(day), event_type)] += int(count)
+        except (RedisError, OSError) as e:
+            redis_helper.mark_unavailable(e)
+            return Counter(), None
+        return counts, cutoff
+
+    async def top_events(
+            self,
+            from_date: date,
+            to_date: date,
+            limit: int,
+            event_types: Optional[tuple[str, ...]] = None,
+    ) -> list[tuple[str, int]]:
+        """Top event types ingested since the snapshot, across all workers that reached Redis."""
+        now_minute = _minute(time.time())
+        first_minute = max(self._cutoff_minute, now_minute - self.window_minutes)
+        shared, cutoff = await self._shared_counts(first_minute, now_minute)
+        if cutoff is not None and cutoff > self._cutoff_minute:
+            # Another worker ran the sync; adopt its boundary
+            self._cutoff_minute = cutoff
+            self._expire_local(now_minute)
+
+        for minute, bucket in self._buckets.items():
+            if minute >= self._cutoff_minute:
+                shared.update(bucket.counts)
+
+        totals: Counter = Counter()
+        for (day, event_type), count in shared.items():
+            if from_date <= day <= to_date and (event_types is None or event_type in event_types):
+                totals[event_type] += count
+        return totals.most_common(limit)
+
+    @staticmethod
+    def merge_top_events(history: QueryResult, live: list[tuple[str, int]], limit: int) -> QueryResult:
+        """Adds live counts to snapshot totals; `history` must include every live event type in the top."""
+        totals = Counter({event_type: int(count) for event_type, count in history.rows})
+        totals.update(dict(live))
+        return QueryResult(["event_type", "total_count"], totals.most_common(limit))
+
+
+live_counters = LiveEventCounters()
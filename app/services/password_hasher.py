@@ -0,0 +1,116 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+import bcrypt
+from loguru import logger
+
+from app.core.config import settings
+
+
+def _hash_password(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _check_password(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+class HasherBusy(Exception):
+    """Too many hashing requests are already waiting; the caller should retry later."""
+
+
+class PasswordHasher:
+    """
+    bcrypt off the event loop: hashing runs in a small process pool (true parallelism, no GIL),
+    at most `workers` operations at a time. Requests beyond that wait on a semaphore; once
+    `max_pending` are waiting new ones fail fast with HasherBusy, so a login storm queues
+    instead of eating the CPU and event loop that ingest requests need.
+    """
+
+    def __init__(self, workers: int, max_pending: int, rounds: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_sec = 0.0
+        self.max_wait_sec = 0.0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs an event loop and thread pools is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._pool
+
+    async def _run(self, func: Callable[..., Any], *args) -> Any:
+        pool = self._get_pool()
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HasherBusy(f"{self.pending} password hashing requests already waiting")
+
+        submitted_at = time.monotonic()
+        self.pending += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.pending -= 1
+        waited = time.monotonic() - submitted_at
+        self.total_wait_sec += waited
+        self.max_wait_sec = max(self.max_wait_sec, waited)
+
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(_hash_password, password.encode("utf-8"), self.rounds)
+        return hashed.decode("utf-8")
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(_check_password, password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """True if the hash was made with other cost parameters than the configured ones."""
+        try:
+            _, prefix, cost, _ = hashed_password.split("$", 3)
+            return prefix != "2b" or int(cost) != self.rounds
+        except ValueError:
+            return True
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "pending": self.pending,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(1000 * self.total_wait_sec / self.completed, 2) if self.completed else 0.0,
+            "max_wait_ms": round(1000 * self.max_wait_sec, 2),
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._slots = None
+            logger.info("Password hasher pool shut down.")
+
+
+password_hasher = PasswordHasher(
+    workers=settings.auth.hasher_workers,
+    max_pending=settings.auth.hasher_max_pending,
+    rounds=settings.auth.bcrypt_rounds,
+)
@@ -0,0 +1,144 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.metrics import cache_lookups
+from app.db.models.users import User as DBUser
+from app.db.redis_helper import redis_helper
+from app.utils.lru_cache import LRUCache
+
+# Columns cached for request handlers; the password hash never leaves Postgres
+USER_FIELDS = ("id", "username", "email", "full_name", "disabled")
+
+
+def user_snapshot(data: dict) -> DBUser:
+    """Transient (session-less) user built from cached fields."""
+    return DBUser(**{field: data.get(field) for field in USER_FIELDS})
+
+
+class PrincipalCache:
+    """
+    Resolved users for get_current_user, so authenticated requests skip the `users` lookup.
+
+    * Local tier: per-worker LRU of user snapshots with a short TTL.
+    * Shared tier: Redis JSON under auth:user:<username>, filled by whichever worker hit Postgres.
+
+    invalidate() (e.g. when a user is disabled) bumps the user's version, deletes the shared entry
+    and publishes the username on a Redis channel; every worker's listener drops its local copy.
+    The local TTL bounds staleness if a message is missed while Redis is down.
+
+    A lookup that read the user from Postgres before the change but finishes after invalidate()
+    must not cache what it read: the shared entry is only written if the version is still the one
+    seen before the lookup, and the local one only if no invalidation arrived meanwhile.
+    """
+
+    KEY_PREFIX = "auth:user"
+    VERSION_PREFIX = "auth:user_version"
+    CHANNEL = "auth:user_invalidated"
+    # SET the entry only if the user's version has not changed since the lookup started
+    SET_IF_CURRENT = """
+    if (redis.call('GET', KEYS[2]) or '0') == ARGV[2] then
+        return redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+    end
+    return 0
+    """
+
+    def __init__(self):
+        cfg = settings.auth
+        self._local = LRUCache(max_entries=cfg.principal_cache_size)
+        self._local_ttl: int = cfg.principal_cache_local_ttl
+        self._shared_ttl: int = cfg.principal_cache_ttl
+        self.shared_hits = 0
+        self.db_lookups = 0
+        self._local_hit, self._shared_hit, self._miss = cache_lookups("principal")
+        # Invalidations seen by this worker, to skip caching a lookup that overlapped one
+        self._invalidations = 0
+        self._set_if_current = redis_helper.client.register_script(self.SET_IF_CURRENT)
+
+    @classmethod
+    def _key(cls, username: str) -> str:
+        return f"{cls.KEY_PREFIX}:{username}"
+
+    @classmethod
+    def _version_key(cls, username: str) -> str:
+        return f"{cls.VERSION_PREFIX}:{username}"
+
+    async def get_user(self, username: str, load: Callable[[str], Awaitable[Optional[DBUser]]]) -> Optional[DBUser]:
+        """Cached user, falling back to `load(username)`; unknown users are not cached."""
+        user = self._local.get(username)
+        if user is not None:
+            self._local_hit.inc()
+            return user
+
+        invalidations = self._invalidations
+        cached = await redis_helper.call(redis_helper.client.mget, self._key(username), self._version_key(username))
+        raw, version = cached if cached is not None else (None, None)
+        if raw is not None:
+            self.shared_hits += 1
+            self._shared_hit.inc()
+            user = user_snapshot(json.loads(raw))
+        else:
+            self.db_lookups += 1
+            self._miss.inc()
+            loaded = await load(username)
+            if loaded is None:
+                return None
+            data = {field: getattr(loaded, field) for field in USER_FIELDS}
+            if cached is not None:
+                await redis_helper.call(
+                    self._set_if_current,
+                    keys=[self._key(username), self._version_key(username)],
+                    args=[json.dumps(data), version or "0", self._shared_ttl],
+                )
+            user = user_snapshot(data)
+
+        if invalidations == self._invalidations:
+            self._local.set(username, user, ttl=self._local_ttl)
+        return user
+
+    async def invalidate(self, username: str):
+        """Drops the user from every worker's cache, e.g. after disabling it (call after the commit)."""
+        self._drop_local(username)
+        version_key = self._version_key(username)
+        # Outlives any shared entry written under the previous version
+        await redis_helper.call(redis_helper.client.incr, version_key)
+        await redis_helper.call(redis_helper.client.expire, version_key, self._shared_ttl)
+        await redis_helper.call(redis_helper.client.delete, self._key(username))
+        await redis_helper.call(redis_helper.client.publish, self.CHANNEL, username)
+        logger.info(f"Invalidated cached principal {username}.")
+
+    def _drop_local(self, username: str):
+        self._invalidations += 1
+        self._local.pop(username)
+
+    async def listen(self):
+        """Applies invalidations published by other workers (runs for the app's lifetime)."""
+        while True:
+            try:
+                async with redis_helper.client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._drop_local(message["data"])
+            except (RedisError, OSError) as e:
+                redis_helper.mark_unavailable(e)
+                # Invalidations may have been missed meanwhile
+                self._invalidations += 1
+                self._local.clear()
+                await asyncio.sleep(redis_helper.RETRY_AFTER)
+
+    def stats(self) -> dict:
+        return {
+            "local_hits": self._local.hits,
+            "local_misses": self._local.misses,
+            "shared_hits": self.shared_hits,
+            "db_lookups": self.db_lookups,
+            "local_entries": len(self._local),
+        }
+
+
+principal_cache = PrincipalCache()
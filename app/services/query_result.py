@@ -0,0 +1,54 @@
+from typing import Any, Sequence
+
+import duckdb
+import pyarrow as pa
+
+
+class QueryResult:
+    """
+    Analytics result as column names plus row tuples, exactly as DuckDB returns them.
+    Serializers in app/api/responses.py encode it directly, without a DataFrame round trip.
+    """
+
+    __slots__ = ("columns", "rows")
+
+    def __init__(self, columns: Sequence[str], rows: list[tuple]):
+        self.columns = list(columns)
+        self.rows = rows
+
+    @classmethod
+    def from_cursor(cls, cursor: duckdb.DuckDBPyConnection) -> "QueryResult":
+        columns = [description[0] for description in cursor.description]
+        return cls(columns, cursor.fetchall())
+
+    def records(self) -> list[dict[str, Any]]:
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+    def column(self, name: str) -> list[Any]:
+        idx = self.columns.index(name)
+        return [row[idx] for row in self.rows]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, QueryResult):
+            return NotImplemented
+        return self.columns == other.columns and self.rows == other.rows
+
+    def to_arrow(self) -> bytes:
+        """
+        Arrow IPC stream of the result: the body of Arrow responses and the form results are shared
+        in through Redis. Unlike pickle, reading it back cannot run code, so Redis needs no trust.
+        """
+        columns = list(zip(*self.rows)) if self.rows else [[] for _ in self.columns]
+        table = pa.table({name: pa.array(values) for name, values in zip(self.columns, columns)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    @classmethod
+    def from_arrow(cls, payload: bytes) -> "QueryResult":
+        table = pa.ipc.open_stream(payload).read_all()
+        return cls(table.column_names, list(zip(*(column.to_pylist() for column in table.columns))))
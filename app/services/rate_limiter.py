@@ -0,0 +1,234 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from fastapi import Depends, HTTPException, Request, status
+from loguru import logger
+
+from app.core.config import RateLimit, settings
+from app.db.models.users import User as DBUser
+from app.db.redis_helper import redis_helper
+
+# Applies a worker's spending to the shared bucket and returns the tokens left for everyone.
+# The bucket refills by Redis' own clock, so workers' clocks don't have to agree.
+RECONCILE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local spent = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate) - spent
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return tostring(tokens)
+"""
+
+
+class TokenBucket:
+    """Refills at `rate` tokens per second up to `capacity`; `spent` is not yet reported to Redis."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at", "spent")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+        self.spent = 0.0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self, cost: float, now: float) -> float:
+        """Takes `cost` tokens: 0.0 if allowed, otherwise seconds until they are available."""
+        self.refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            self.spent += cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class TokenBucketLimiter:
+    """
+    Rate limits checked in process: one token bucket per (limit, client) in every worker, so a
+    check is a dict lookup and some arithmetic instead of a Redis round trip per request.
+
+    Every `sync_interval` seconds a worker sends what it spent on each active bucket to a shared
+    bucket in Redis (one pipelined script call per sync) and takes over the level it returns, so
+    the limit holds across workers up to what they admit between two syncs. Without Redis each
+    worker enforces the limits on its own.
+    """
+
+    KEY_PREFIX = "ratelimit"
+
+    def __init__(self):
+        cfg = settings.rate_limit
+        self.sync_interval: float = cfg.sync_interval
+        self._max_buckets: int = cfg.max_buckets
+        self._buckets: "OrderedDict[tuple[str, Hashable], TokenBucket]" = OrderedDict()
+        # Buckets that spent since the last sync or are still refilling, i.e. differ from a full bucket
+        self._active: set[tuple[str, Hashable]] = set()
+        self._script = redis_helper.client.register_script(RECONCILE_SCRIPT)
+        self.allowed = 0
+        self.throttled = 0
+        self.syncs = 0
+
+    def _bucket(self, name: str, identity: Hashable, limit: RateLimit, now: float) -> TokenBucket:
+        key = (name, identity)
+        rate = limit.times / limit.seconds
+        capacity = limit_capacity(limit)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity, now)
+            if len(self._buckets) > self._max_buckets:
+                evicted, _ = self._buckets.popitem(last=False)
+                self._active.discard(evicted)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.rate, bucket.capacity = rate, capacity
+        self._active.add(key)
+        return bucket
+
+    def hit(self, name: str, identity: Hashable, limit: RateLimit, cost: float = 1) -> float:
+        """Charges `cost` against `limit` for the client: 0.0 if allowed, otherwise seconds to wait."""
+        now = time.monotonic()
+        wait = self._bucket(name, identity, limit, now).take(cost, now)
+        if wait:
+            self.throttled += 1
+        else:
+            self.allowed += 1
+        return wait
+
+    def hit_all(self, charges: list[tuple[str, Hashable, RateLimit, float]]) -> tuple[float, list[float]]:
+        """
+        Charges several limits at once (name, identity, limit, cost): either all of them or,
+        if any is short, none. Returns the seconds to wait (0.0 if allowed) and the tokens left.
+        """
+        now = time.monotonic()
+        buckets = [(self._bucket(name, identity, limit, now), cost) for name, identity, limit, cost in charges]
+        for bucket, _ in buckets:
+            bucket.refill(now)
+        wait = max((cost - bucket.tokens) / bucket.rate if bucket.tokens < cost else 0.0 for bucket, cost in buckets)
+        if wait:
+            self.throttled += 1
+        else:
+            self.allowed += 1
+            for bucket, cost in buckets:
+                bucket.take(cost, now)
+        return wait, [bucket.tokens for bucket, _ in buckets]
+
+    async def sync(self):
+        """Reconciles active buckets with Redis."""
+        now = time.monotonic()
+        batch = []
+        for key in list(self._active):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._active.discard(key)
+                continue
+            bucket.refill(now)
+            if not bucket.spent and bucket.tokens >= bucket.capacity:
+                self._active.discard(key)
+                continue
+            batch.append((key, bucket, bucket.spent))
+        if not batch:
+            return
+
+        results = None
+        if redis_helper.available:
+            pipe = redis_helper.client.pipeline(transaction=False)
+            for (name, identity), bucket, spent in batch:
+                await self._script(
+                    keys=[f"{self.KEY_PREFIX}:{name}:{identity}"], args=[bucket.rate, bucket.capacity, spent], client=pipe
+                )
+            results = await redis_helper.call(pipe.execute)
+
+        now = time.monotonic()
+        for i, (_, bucket, spent) in enumerate(batch):
+            # Without Redis the spending stays local, it is not replayed to the shared bucket later
+            bucket.spent -= spent
+            if results is not None:
+                bucket.tokens = float(results[i]) - bucket.spent
+                bucket.updated_at = now
+        if results is not None:
+            self.syncs += 1
+
+    def stats(self) -> dict:
+        return {
+            "buckets": len(self._buckets),
+            "active_buckets": len(self._active),
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+            "syncs": self.syncs,
+        }
+
+
+rate_limiter = TokenBucketLimiter()
+
+
+def limit_capacity(limit: RateLimit) -> int:
+    return limit.burst or limit.times
+
+
+def too_many_requests(wait: float, detail: str = "Too Many Requests", headers: Optional[dict] = None) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={**(headers or {}), "Retry-After": str(math.ceil(wait))},
+    )
+
+
+def client_identity(request: Request, user: DBUser) -> str:
+    """Rate limit identity: the API key the request came with, otherwise the user."""
+    api_key_id = getattr(request.state, "api_key_id", None)
+    return f"key:{api_key_id}" if api_key_id is not None else f"user:{user.id}"
+
+
+def charge_ingest(identity: str, events: int, size: int) -> dict[str, str]:
+    """
+    Charges a parsed ingest batch against the client's events/sec and bytes/sec quotas.
+    Returns headers with the budget left; 413 if the batch can never fit the burst, 429 if it has to wait.
+    """
+    cfg = settings.rate_limit
+    charges = [
+        ("ingest_events", identity, cfg.ingest_events, events),
+        ("ingest_bytes", identity, cfg.ingest_bytes, size),
+    ]
+    for name, _, limit, cost in charges:
+        if cost > limit_capacity(limit):
+            raise HTTPException(
+                status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                detail=f"Batch exceeds the {name} burst of {limit_capacity(limit)}, split it",
+            )
+
+    wait, (events_left, bytes_left) = rate_limiter.hit_all(charges)
+    headers = {
+        "X-Quota-Remaining-Events": str(max(0, int(events_left))),
+        "X-Quota-Remaining-Bytes": str(max(0, int(bytes_left))),
+    }
+    if wait:
+        raise too_many_requests(wait, "Ingest quota exceeded", headers)
+    return headers
+
+
+def rate_limit(name: str, principal: Callable):
+    """
+    Route dependency applying `settings.rate_limit.<name>` per client: the API key the request
+    came with, otherwise the user. `principal` is the route's auth dependency (resolved once per request).
+    """
+    limit: RateLimit = getattr(settings.rate_limit, name)
+
+    async def dependency(request: Request, user: DBUser = Depends(principal)):
+        identity = client_identity(request, user)
+        wait = rate_limiter.hit(name, identity, limit)
+        if wait:
+            logger.debug("Rate limit {} exceeded by {}", name, identity)
+            raise too_many_requests(wait)
+
+    return dependency
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.metrics import cache_lookups
+from app.db.redis_helper import redis_helper
+from app.services.query_result import QueryResult
+from app.utils.lru_cache import LRUCache
+
+_MISSING = object()
+
+
+class AnalyticsResultCache:
+    """
+    Two-tier cache of analytics results keyed by (metric, normalized params, snapshot version).
+
+    * Local tier: per-worker LRU bounded by payload bytes.
+    * Shared tier: Redis, so a result computed by one uvicorn worker serves all of them.
+
+    Every successful sync publishes a new snapshot version, which changes all keys at once,
+    so stale results are never served and need no explicit deletion. Concurrent misses for
+    the same key are collapsed: in-process via a shared future, across workers via a
+    short Redis lock while the owner computes.
+    """
+
+    VERSION_KEY = "analytics:snapshot_version"
+    KEY_PREFIX = "analytics:result"
+    LOCK_POLL_INTERVAL = 0.05
+
+    def __init__(self):
+        self._local = LRUCache(
+            max_entries=settings.analytics.cache_max_entries,
+            max_bytes=settings.analytics.cache_max_bytes,
+        )
+        self._local_ttl: int = settings.analytics.cache_local_ttl
+        self._shared_ttl: int = settings.analytics.cache_ttl
+        self._lock_timeout: int = settings.analytics.cache_lock_timeout
+        self._version: str = "0"
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.shared_hits = 0
+        self.computations = 0
+        self._local_hit, self._shared_hit, self._miss = cache_lookups("analytics")
+
+    # --- Snapshot version ------------------------------------------------
+
+    def _adopt_version(self, version: str):
+        if version != self._version:
+            self._local.clear()
+            self._version = version
+
+    async def current_version(self) -> str:
+        version = await self._redis_call(redis_helper.client.get, self.VERSION_KEY)
+        if version is not None:
+            self._adopt_version(version)
+        return self._version
+
+    async def publish_version(self) -> str:
+        """Called after a successful sync: invalidates every cached result in all workers."""
+        version = str(time.time_ns())
+        self._adopt_version(version)
+        await self._redis_call(redis_helper.client.set, self.VERSION_KEY, version)
+        logger.info(f"Published analytics snapshot version {version}.")
+        return version
+
+    # --- Lookup ----------------------------------------------------------
+
+    @classmethod
+    def make_key(cls, metric: str, params: dict, version: str) -> str:
+        normalized = json.dumps(params, sort_keys=True, default=str, separators=(",", ":"))
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        return f"{cls.KEY_PREFIX}:{metric}:{version}:{digest}"
+
+    async def get_or_compute(self, metric: str, params: dict, compute: Callable[[], Awaitable[QueryResult]]) -> QueryResult:
+        key = self.make_key(metric, params, await self.current_version())
+
+        value = self._local.get(key, _MISSING)
+        if value is not _MISSING:
+            self._local_hit.inc()
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The owner request was cancelled (client gone); compute for ourselves
+                return await self.get_or_compute(metric, params, compute)
+
+        future = asyncio.get_running_loop().create_future()
+        # Avoid "exception was never retrieved" when nobody else was waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            value = await self._load_shared_or_compute(key, compute)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def peek(self, metric: str, params: dict) -> Optional[QueryResult]:
+        """Cached value from the local or shared tier without computing; None on a miss."""
+        key = self.make_key(metric, params, await self.current_version())
+        value = self._local.get(key, _MISSING)
+        if value is not _MISSING:
+            self._local_hit.inc()
+            return value
+        payload = await self._redis_call(redis_helper.binary_client.get, key)
+        if payload is None:
+            self._miss.inc()
+            return None
+        self.shared_hits += 1
+        self._shared_hit.inc()
+        value = QueryResult.from_arrow(payload)
+        self._local.set(key, value, size=len(payload), ttl=self._local_ttl)
+        return value
+
+    async def store(self, metric: str, params: dict, value: QueryResult):
+        """Caches a value computed outside get_or_compute (e.g. several metrics from one scan)."""
+        key = self.make_key(metric, params, await self.current_version())
+        await self._store(key, value)
+
+    async def _store(self, key: str, value: QueryResult):
+        payload = value.to_arrow()
+        self._local.set(key, value, size=len(payload), ttl=self._local_ttl)
+        await self._redis_call(redis_helper.binary_client.set, key, payload, ex=self._shared_ttl)
+
+    async def _load_shared_or_compute(self, key: str, compute: Callable[[], Awaitable[QueryResult]]) -> QueryResult:
+        payload = await self._redis_call(redis_helper.binary_client.get, key)
+        if payload is None and not await self._acquire_lock(key):
+            payload = await self._wait_for_shared(key)
+
+        if payload is not None:
+            self.shared_hits += 1
+            self._shared_hit.inc()
+            value = QueryResult.from_arrow(payload)
+            self._local.set(key, value, size=len(payload), ttl=self._local_ttl)
+            return value
+
+        try:
+            self.computations += 1
+            self._miss.inc()
+            value = await compute()
+            await self._store(key, value)
+            return value
+        finally:
+            await self._redis_call(redis_helper.binary_client.delete, f"{key}:lock")
+
+    async def _acquire_lock(self, key: str) -> bool:
+        """True if this worker should compute (lock taken or Redis unavailable)."""
+        acquired = await self._redis_call(
+            redis_helper.binary_client.set, f"{key}:lock", b"1", nx=True, ex=self._lock_timeout
+        )
+        return acquired is not False
+
+    async def _wait_for_shared(self, key: str) -> Optional[bytes]:
+        """Waits for another worker's result; None means it failed and we compute ourselves."""
+        deadline = time.monotonic() + self._lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.LOCK_POLL_INTERVAL)
+            payload = await self._redis_call(redis_helper.binary_client.get, key)
+            if payload is not None:
+                return payload
+            if not await self._redis_call(redis_helper.binary_client.exists, f"{key}:lock"):
+                return None
+        return None
+
+    @staticmethod
+    async def _redis_call(method, *args, **kwargs):
+        return await redis_helper.call(method, *args, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "version": self._version,
+            "local_hits": self._local.hits,
+            "local_misses": self._local.misses,
+            "shared_hits": self.shared_hits,
+            "computations": self.computations,
+            "local_entries": len(self._local),
+            "local_bytes": self._local.total_bytes,
+        }
+
+
+result_cache = AnalyticsResultCache()
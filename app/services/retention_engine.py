@@ -0,0 +1,151 @@
+import array
+from datetime import date, datetime, timedelta
+from typing import Literal, Optional
+
+import duckdb
+import numpy as np
+import pandas as pd
+from loguru import logger
+from pyroaring import BitMap
+
+from app.services.query_result import QueryResult
+
+RetentionMode = Literal["daily", "weekly"]
+
+GRAIN_STEP = {
+    "daily": timedelta(days=1),
+    "weekly": timedelta(weeks=1),
+}
+
+
+def to_bitmap(user_ids: np.ndarray) -> BitMap:
+    """Builds a roaring bitmap from INTEGER user ids (int32 reinterpreted as uint32)."""
+    ids = np.ascontiguousarray(user_ids, dtype=np.int32).view(np.uint32)
+    return BitMap(array.array("I", ids.tobytes()))
+
+
+def period_start(day: date, mode: RetentionMode) -> date:
+    return day - timedelta(days=day.weekday()) if mode == "weekly" else day
+
+
+class RetentionEngine:
+    """
+    Cohort retention over compressed bitmaps of user ids.
+
+    Sync stores two families of bitmaps per period (day and ISO week) in `retention_bitmaps`:
+    `active` - users with any event in the period, `cohort` - users first seen in the period.
+    Retention for cohort C after N periods is |cohort(C) & active(C + N)|, a bitmap
+    intersection cardinality that does not depend on the number of events.
+    """
+
+    # (grain, kind, source query returning (period, user_id) ordered by period)
+    SOURCES = {
+        ("daily", "active"): """
+            SELECT DISTINCT CAST(date_trunc('day', occurred_at) AS DATE) AS period, user_id
+            FROM synced_events
+            WHERE $since IS NULL OR occurred_at >= $since
+        """,
+        ("weekly", "active"): """
+            SELECT activity_week AS period, user_id
+            FROM user_activity_weeks
+            WHERE $since IS NULL OR activity_week >= $since
+        """,
+        ("daily", "cohort"): """
+            SELECT cohort_day AS period, user_id
+            FROM user_first_seen
+            WHERE $since IS NULL OR cohort_day >= $since
+        """,
+        ("weekly", "cohort"): """
+            SELECT cohort_week AS period, user_id
+            FROM user_first_seen
+            WHERE $since IS NULL OR cohort_week >= $since
+        """,
+    }
+
+    @staticmethod
+    def build_bitmaps(write_conn: duckdb.DuckDBPyConnection, since: Optional[datetime]):
+        """
+        Rebuilds bitmaps for every period that can contain events after `since`
+        (all periods when since is None). Earlier periods are left untouched.
+        """
+        write_conn.execute("""
+            CREATE TABLE IF NOT EXISTS retention_bitmaps (
+                grain VARCHAR NOT NULL,
+                kind VARCHAR NOT NULL,
+                period DATE NOT NULL,
+                bitmap BLOB NOT NULL
+            );
+        """)
+        if since is None:
+            write_conn.execute("DELETE FROM retention_bitmaps")
+
+        built = 0
+        for (grain, kind), source in RetentionEngine.SOURCES.items():
+            # One extra day of slack keeps the boundary safe across session time zones
+            boundary = period_start(since.date() - timedelta(days=1), grain) if since is not None else None
+            if boundary is not None:
+                write_conn.execute(
+                    "DELETE FROM retention_bitmaps WHERE grain = ? AND kind = ? AND period >= ?",
+                    [grain, kind, boundary],
+                )
+
+            rows = write_conn.execute(
+                f"SELECT period, user_id FROM ({source}) ORDER BY period", {"since": boundary}
+            ).fetchnumpy()
+            periods, user_ids = rows["period"], rows["user_id"]
+            if not len(periods):
+                continue
+
+            starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+            ends = np.r_[starts[1:], len(periods)]
+            bitmap_rows = pd.DataFrame({
+                "grain": grain,
+                "kind": kind,
+                "period": [periods[start].astype(date) for start in starts],
+                "bitmap": [to_bitmap(user_ids[start:end]).serialize() for start, end in zip(starts, ends)],
+            })
+            write_conn.register("bitmap_rows", bitmap_rows)
+            write_conn.execute("INSERT INTO retention_bitmaps SELECT grain, kind, period, bitmap FROM bitmap_rows")
+            write_conn.unregister("bitmap_rows")
+            built += len(bitmap_rows)
+
+        logger.info(f"Built {built} retention bitmaps.")
+
+    @staticmethod
+    def _load(read_conn: duckdb.DuckDBPyConnection, grain: str, kind: str, start: date, end: date) -> dict[date, BitMap]:
+        rows = read_conn.execute("""
+            SELECT period, bitmap
+            FROM retention_bitmaps
+            WHERE grain = ? AND kind = ? AND period BETWEEN ? AND ?
+        """, [grain, kind, start, end]).fetchall()
+        return {period: BitMap.deserialize(blob) for period, blob in rows}
+
+    @staticmethod
+    def get_retention(read_conn: duckdb.DuckDBPyConnection, start_date: date, windows: int,
+                      mode: RetentionMode = "weekly") -> QueryResult:
+        """
+        Cohorts start at the period containing start_date; period_number 0 is the cohort period.
+        Column names follow the grain: cohort_week/week_number or cohort_day/day_number.
+        """
+        step = GRAIN_STEP[mode]
+        first_period = period_start(start_date, mode)
+        cohorts = RetentionEngine._load(read_conn, mode, "cohort", first_period, date.max)
+        if not cohorts:
+            active = {}
+        else:
+            last_period = max(cohorts) + step * (windows - 1)
+            active = RetentionEngine._load(read_conn, mode, "active", first_period, last_period)
+
+        rows = []
+        for cohort_period in sorted(cohorts):
+            cohort = cohorts[cohort_period]
+            for number in range(windows):
+                activity = active.get(cohort_period + step * number)
+                if activity is None:
+                    continue
+                retained = cohort.intersection_cardinality(activity)
+                if retained:
+                    rows.append((cohort_period, number, retained))
+
+        unit = "week" if mode == "weekly" else "day"
+        return QueryResult([f"cohort_{unit}", f"{unit}_number", "retained_users"], rows)
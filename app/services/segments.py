@@ -0,0 +1,101 @@
+import re
+from typing import Iterable, Optional
+
+from app.core.config import settings
+
+# Property keys extracted from properties_json into dedicated columns during sync
+SEGMENT_PROPERTIES: list[str] = settings.analytics.segment_properties
+PROPERTY_PREFIX = "properties."
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_EXPRESSION = re.compile(r"^\s*(?P<field>[A-Za-z_][A-Za-z0-9_.]*)\s*[:=]\s*(?P<values>.+?)\s*$")
+
+for _key in SEGMENT_PROPERTIES:
+    if not _IDENTIFIER.match(_key):
+        raise ValueError(f"Invalid segment property name: {_key!r}")
+
+
+def property_column(key: str) -> str:
+    """DuckDB column holding properties_json->>key."""
+    return f"prop_{key}"
+
+
+PROPERTY_COLUMNS: list[str] = [property_column(key) for key in SEGMENT_PROPERTIES]
+
+
+class Segment:
+    """
+    Filter over event_type and extracted properties, e.g. from query strings
+    `segment=event_type:purchase` and `segment=properties.country=UA,PL`.
+    Values separated by commas are alternatives (IN); separate expressions are ANDed.
+    """
+
+    __slots__ = ("conditions",)
+
+    def __init__(self, conditions: Optional[dict[str, tuple[str, ...]]] = None):
+        # {column: sorted tuple of allowed values}
+        self.conditions: dict[str, tuple[str, ...]] = dict(sorted((conditions or {}).items()))
+
+    @classmethod
+    def parse(cls, expressions: Optional[Iterable[str]]) -> "Segment":
+        conditions: dict[str, tuple[str, ...]] = {}
+        for expression in expressions or []:
+            match = _EXPRESSION.match(expression)
+            if not match:
+                raise ValueError(f"Invalid segment {expression!r}, expected field:value")
+
+            field = match.group("field")
+            if field == "event_type":
+                column = "event_type"
+            elif field.startswith(PROPERTY_PREFIX) and field[len(PROPERTY_PREFIX):] in SEGMENT_PROPERTIES:
+                column = property_column(field[len(PROPERTY_PREFIX):])
+            else:
+                supported = ", ".join(["event_type", *(PROPERTY_PREFIX + key for key in SEGMENT_PROPERTIES)])
+                raise ValueError(f"Unsupported segment field {field!r}; supported: {supported}")
+
+            values = {value.strip() for value in match.group("values").split(",") if value.strip()}
+            if column in conditions:
+                values &= set(conditions[column])  # repeated field narrows the filter
+            conditions[column] = tuple(sorted(values))
+        return cls(conditions)
+
+    def __bool__(self) -> bool:
+        return bool(self.conditions)
+
+    def __str__(self) -> str:
+        """Canonical form, used in cache keys."""
+        return ";".join(f"{column}:{','.join(values)}" for column, values in self.conditions.items())
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Segment) and self.conditions == other.conditions
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+    def __getstate__(self):
+        return self.conditions
+
+    def __setstate__(self, state):
+        self.conditions = state
+
+    def where(self, alias: str = "") -> tuple[str, list]:
+        """SQL predicate (with ? placeholders) and its parameters; 'TRUE' for an empty segment."""
+        if not self.conditions:
+            return "TRUE", []
+        prefix = f"{alias}." if alias else ""
+        clauses, params = [], []
+        for column, values in self.conditions.items():
+            if not values:
+                return "FALSE", []
+            clauses.append(f"{prefix}{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+        return " AND ".join(clauses), params
+
+    @property
+    def event_types(self) -> Optional[tuple[str, ...]]:
+        return self.conditions.get("event_type")
+
+    @property
+    def sketchable(self) -> bool:
+        """True if per-event_type HyperLogLog sketches can answer this segment."""
+        return set(self.conditions) <= {"event_type"}
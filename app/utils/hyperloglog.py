@@ -0,0 +1,120 @@
+import math
+import zlib
+from typing import Iterable
+
+import numpy as np
+
+DEFAULT_PRECISION = 14
+
+# SplitMix64 finalizer constants. The hash is computed in numpy (not by DuckDB's
+# hash()) so every sketch in the service is reproducible from plain user ids.
+_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def hash_user_ids(user_ids) -> np.ndarray:
+    """Vectorized 64-bit hash of integer user ids."""
+    x = np.asarray(user_ids).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        x = x + _GAMMA
+        x = (x ^ (x >> np.uint64(30))) * _MIX_1
+        x = (x ^ (x >> np.uint64(27))) * _MIX_2
+    return x ^ (x >> np.uint64(31))
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Exact bit length of uint64 values (no float rounding)."""
+    values = values.copy()
+    length = np.zeros(values.shape, dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = values >= (np.uint64(1) << np.uint64(shift))
+        length[mask] += shift
+        values[mask] >>= np.uint64(shift)
+    length += (values > 0).astype(np.uint8)
+    return length
+
+
+def register_updates(hashes: np.ndarray, precision: int = DEFAULT_PRECISION) -> tuple[np.ndarray, np.ndarray]:
+    """Splits hashes into (register index, rank) pairs."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    tail_bits = 64 - precision
+    index = (hashes >> np.uint64(tail_bits)).astype(np.intp)
+    tail = hashes & np.uint64((1 << tail_bits) - 1)
+    rank = (tail_bits + 1 - _bit_length(tail)).astype(np.uint8)
+    return index, rank
+
+
+def estimate_counts(registers: np.ndarray) -> np.ndarray:
+    """Vectorized cardinality estimates for a (sketches, m) array of register rows."""
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimates = alpha * m * m / np.ldexp(1.0, -registers.astype(np.int32)).sum(axis=1)
+    zeros = np.count_nonzero(registers == 0, axis=1)
+    # Small-range correction: linear counting is far more accurate here.
+    small = (estimates <= 2.5 * m) & (zeros > 0)
+    estimates[small] = m * np.log(m / zeros[small])
+    return np.rint(estimates).astype(np.int64)
+
+
+class HyperLogLog:
+    """
+    Dense HyperLogLog sketch of distinct user ids.
+    Sketches with the same precision merge losslessly (register-wise max),
+    so per-day sketches can be combined into any longer period.
+    """
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: np.ndarray | None = None):
+        if not 4 <= precision <= 18:
+            raise ValueError("HyperLogLog precision must be between 4 and 18")
+        self.precision = precision
+        if registers is None:
+            registers = np.zeros(1 << precision, dtype=np.uint8)
+        elif registers.shape != (1 << precision,):
+            raise ValueError("Register array does not match sketch precision")
+        self.registers = registers
+
+    @property
+    def m(self) -> int:
+        return 1 << self.precision
+
+    @property
+    def relative_error(self) -> float:
+        """Relative standard error of the estimate (1.04 / sqrt(m))."""
+        return 1.04 / math.sqrt(self.m)
+
+    def add_hashes(self, hashes: np.ndarray) -> "HyperLogLog":
+        index, rank = register_updates(hashes, self.precision)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def add_user_ids(self, user_ids) -> "HyperLogLog":
+        return self.add_hashes(hash_user_ids(user_ids))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @classmethod
+    def union(cls, sketches: Iterable["HyperLogLog"], precision: int = DEFAULT_PRECISION) -> "HyperLogLog":
+        result = cls(precision)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def count(self) -> int:
+        return int(estimate_counts(self.registers)[0])
+
+    def to_bytes(self) -> bytes:
+        # Sparse sketches (quiet days) are mostly zero registers and compress well.
+        return zlib.compress(self.registers.tobytes(), 1)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        registers = np.frombuffer(zlib.decompress(data), dtype=np.uint8).copy()
+        return cls(int(registers.size).bit_length() - 1, registers)
@@ -0,0 +1,68 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """
+    In-process LRU cache bounded by entry count and by total payload size.
+    Entries may carry their own TTL; expired entries are dropped lazily on access.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # {key: (value, size, expires_at)}
+        self._entries: "OrderedDict[Hashable, tuple[Any, int, Optional[float]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not None
+
+    def _lookup(self, key: Hashable) -> Optional[tuple[Any, int, Optional[float]]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at = entry[2]
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.pop(key)
+            return None
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, size: int = 1, ttl: Optional[float] = None):
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # never evict the whole cache for a single oversized value
+        self.pop(key)
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._entries[key] = (value, size, expires_at)
+        self.total_bytes += size
+        while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self.total_bytes > self.max_bytes
+        ):
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self.total_bytes -= entry[1]
+        return entry[0]
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
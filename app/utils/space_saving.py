@@ -0,0 +1,65 @@
+import heapq
+from typing import Hashable, Iterable
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters summary (Metwally et al.): at most `capacity` counters.
+
+    When a new key arrives and the summary is full, the key with the smallest count is
+    evicted and the newcomer inherits that count (+ its own). Counts are therefore
+    overestimates by at most the inherited amount, which is tracked per key in `errors`.
+    Every key with a true frequency above total / capacity is guaranteed to be present.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.total = 0
+        self.counts: dict[Hashable, int] = {}
+        self.errors: dict[Hashable, int] = {}
+        # Min-heap of (count, seq, key); entries go stale on increment and are skipped lazily
+        self._heap: list[tuple[int, int, Hashable]] = []
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.counts
+
+    def _push(self, key: Hashable, count: int):
+        self._seq += 1
+        heapq.heappush(self._heap, (count, self._seq, key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, s, k) for c, s, k in self._heap if self.counts.get(k) == c]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> tuple[Hashable, int]:
+        while True:
+            count, _, key = heapq.heappop(self._heap)
+            if self.counts.get(key) == count:
+                return key, count
+
+    def add(self, key: Hashable, count: int = 1):
+        self.total += count
+        if key in self.counts:
+            self.counts[key] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = count
+            self.errors[key] = 0
+        else:
+            evicted, floor = self._pop_min()
+            del self.counts[evicted]
+            del self.errors[evicted]
+            self.counts[key] = floor + count
+            self.errors[key] = floor
+        self._push(key, self.counts[key])
+
+    def update(self, keys: Iterable[Hashable]):
+        for key in keys:
+            self.add(key)
+
+    def top(self, n: int) -> list[tuple[Hashable, int]]:
+        return heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
@@ -3,6 +3,8 @@ import asyncio
 from loguru import logger
 
 from app.services.analytics_service import analytics_service
+from app.services.live_counters import live_counters
+from app.services.rate_limiter import rate_limiter
 
 
 async def hourly_sync_task():
@@ -14,3 +16,21 @@ async def hourly_sync_task():
             logger.error(f"!!! Synchronization error: {e}")
 
         await asyncio.sleep(3600)
+
+
+async def live_counters_flush_task():
+    while True:
+        await asyncio.sleep(live_counters.flush_interval)
+        try:
+            await live_counters.flush()
+        except Exception as e:
+            logger.error(f"!!! Live counters flush error: {e}")
+
+
+async def rate_limiter_sync_task():
+    while True:
+        await asyncio.sleep(rate_limiter.sync_interval)
+        try:
+            await rate_limiter.sync()
+        except Exception as e:
+            logger.error(f"!!! Rate limiter sync error: {e}")
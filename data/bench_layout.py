@@ -0,0 +1,148 @@
+"""
+Benchmark of the synced_events layout: row order, event_type encoding and row group size.
+
+Builds the same synthetic events in several layouts and runs the date-range scans the
+analytics service does against synced_events (funnel step scan, incremental tail after
+the sync watermark, one-day distinct users). For each layout it reports the file size,
+the share of row groups whose occurred_at zone map overlaps the range (what DuckDB
+actually has to read) and the median query time.
+
+    python data/bench_layout.py --events 5000000 --days 180
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+EVENT_TYPES = ["view_item", "login", "add_to_cart", "search", "purchase", "logout", "share", "refund"]
+EVENT_WEIGHTS = [0.35, 0.2, 0.12, 0.12, 0.08, 0.07, 0.04, 0.02]
+START = date(2025, 1, 1)
+
+LAYOUTS = {
+    # name: (ORDER BY, event_type expression, keep event_id, row group size)
+    "scan order, varchar, event_id": (None, "event_type", True, None),
+    "day + event_type, varchar, event_id": (
+        "CAST(date_trunc('day', occurred_at) AS DATE), event_type, occurred_at", "event_type", True, None,
+    ),
+    "occurred_at + user_id, enum": ("occurred_at, user_id", "CAST(event_type AS event_type_enum)", False, None),
+    "occurred_at + user_id, enum, 61440 rows/group": (
+        "occurred_at, user_id", "CAST(event_type AS event_type_enum)", False, 61440,
+    ),
+    "occurred_at + user_id, enum, 30720 rows/group": (
+        "occurred_at, user_id", "CAST(event_type AS event_type_enum)", False, 30720,
+    ),
+}
+
+
+def generate_events(events: int, days: int, users: int) -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    seconds = rng.integers(0, days * 86400, events)
+    # Postgres returns rows in insertion order: most events arrive within minutes,
+    # a fifth are delayed client batches or backfills landing up to 30 days later
+    delay = np.where(rng.random(events) < 0.8, rng.exponential(300, events), rng.uniform(0, 30 * 86400, events))
+    order = np.argsort(seconds + delay)
+    return pd.DataFrame({
+        "event_id": [f"{i:032x}" for i in rng.integers(0, 2 ** 62, events)],
+        "occurred_at": pd.Timestamp(START, tz="UTC") + pd.to_timedelta(seconds[order], unit="s"),
+        "user_id": rng.integers(0, users, events).astype(np.int32),
+        "prop_country": rng.choice(["UA", "PL", "DE", "US"], events),
+        "session_id": None,
+        "event_type": rng.choice(EVENT_TYPES, events, p=EVENT_WEIGHTS),
+    })
+
+
+def build_layout(path: str, events: pd.DataFrame, order_by, event_type: str, keep_event_id: bool, row_group_size):
+    with duckdb.connect() as conn:
+        options = f" (ROW_GROUP_SIZE {row_group_size})" if row_group_size else ""
+        conn.execute(f"ATTACH '{path}' AS analytics{options}")
+        conn.execute("USE analytics")
+        conn.register("source_events", events)
+        conn.execute("CREATE TYPE event_type_enum AS ENUM (SELECT DISTINCT event_type FROM source_events ORDER BY 1)")
+        columns = ("event_id, " if keep_event_id else "") + f"occurred_at, user_id, prop_country, session_id, {event_type} AS event_type"
+        conn.execute(f"""
+            CREATE TABLE synced_events AS
+            SELECT {columns} FROM source_events
+            {f"ORDER BY {order_by}" if order_by else ""}
+        """)
+        conn.execute("CHECKPOINT")
+
+
+def row_groups_read(conn: duckdb.DuckDBPyConnection, low, high) -> float:
+    """Share of row groups whose occurred_at min/max overlaps [low, high)."""
+    stats = conn.execute("""
+        SELECT
+            row_group_id,
+            CAST(regexp_extract(stats, 'Min: ([^,\\]]+)', 1) AS TIMESTAMPTZ) AS min_ts,
+            CAST(regexp_extract(stats, 'Max: ([^,\\]]+)', 1) AS TIMESTAMPTZ) AS max_ts
+        FROM pragma_storage_info('synced_events')
+        WHERE column_name = 'occurred_at' AND segment_type <> 'VALIDITY'
+    """).fetchdf()
+    groups = stats.groupby("row_group_id").agg(min_ts=("min_ts", "min"), max_ts=("max_ts", "max"))
+    overlapping = (groups["max_ts"] >= pd.Timestamp(low, tz="UTC")) & (groups["min_ts"] < pd.Timestamp(high, tz="UTC"))
+    return overlapping.mean()
+
+
+def timed(conn: duckdb.DuckDBPyConnection, query: str, params: list, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(query, params).fetchall()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5_000_000)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    events = generate_events(args.events, args.days, args.users)
+    last_day = START + timedelta(days=args.days - 1)
+    week = (last_day - timedelta(days=30), last_day - timedelta(days=23))
+    queries = {
+        "funnel scan, 7 days": (
+            """
+            SELECT COUNT(DISTINCT user_id) FROM synced_events
+            WHERE occurred_at >= CAST(? AS DATE) AND occurred_at < CAST(? AS DATE)
+              AND event_type IN ('view_item', 'add_to_cart', 'purchase')
+            """,
+            list(week), week,
+        ),
+        "sync tail, last day": (
+            "SELECT user_id, COUNT(*) FROM synced_events WHERE occurred_at > CAST(? AS DATE) GROUP BY 1",
+            [last_day], (last_day, last_day + timedelta(days=1)),
+        ),
+        "one day, distinct users": (
+            """
+            SELECT COUNT(DISTINCT user_id) FROM synced_events
+            WHERE occurred_at >= CAST(? AS DATE) AND occurred_at < CAST(? AS DATE) + 1
+            """,
+            [week[0], week[0]], (week[0], week[0] + timedelta(days=1)),
+        ),
+    }
+
+    print(f"{args.events:,} events, {args.days} days, {args.users:,} users\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, layout in LAYOUTS.items():
+            path = os.path.join(tmp, f"{abs(hash(name))}.duckdb")
+            build_layout(path, events, *layout)
+            print(f"{name}: {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+            with duckdb.connect(path, read_only=True) as conn:
+                for query_name, (query, params, (low, high)) in queries.items():
+                    share = row_groups_read(conn, low, high)
+                    elapsed = timed(conn, query, params, args.repeat)
+                    print(f"  {query_name:<24} row groups read {share:6.1%}   {1000 * elapsed:8.1f} ms")
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark of logging overhead per ingest request.
+
+Replays the log calls one POST /api/events makes (pool checkout debug line, process_events
+summary, uvicorn access line through stdlib logging) under several logging setups and reports
+the time the request's own thread spends in them, plus the total including the writer thread
+draining to the file. Output goes to a temporary file, as it would to a container's stdout.
+
+    python data/bench_logging.py --requests 50000
+
+Needs the app settings (.env or APP_CONFIG__ environment variables), like the app itself.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.loguru_logger import FILE_FORMAT, setup_logging, shutdown_logging  # noqa: E402
+
+access_log = logging.getLogger("uvicorn.access")
+
+
+def request_eager(i: int):
+    """Log calls as they were: f-strings, formatted whatever the level."""
+    logger.debug("Using default engine for session.")
+    logger.info(f"Processed {1000} events: {1000 - i % 3} inserted, {i % 3} duplicates.")
+    access_log.info('%s - "%s %s HTTP/%s" %d', "10.0.0.1:52144", "POST", "/api/events", "1.1", 202)
+
+
+def request_lazy(i: int):
+    logger.debug("Using default engine for session.")
+    logger.info("Processed {} events: {} inserted, {} duplicates.", 1000, 1000 - i % 3, i % 3)
+    access_log.info('%s - "%s %s HTTP/%s" %d', "10.0.0.1:52144", "POST", "/api/events", "1.1", 202)
+
+
+def setup_before(path: str):
+    """The previous defaults: DEBUG, text lines, diagnose=True, queued file sink."""
+    logger.remove()
+    logger.add(path, level="DEBUG", format=FILE_FORMAT, backtrace=True, diagnose=True, enqueue=True)
+    logging.basicConfig(level=logging.DEBUG, force=True, handlers=[])
+    access_log.handlers.clear()
+    access_log.setLevel(logging.DEBUG)
+    access_log.propagate = False
+
+    class Intercept(logging.Handler):
+        def emit(self, record):
+            logger.opt(depth=6).log(record.levelname, record.getMessage())
+
+    access_log.addHandler(Intercept())
+
+
+def setup_json(path: str, level: str, sampled: bool):
+    cfg = settings.logging
+    cfg.level, cfg.format, cfg.file = level, "json", path
+    cfg.sample_rates = (
+        {"uvicorn.access": 20, "app.services.event_processor": 20, "__main__": 20} if sampled else {}
+    )
+    setup_logging()
+
+
+SCENARIOS = {
+    "before: DEBUG, text, diagnose, enqueue": (setup_before, request_eager),
+    "json, batched, INFO, eager f-strings": (lambda path: setup_json(path, "INFO", False), request_eager),
+    "json, batched, INFO, lazy": (lambda path: setup_json(path, "INFO", False), request_lazy),
+    "json, batched, INFO, lazy, sampled 20/s": (lambda path: setup_json(path, "INFO", True), request_lazy),
+}
+
+
+def run(setup, request, requests: int) -> tuple[float, float, int]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.log")
+        setup(path)
+        started = time.perf_counter()
+        for i in range(requests):
+            request(i)
+        caller = time.perf_counter() - started
+        shutdown_logging()
+        total = time.perf_counter() - started
+        with open(path, "rb") as f:
+            lines = sum(1 for _ in f)
+    return caller, total, lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'setup':<44} {'caller µs/req':>14} {'total µs/req':>13} {'lines':>8}")
+    for name, (setup, request) in SCENARIOS.items():
+        caller, total, lines = run(setup, request, args.requests)
+        print(f"{name:<44} {1e6 * caller / args.requests:>14.1f} {1e6 * total / args.requests:>13.1f} {lines:>8}")
+
+
+if __name__ == "__main__":
+    main()
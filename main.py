@@ -1,38 +1,52 @@
 import asyncio
 from contextlib import asynccontextmanager
 
-import redis.asyncio as redis
 import uvicorn
-from fastapi import FastAPI
-from fastapi_limiter import FastAPILimiter
+from fastapi import FastAPI, Response
 from loguru import logger
 
 from app.api.routers import main_router
 from app.core.config import settings
+from app.core.loguru_logger import setup_logging
+from app.core.metrics import MetricsMiddleware, mark_process_dead, render_metrics
+from app.core.tracing import ServerTimingMiddleware, setup_tracing, shutdown_tracing
 from app.db.db_helper import db_helper as db_lifespan
-from app.utils.tasks import hourly_sync_task
+from app.db.redis_helper import redis_helper
+from app.services.analytics_executor import analytics_executor
+from app.services.api_key_service import api_key_index
+from app.services.password_hasher import password_hasher
+from app.services.principal_cache import principal_cache
+from app.utils.tasks import hourly_sync_task, live_counters_flush_task, rate_limiter_sync_task
 
 
+setup_logging()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # startup
-    redis_client = redis.from_url(
-        "redis://redis:6379",
-        encoding="utf-8",
-        decode_responses=True
-    )
-    await FastAPILimiter.init(redis_client)
-
+    setup_tracing()
+    await db_lifespan.start()
     asyncio.create_task(hourly_sync_task())
+    asyncio.create_task(live_counters_flush_task())
+    asyncio.create_task(rate_limiter_sync_task())
+    asyncio.create_task(principal_cache.listen())
+    asyncio.create_task(api_key_index.listen())
 
     yield
 
     # shutdown
     logger.info("dispose db engine")
     await db_lifespan.dispose()
+    analytics_executor.shutdown()
+    password_hasher.shutdown()
+    await redis_helper.dispose()
+    mark_process_dead()
+    shutdown_tracing()
 
 main_app = FastAPI(lifespan=lifespan)
+main_app.add_middleware(ServerTimingMiddleware)
+main_app.add_middleware(MetricsMiddleware)
 main_app.include_router(
     main_router,
     prefix=settings.api.prefix,
@@ -41,6 +55,12 @@ main_app.include_router(
 )
 
 
+@main_app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     uvicorn.run("main:main_app",
                 host=settings.run.host,
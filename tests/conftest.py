@@ -0,0 +1,48 @@
+import duckdb
+import pytest
+
+from app.services import analytics_service as analytics_module
+from app.services.analytics_service import AnalyticsService, read_connection, write_connection
+
+
+class Snapshot:
+    """The DuckDB snapshot of a test, filled the way the sync fills it."""
+
+    # synced_events columns after occurred_at, in the order of the test events' fields
+    COLUMNS = "user_id INTEGER, event_type VARCHAR"
+    COUNTRY_COLUMNS = "user_id INTEGER, prop_country VARCHAR, event_type VARCHAR"
+    SESSION_COLUMNS = "user_id INTEGER, session_id VARCHAR, event_type VARCHAR"
+
+    def load(self, events, *steps, columns: str = COLUMNS, incremental: bool = True):
+        """
+        Replaces synced_events with `events` (occurred_at, then `columns`) and runs the sync steps
+        (`step(conn, since)`); returns the watermark they were given, None for a full rebuild.
+        """
+        with write_connection() as conn:
+            conn.execute(f"CREATE OR REPLACE TABLE synced_events (occurred_at TIMESTAMPTZ, {columns})")
+            placeholders = ", ".join("?" for _ in columns.split(","))
+            conn.executemany(f"INSERT INTO synced_events VALUES (CAST(? AS TIMESTAMPTZ), {placeholders})", events)
+            since = AnalyticsService._incremental_watermark(conn) if incremental else None
+            for step in steps:
+                step(conn, since)
+            AnalyticsService._save_sync_state(conn)
+            return since
+
+    def fetch(self, query: str) -> list[tuple]:
+        with read_connection() as conn:
+            return conn.execute(query).fetchall()
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    """Empty DuckDB file used by the analytics service for the test."""
+    db_file = tmp_path / "analytics.duckdb"
+    duckdb.connect(str(db_file)).close()
+    monkeypatch.setattr(analytics_module, "DUCKDB_FILE", str(db_file))
+    return db_file
+
+
+@pytest.fixture
+def snapshot(db_file):
+    """Fills and reads the test's DuckDB file through the service's own connections."""
+    return Snapshot()
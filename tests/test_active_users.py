@@ -0,0 +1,60 @@
+from datetime import date, datetime
+
+from app.services.analytics_service import AnalyticsService
+from app.services.segments import Segment
+
+
+def load_sketches(snapshot, events, incremental=True):
+    snapshot.load(
+        events, AnalyticsService._build_hourly_sketches, AnalyticsService._build_daily_sketches, incremental=incremental
+    )
+    return (
+        snapshot.fetch("SELECT hour, event_type, registers FROM hourly_user_sketches ORDER BY ALL"),
+        snapshot.fetch("SELECT day, event_type, registers FROM daily_user_sketches ORDER BY ALL"),
+    )
+
+
+def test_time_zone_buckets_and_rolling_windows(snapshot):
+    load_sketches(snapshot, [
+        ("2025-08-04 10:00:00+00", 1, "login"),
+        ("2025-08-04 22:30:00+00", 2, "login"),     # already 2025-08-05 in Kyiv (UTC+3)
+        ("2025-08-06 09:00:00+00", 3, "purchase"),
+        ("2025-08-11 09:00:00+00", 1, "purchase"),
+    ])
+
+    utc = AnalyticsService.get_active_users(date(2025, 8, 4), date(2025, 8, 6))
+    kyiv = AnalyticsService.get_active_users(date(2025, 8, 4), date(2025, 8, 6), tz="Europe/Kyiv")
+    hourly = AnalyticsService.get_active_users(date(2025, 8, 5), date(2025, 8, 5), "hour", tz="Europe/Kyiv")
+    rolling = AnalyticsService.get_active_users(date(2025, 8, 9), date(2025, 8, 12), rolling_days=7)
+    purchases = AnalyticsService.get_active_users(
+        date(2025, 8, 4), date(2025, 8, 17), "week", segment=Segment.parse(["event_type:purchase"])
+    )
+
+    assert utc.rows == [(date(2025, 8, 4), 2), (date(2025, 8, 6), 1)]
+    assert kyiv.rows == [(date(2025, 8, 4), 1), (date(2025, 8, 5), 1), (date(2025, 8, 6), 1)]
+    assert [(period.isoformat(), users) for period, users in hourly.rows] == [("2025-08-05T01:00:00+03:00", 1)]
+    assert rolling.rows == [
+        (date(2025, 8, 9), 3), (date(2025, 8, 10), 3), (date(2025, 8, 11), 2), (date(2025, 8, 12), 2),
+    ]
+    assert purchases.rows == [(date(2025, 8, 4), 1), (date(2025, 8, 11), 1)]
+
+
+def test_incremental_sketches_match_full_rebuild(snapshot):
+    events = [
+        ("2025-08-04 10:00:00+00", 1, "login"),
+        ("2025-08-04 10:40:00+00", 2, "login"),
+    ]
+    load_sketches(snapshot, events)
+
+    events += [
+        ("2025-08-04 10:50:00+00", 3, "purchase"),  # same hour as the previous watermark
+        ("2025-08-04 13:00:00+00", 1, "login"),
+        ("2025-08-05 09:00:00+00", 2, "login"),
+    ]
+    incremental = load_sketches(snapshot, events)
+    full = load_sketches(snapshot, events, incremental=False)
+
+    assert incremental == full
+    assert AnalyticsService.get_active_users(date(2025, 8, 4), date(2025, 8, 4), "hour").rows[0] == (
+        datetime.fromisoformat("2025-08-04T10:00:00+00:00"), 3
+    )
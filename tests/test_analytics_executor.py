@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.analytics_executor import AnalyticsExecutor, AnalyticsLane, QueryTimeout, QueueTimeout
+
+
+def slow_query(conn):
+    return conn.execute("SELECT count(*) FROM range(10000000000) a").fetchall()
+
+
+def fast_query(conn):
+    return conn.execute("SELECT 42").fetchone()[0]
+
+
+def sleeping_query(conn, seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+pytestmark = pytest.mark.usefixtures("db_file")
+
+
+@pytest.mark.asyncio
+async def test_timeout_interrupts_running_query():
+    lane = AnalyticsLane("test", workers=1, timeout=0.3, queue_timeout=5)
+    started = time.monotonic()
+
+    with pytest.raises(QueryTimeout):
+        await lane.run(slow_query, {})
+
+    # The worker is freed by interrupt(), not by the query finishing
+    assert await lane.run(fast_query, {}) == 42
+    assert time.monotonic() - started < 5
+    assert lane.stats()["timeouts"] == 1
+    lane.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_heavy_lane_does_not_block_cheap_queries():
+    executor = AnalyticsExecutor()
+    executor.lanes["heavy"] = AnalyticsLane("heavy", workers=1, timeout=2, queue_timeout=5)
+    heavy = asyncio.create_task(executor.run("funnel", slow_query))
+    await asyncio.sleep(0.1)
+
+    assert await asyncio.wait_for(executor.run("dau", fast_query), timeout=1) == 42
+
+    heavy.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await heavy
+    assert executor.stats()["heavy"]["cancelled"] == 1
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_queue_wait_does_not_count_against_timeout():
+    lane = AnalyticsLane("test", workers=1, timeout=0.5, queue_timeout=5)
+
+    # The second query waits ~0.4s for the worker, then runs 0.3s: over 0.5s in total, within it once started
+    results = await asyncio.gather(
+        lane.run(sleeping_query, {"seconds": 0.4}), lane.run(sleeping_query, {"seconds": 0.3})
+    )
+
+    assert results == [0.4, 0.3]
+    assert lane.stats()["timeouts"] == 0
+    lane.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_drops_unstarted_query():
+    lane = AnalyticsLane("test", workers=1, timeout=5, queue_timeout=0.2)
+    busy = asyncio.create_task(lane.run(sleeping_query, {"seconds": 0.6}))
+    await asyncio.sleep(0.05)
+
+    with pytest.raises(QueueTimeout):
+        await lane.run(fast_query, {})
+
+    assert await busy == 0.6
+    stats = lane.stats()
+    assert (stats["queue_timeouts"], stats["timeouts"], stats["queued"]) == (1, 0, 0)
+    lane.shutdown()
@@ -0,0 +1,61 @@
+import asyncio
+from datetime import date
+
+import pytest
+from pydantic import TypeAdapter
+
+from app.db.redis_helper import redis_helper
+from app.schemas.analytics import MetricSpec
+from app.services import analytics_jobs as jobs_module
+from app.services.analytics_jobs import AnalyticsJobs
+from app.services.query_result import QueryResult
+from app.services.result_cache import AnalyticsResultCache
+
+SPEC = TypeAdapter(MetricSpec).validate_python({"metric": "sessions", "from_date": "2025-08-01", "to_date": "2025-08-31"})
+
+
+@pytest.fixture
+def jobs(mocker):
+    # Local state only: behave as if Redis is down
+    mocker.patch.object(type(redis_helper), "available", new_callable=mocker.PropertyMock, return_value=False)
+    mocker.patch.object(jobs_module, "result_cache", AnalyticsResultCache())
+    return AnalyticsJobs()
+
+
+@pytest.mark.asyncio
+async def test_identical_jobs_are_deduplicated(jobs, mocker):
+    calls = 0
+
+    async def run(metric, func, lane=None, **params):
+        nonlocal calls
+        calls += 1
+        assert lane == "jobs"
+        await asyncio.sleep(0.05)
+        return QueryResult(["date", "sessions"], [(params["from_date"], 3)])
+
+    mocker.patch.object(jobs_module.analytics_executor, "run", side_effect=run)
+
+    first, second = await asyncio.gather(jobs.submit(SPEC), jobs.submit(SPEC))
+    assert first["job_id"] == second["job_id"]
+    assert first["status"] == "queued"
+
+    job = await jobs.wait(first["job_id"], timeout=5)
+    assert job["status"] == "done"
+    assert (await jobs.result(job["job_id"])).rows == [(date(2025, 8, 1), 3)]
+    # A finished job is returned as is, not recomputed
+    assert (await jobs.submit(SPEC))["status"] == "done"
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_job_can_be_resubmitted(jobs, mocker):
+    run = mocker.patch.object(jobs_module.analytics_executor, "run", side_effect=RuntimeError("boom"))
+
+    job = await jobs.submit(SPEC)
+    job = await jobs.wait(job["job_id"], timeout=5)
+    assert job["status"] == "failed"
+    assert job["error"] == "boom"
+
+    await jobs.submit(SPEC)
+    await jobs.wait(job["job_id"], timeout=5)
+    assert run.call_count == 2
@@ -0,0 +1,52 @@
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import RateLimit
+from app.db.models.users import User as DBUser
+from app.services.api_key_service import (
+    SCOPE_INGEST, SCOPE_READ, ApiKeyEntry, ApiKeyIndex, generate_api_key, hash_api_key,
+)
+
+
+@pytest.fixture
+def index():
+    index = ApiKeyIndex()
+    key_id, key = generate_api_key()
+    index._entries[key_id] = ApiKeyEntry(
+        key_id=key_id,
+        key_hash=bytes.fromhex(hash_api_key(key)),
+        scopes=frozenset({SCOPE_INGEST}),
+        quota=RateLimit(times=3, seconds=60),
+        user=DBUser(id=5, username="collector", disabled=False),
+    )
+    index.key = key
+    return index
+
+
+def test_key_is_verified_from_memory(index):
+    assert index.authenticate(index.key, SCOPE_INGEST).user.id == 5
+
+    forged = index.key[:-4] + ("AAAA" if not index.key.endswith("AAAA") else "BBBB")
+    for bad_key in (forged, "ek_0000000000000000_secret", "not-a-key"):
+        with pytest.raises(HTTPException) as error:
+            index.authenticate(bad_key, SCOPE_INGEST)
+        assert error.value.status_code == 401
+
+    with pytest.raises(HTTPException) as error:
+        index.authenticate(index.key, SCOPE_READ)
+    assert error.value.status_code == 403
+
+
+def test_quota_per_minute(index, mocker):
+    clock = mocker.patch("app.services.rate_limiter.time.monotonic", return_value=600.0)
+    for _ in range(3):
+        index.authenticate(index.key, SCOPE_INGEST)
+
+    with pytest.raises(HTTPException) as error:
+        index.authenticate(index.key, SCOPE_INGEST)
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "20"
+
+    clock.return_value = 620.0
+    assert index.authenticate(index.key, SCOPE_INGEST).user.username == "collector"
+    assert index.stats()["throttled"] == 1
@@ -0,0 +1,78 @@
+from datetime import date, datetime, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import urls_analytics
+from app.db.models.users import User as DBUser
+from app.db.redis_helper import redis_helper
+from app.schemas.analytics import BatchRequest
+from app.services.api_key_service import get_read_principal
+from app.services.analytics_batch import plan_query, run_batch
+from app.services.analytics_service import AnalyticsService
+from app.services.live_counters import LiveEventCounters
+from app.services.rate_limiter import rate_limiter
+from app.services.result_cache import AnalyticsResultCache
+from app.services.retention_engine import RetentionEngine
+
+EVENTS = [
+    ("2025-08-04 10:00:00+00", 1, "UA", "login"),
+    ("2025-08-04 11:00:00+00", 1, "UA", "purchase"),
+    ("2025-08-04 12:00:00+00", 2, "PL", "login"),
+    ("2025-08-05 10:00:00+00", 2, "PL", "login"),
+    ("2025-08-11 10:00:00+00", 1, "UA", "login"),
+]
+
+
+@pytest.fixture
+def events_snapshot(snapshot):
+    snapshot.load(
+        EVENTS,
+        AnalyticsService._update_user_cohorts, RetentionEngine.build_bitmaps, AnalyticsService._build_segment_rollups,
+        columns=snapshot.COUNTRY_COLUMNS,
+    )
+    return snapshot
+
+
+def test_batch_matches_single_queries(events_snapshot):
+    request = BatchRequest.model_validate({"metrics": [
+        {"metric": "dau", "from_date": "2025-08-01", "to_date": "2025-08-31"},
+        {"metric": "top_events", "from_date": "2025-08-01", "to_date": "2025-08-31", "limit": 1},
+        {"metric": "top_events", "from_date": "2025-08-01", "to_date": "2025-08-31"},
+        {"metric": "retention", "start_date": "2025-08-04", "windows": 2, "segment": ["event_type:login"]},
+    ]})
+    queries = [plan_query(spec) for spec in request.metrics]
+
+    results = run_batch(queries)
+
+    assert results == [query.func(**query.params) for query in queries]
+    assert results[1].rows == [("login", 4)]
+    assert results[0].rows == [(date(2025, 8, 4), 2), (date(2025, 8, 5), 1), (date(2025, 8, 11), 1)]
+
+
+def test_batch_top_events_include_live_counts(events_snapshot, mocker):
+    mocker.patch.object(type(redis_helper), "available", new_callable=mocker.PropertyMock, return_value=False)
+    mocker.patch.object(rate_limiter, "hit", return_value=0)
+    mocker.patch.object(urls_analytics, "result_cache", AnalyticsResultCache())
+    live = LiveEventCounters()
+    mocker.patch.object(urls_analytics, "live_counters", live)
+    # Ingested after the snapshot: "purchase" overtakes "login", "signup" is not in the snapshot at all
+    occurred_at = datetime(2025, 8, 12, tzinfo=timezone.utc)
+    live.record([(event_type, occurred_at) for event_type in ["purchase"] * 4 + ["signup"] * 2])
+    app = FastAPI()
+    app.include_router(urls_analytics.analytics_router)
+    app.dependency_overrides[get_read_principal] = lambda: DBUser(id=1, username="reader", disabled=False)
+    client = TestClient(app)
+    query = {"from_date": "2025-08-01", "to_date": "2025-08-31", "limit": 2}
+
+    single = client.get("/stats/top-events", params=query).json()["data"]
+    batch = client.post("/stats/batch", json={"metrics": [
+        {"metric": "top_events", **query},
+        {"metric": "top_events", **query, "live": False},
+    ]}).json()["results"]
+
+    assert batch[0]["data"] == single == [
+        {"event_type": "purchase", "total_count": 5}, {"event_type": "login", "total_count": 4},
+    ]
+    assert batch[1]["data"] == [{"event_type": "login", "total_count": 4}, {"event_type": "purchase", "total_count": 1}]
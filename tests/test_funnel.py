@@ -0,0 +1,55 @@
+from datetime import date
+
+import pytest
+
+from app.services.analytics_service import AnalyticsService
+from app.services.segments import Segment
+
+STEPS = ["view_item", "add_to_cart", "purchase"]
+
+
+@pytest.fixture
+def events_snapshot(snapshot):
+    events = [
+        # user 1: full funnel within an hour
+        ("2025-08-04 10:00:00+00", 1, "UA", "view_item"),
+        ("2025-08-04 10:10:00+00", 1, "UA", "add_to_cart"),
+        ("2025-08-04 10:20:00+00", 1, "UA", "purchase"),
+        # user 2: purchase comes after the window of the first view, but within the window of the second
+        ("2025-08-04 10:00:00+00", 2, "PL", "view_item"),
+        ("2025-08-05 09:00:00+00", 2, "PL", "view_item"),
+        ("2025-08-05 09:30:00+00", 2, "PL", "add_to_cart"),
+        ("2025-08-05 12:00:00+00", 2, "PL", "purchase"),
+        # user 3: steps out of order
+        ("2025-08-04 10:00:00+00", 3, "UA", "add_to_cart"),
+        ("2025-08-04 11:00:00+00", 3, "UA", "view_item"),
+        # user 4: cart too late
+        ("2025-08-04 10:00:00+00", 4, "UA", "view_item"),
+        ("2025-08-06 10:00:00+00", 4, "UA", "add_to_cart"),
+    ]
+    snapshot.load(events, columns=snapshot.COUNTRY_COLUMNS)
+    return snapshot
+
+
+def test_ordered_steps_within_window(events_snapshot):
+    result = AnalyticsService.get_funnel(date(2025, 8, 1), date(2025, 8, 31), STEPS, window_hours=24)
+
+    assert result.rows == [
+        (1, "view_item", 4, 1.0),
+        (2, "add_to_cart", 2, 0.5),
+        (3, "purchase", 2, 0.5),
+    ]
+
+
+def test_funnel_by_segment(events_snapshot):
+    result = AnalyticsService.get_funnel(
+        date(2025, 8, 1), date(2025, 8, 31), STEPS, window_hours=24, segment=Segment.parse(["properties.country:UA"])
+    )
+
+    assert result.column("users") == [3, 1, 1]
+
+
+def test_first_step_must_be_in_range(events_snapshot):
+    result = AnalyticsService.get_funnel(date(2025, 8, 5), date(2025, 8, 5), STEPS, window_hours=24)
+
+    assert result.column("users") == [1, 1, 1]
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from app.utils.hyperloglog import HyperLogLog, hash_user_ids
+
+
+@pytest.mark.parametrize("n_users", [10, 1_000, 200_000])
+def test_count_within_error_bound(n_users):
+    sketch = HyperLogLog().add_user_ids(np.arange(n_users))
+
+    assert abs(sketch.count() - n_users) <= max(1, 4 * sketch.relative_error * n_users)
+
+
+def test_merge_equals_union():
+    day_1 = HyperLogLog().add_user_ids(np.arange(0, 60_000))
+    day_2 = HyperLogLog().add_user_ids(np.arange(40_000, 100_000))
+    both = HyperLogLog().add_user_ids(np.arange(0, 100_000))
+
+    merged = HyperLogLog.union([day_1, day_2])
+
+    assert np.array_equal(merged.registers, both.registers)
+
+
+def test_duplicates_do_not_change_sketch():
+    once = HyperLogLog().add_user_ids([1, 2, 3])
+    repeated = HyperLogLog().add_user_ids([1, 2, 3, 3, 2, 1])
+
+    assert np.array_equal(once.registers, repeated.registers)
+
+
+def test_serialization_roundtrip():
+    sketch = HyperLogLog(precision=12).add_user_ids(np.arange(5_000))
+
+    restored = HyperLogLog.from_bytes(sketch.to_bytes())
+
+    assert restored.precision == 12
+    assert restored.count() == sketch.count()
+
+
+def test_hash_is_deterministic():
+    assert np.array_equal(hash_user_ids([1, 2, 3]), hash_user_ids(np.array([1, 2, 3], dtype=np.int32)))
+    assert len(set(hash_user_ids(np.arange(10_000)).tolist())) == 10_000
@@ -4,7 +4,10 @@ from datetime import datetime, timedelta
 import uuid
 from typing import List
 
+from app.db.redis_helper import redis_helper
+from app.services import event_processor
 from app.services.event_processor import process_events
+from app.services.live_counters import LiveEventCounters
 from app.schemas.events import EventSchema
 
 
@@ -55,16 +58,47 @@ def sample_events() -> List[EventSchema]:
 @pytest.mark.asyncio
 async def test_event_idempotency_counting(sample_events, mocker):
     mock_conn = AsyncMock()
-    mock_connect = mocker.patch('asyncpg.connect', return_value=mock_conn)
+    # Four events, one of them repeats an event_id
+    mock_conn.fetch.return_value = [(e.event_type, e.occurred_at) for e in sample_events[:2] + sample_events[3:]]
+    mock_raw_connection = mocker.patch('app.db.db_helper.db_helper.raw_connection')
+    mock_raw_connection.return_value.__aenter__.return_value = mock_conn
 
     events_list = sample_events
     result_count = await process_events(events_list)
 
-    mock_connect.assert_called_once()
-    mock_conn.close.assert_called_once()
+    mock_raw_connection.assert_called_once()
+    mock_raw_connection.return_value.__aexit__.assert_called_once()
 
-    query_insert_call = mock_conn.executemany.call_args[0][0]
+    query_insert_call = mock_conn.fetch.call_args[0][0]
     expected_clause = "ON CONFLICT (event_id) DO NOTHING"
     assert expected_clause in query_insert_call, "Запит INSERT повинен містити ON CONFLICT (event_id) DO NOTHING"
 
     assert result_count == len(events_list), "Функція повинна повертати загальну кількість подій, надісланих для обробки"
+
+
+@pytest.mark.asyncio
+async def test_retried_batch_does_not_change_live_counts(sample_events, mocker):
+    mocker.patch.object(type(redis_helper), "available", new_callable=mocker.PropertyMock, return_value=False)
+    live = mocker.patch.object(event_processor, "live_counters", LiveEventCounters())
+    stored = set()
+
+    async def insert(query, ids, event_ids, user_ids, occurred_at, event_types, properties):
+        # ON CONFLICT (event_id) DO NOTHING ... RETURNING event_type, occurred_at
+        rows = []
+        for event_id, event_type, ts in zip(event_ids, event_types, occurred_at):
+            if event_id not in stored:
+                stored.add(event_id)
+                rows.append((event_type, ts))
+        return rows
+
+    mock_conn = AsyncMock()
+    mock_conn.fetch.side_effect = insert
+    mocker.patch('app.db.db_helper.db_helper.raw_connection').return_value.__aenter__.return_value = mock_conn
+    today = sample_events[0].occurred_at.date()
+
+    await process_events(sample_events)
+    counts = await live.top_events(today, today, 10)
+    await process_events(sample_events)
+
+    assert dict(counts) == {"app_opened": 1, "item_view": 1, "purchase": 1}
+    assert await live.top_events(today, today, 10) == counts
@@ -0,0 +1,56 @@
+from datetime import date, datetime, timezone
+
+import pytest
+
+from app.db.redis_helper import redis_helper
+from app.services.live_counters import LiveEventCounters
+from app.services.query_result import QueryResult
+from app.utils.space_saving import SpaceSaving
+
+
+def make_event(event_type: str, day: int = 5) -> tuple[str, datetime]:
+    """An inserted row as process_events passes it: (event_type, occurred_at)."""
+    return event_type, datetime(2025, 8, day, 12, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def counters(mocker):
+    mocker.patch.object(type(redis_helper), "available", new_callable=mocker.PropertyMock, return_value=False)
+    return LiveEventCounters()
+
+
+def test_space_saving_keeps_heavy_hitters():
+    summary = SpaceSaving(capacity=5)
+    summary.update(["a"] * 50 + ["b"] * 30 + [f"noise{i}" for i in range(40)] + ["a"] * 10)
+
+    assert len(summary) == 5
+    assert summary.total == 130
+    assert [key for key, _ in summary.top(2)] == ["a", "b"]
+    # b is above total / capacity, so it must survive; counts never underestimate
+    assert summary.counts["a"] - summary.errors["a"] <= 60 <= summary.counts["a"]
+
+
+@pytest.mark.asyncio
+async def test_live_counts_filter_by_date_and_type(counters):
+    counters.record([make_event("click"), make_event("click"), make_event("view"), make_event("click", day=20)])
+
+    assert await counters.top_events(date(2025, 8, 1), date(2025, 8, 10), 10) == [("click", 2), ("view", 1)]
+    assert await counters.top_events(date(2025, 8, 1), date(2025, 8, 31), 10, ("view",)) == [("view", 1)]
+
+
+@pytest.mark.asyncio
+async def test_sync_drops_covered_buckets(counters, mocker):
+    counters.record([make_event("click")])
+    mocker.patch("app.services.live_counters.time.time", return_value=10 ** 10)
+
+    await counters.advance(snapshot_started_at=10 ** 10)
+
+    assert await counters.top_events(date(2025, 8, 1), date(2025, 8, 31), 10) == []
+
+
+def test_merge_with_history():
+    history = QueryResult(["event_type", "total_count"], [("view", 100), ("click", 90), ("purchase", 5)])
+
+    merged = LiveEventCounters.merge_top_events(history, [("click", 20), ("purchase", 1)], limit=2)
+
+    assert merged.rows == [("click", 110), ("view", 100)]
@@ -0,0 +1,60 @@
+import io
+import logging
+
+import orjson
+from loguru import logger
+
+from app.core.config import settings
+from app.core.loguru_logger import BatchedJsonSink, RateSampler, setup_logging, shutdown_logging
+
+
+def test_sampled_json_lines_are_written_in_batches():
+    stream = io.BytesIO()
+    sink = BatchedJsonSink(stream, batch_size=1000, flush_interval=60, max_pending=1000)
+    sampler = RateSampler({"tests": 2})
+    handler_id = logger.add(sink, level="INFO", format=lambda record: "{message}", filter=sampler)
+    try:
+        for i in range(5):
+            logger.info("batch {} processed", i)
+        logger.debug("below the level")
+        logger.warning("never sampled")
+        # Nothing is written on the logging call itself
+        assert stream.getvalue() == b""
+    finally:
+        logger.remove(handler_id)
+
+    lines = [orjson.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["msg"] for line in lines] == ["batch 0 processed", "batch 1 processed", "never sampled"]
+    assert lines[0]["logger"] == "tests.test_logging"
+    assert lines[2]["level"] == "WARNING"
+
+
+def test_dropped_records_are_reported_with_the_next_one(mocker):
+    sampler = RateSampler({"app.services": 1})
+    clock = mocker.patch("app.core.loguru_logger.time.monotonic", return_value=100.0)
+    info = logger.level("INFO")
+
+    def record():
+        return {"level": info, "name": "app.services.event_processor", "extra": {}}
+
+    assert sampler(record())
+    assert not sampler(record())
+    assert not sampler(record())
+    clock.return_value = 101.0
+    passed = record()
+    assert sampler(passed)
+    assert passed["extra"]["sampled_out"] == 2
+    # Loggers without a rate are never sampled
+    assert all(sampler({**record(), "name": "app.db.db_helper"}) for _ in range(5))
+
+
+def test_loguru_only_level_applies_to_stdlib_loggers(tmp_path, mocker):
+    mocker.patch.object(settings.logging, "level", "TRACE")
+    mocker.patch.object(settings.logging, "file", str(tmp_path / "app.log"))
+    try:
+        setup_logging()
+        assert logging.getLogger().level == logger.level("TRACE").no
+        assert logging.getLogger("uvicorn.access").isEnabledFor(logging.DEBUG)
+        assert logging.getLogger("sqlalchemy").level == logging.WARNING
+    finally:
+        shutdown_logging()
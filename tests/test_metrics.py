@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.core.metrics import MetricsMiddleware, render_metrics
+from app.schemas.events import EventSchema
+from app.services.event_processor import process_events
+
+
+def sample(name: str, labels: dict | None = None) -> float:
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_process_events_counts_inserted_and_duplicates(mocker):
+    mock_conn = mocker.AsyncMock()
+    mocker.patch("app.db.db_helper.db_helper.raw_connection").return_value.__aenter__.return_value = mock_conn
+    now = datetime.now(timezone.utc)
+    mock_conn.fetch.return_value = [("app_opened", now)] * 2
+    events = [
+        EventSchema(event_id=str(uuid.uuid4()), user_id=i, occurred_at=now, event_type="app_opened", properties_json={})
+        for i in range(5)
+    ]
+    ingested, duplicated = sample("events_ingested_total"), sample("events_duplicated_total")
+    batches = sample("ingest_batch_events_count")
+
+    assert await process_events(events) == 5
+
+    assert sample("events_ingested_total") - ingested == 2
+    assert sample("events_duplicated_total") - duplicated == 3
+    assert sample("ingest_batch_events_count") - batches == 1
+    # One statement for the whole batch, columns passed as arrays
+    args = mock_conn.fetch.call_args[0]
+    assert "unnest" in args[0] and len(args) == 7 and len(args[2]) == 5
+
+
+def test_request_latency_is_labelled_by_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    for item_id in (1, 2):
+        assert client.get(f"/items/{item_id}").status_code == 200
+    assert client.get("/nowhere").status_code == 404
+
+    labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    assert sample("http_request_duration_seconds_count", labels) == 2
+    assert sample("http_request_duration_seconds_count", {"method": "GET", "route": "unmatched", "status": "404"}) == 1
+
+    body, content_type = render_metrics()
+    assert content_type.startswith("text/plain")
+    assert b'route="/items/{item_id}"' in body
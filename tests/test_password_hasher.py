@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+
+from app.db.db_helper import db_helper
+from app.schemas.users import UserCreate
+from app.services.auth_service import auth_service
+from app.services.password_hasher import HasherBusy, PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, max_pending=2, rounds=4)
+    yield hasher
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_hash_verify_and_rehash(hasher):
+    hashed = await hasher.hash("s3cret")
+
+    assert await hasher.verify("s3cret", hashed)
+    assert not await hasher.verify("wrong", hashed)
+    assert not hasher.needs_rehash(hashed)
+    assert PasswordHasher(workers=1, max_pending=1, rounds=12).needs_rehash(hashed)
+
+
+@pytest.mark.asyncio
+async def test_event_loop_stays_responsive_and_queue_is_bounded():
+    hasher = PasswordHasher(workers=1, max_pending=2, rounds=12)
+    await hasher.hash("warm-up")  # start the worker process
+    try:
+        hashes = [asyncio.create_task(hasher.hash("x")) for _ in range(3)]
+        await asyncio.sleep(0)
+        with pytest.raises(HasherBusy):
+            await hasher.hash("one too many")
+
+        # Ticks keep running while bcrypt works in the other process
+        delays = []
+        while not all(task.done() for task in hashes):
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            delays.append(time.perf_counter() - started)
+        await asyncio.gather(*hashes)
+
+        assert max(delays) < 0.1
+        assert hasher.stats()["rejected"] == 1
+    finally:
+        hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_registration_hashes_before_taking_a_db_connection(mocker):
+    calls = []
+
+    async def hash_password(password):
+        calls.append("hash")
+        return "hashed"
+
+    def open_session():
+        calls.append("session")
+        session = mocker.MagicMock(connection=mocker.AsyncMock(), commit=mocker.AsyncMock())
+        return mocker.MagicMock(
+            __aenter__=mocker.AsyncMock(return_value=session), __aexit__=mocker.AsyncMock(return_value=False),
+        )
+
+    mocker.patch("app.services.auth_service.get_password_hash", hash_password)
+    mocker.patch.object(db_helper, "session_factory", side_effect=open_session)
+
+    user = await auth_service.register_user(UserCreate(username="carol", password="s3cret"))
+
+    assert calls == ["hash", "session"]
+    assert user.hashed_password == "hashed"
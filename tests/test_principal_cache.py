@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.api.urls_system import system_router
+from app.api.urls_user import user_router
+from app.core.config import settings
+from app.db.db_helper import db_helper
+from app.db.models.users import User as DBUser
+from app.db.redis_helper import redis_helper
+from app.services import jwt_service as jwt_module
+from app.services.jwt_service import TOKEN_TYPE_ACCESS, JWTService, get_current_user
+from app.services.principal_cache import PrincipalCache
+
+
+@pytest.fixture
+def cache(mocker):
+    # Local tier only: behave as if Redis is down
+    mocker.patch.object(type(redis_helper), "available", new_callable=mocker.PropertyMock, return_value=False)
+    cache = PrincipalCache()
+    mocker.patch.object(jwt_module, "principal_cache", cache)
+    mocker.patch("app.services.auth_service.principal_cache", cache)
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_user_is_loaded_once_until_invalidated(cache, mocker):
+    user = DBUser(id=7, username="alice", hashed_password="secret", disabled=False)
+    load = mocker.patch.object(jwt_module.jwt_service, "get_user_from_db", mocker.AsyncMock(return_value=user))
+    token = jwt_module.jwt_service.create_access_token({"sub": "alice"}, TOKEN_TYPE_ACCESS)
+
+    first = await get_current_user(token)
+    second = await get_current_user(token)
+
+    assert load.await_count == 1
+    assert (first.id, second.username) == (7, "alice")
+    assert first.hashed_password is None
+
+    user.disabled = True
+    await cache.invalidate("alice")
+    with pytest.raises(HTTPException):
+        await get_current_user(token)
+    assert load.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_lookup_overlapping_invalidation_is_not_cached(cache, mocker):
+    loading = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_load(username):
+        # Read before the user is disabled, returned after the invalidation
+        loading.set()
+        await release.wait()
+        return DBUser(id=7, username=username, disabled=False)
+
+    lookup = asyncio.create_task(cache.get_user("alice", slow_load))
+    await loading.wait()
+    await cache.invalidate("alice")
+    release.set()
+    assert not (await lookup).disabled
+
+    disabled = mocker.AsyncMock(return_value=DBUser(id=7, username="alice", disabled=True))
+    assert (await cache.get_user("alice", disabled)).disabled
+    disabled.assert_awaited_once()
+
+
+def test_admin_disables_user_with_cached_principal(cache, mocker):
+    mocker.patch.object(settings.auth, "admin_usernames", ["root"])
+    users = {name: DBUser(id=i, username=name, disabled=False) for i, name in enumerate(("root", "alice"))}
+    mocker.patch.object(
+        jwt_module.jwt_service, "get_user_from_db",
+        mocker.AsyncMock(side_effect=lambda username: users.get(username)),
+    )
+
+    async def update(stmt):
+        users["alice"].disabled = stmt.compile().params["disabled"]
+        return mocker.Mock(rowcount=1)
+
+    session = mocker.MagicMock(execute=update, connection=mocker.AsyncMock(), commit=mocker.AsyncMock())
+    mocker.patch.object(db_helper, "session_factory", return_value=mocker.MagicMock(
+        __aenter__=mocker.AsyncMock(return_value=session), __aexit__=mocker.AsyncMock(return_value=False),
+    ))
+    mocker.patch("app.services.auth_service.api_key_index.changed", mocker.AsyncMock())
+
+    app = FastAPI()
+    app.include_router(user_router)
+    client = TestClient(app)
+
+    def headers(username):
+        token = jwt_module.jwt_service.create_access_token({"sub": username}, TOKEN_TYPE_ACCESS)
+        return {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/stats/users/me", headers=headers("alice")).status_code == 200
+    # Not an administrator
+    assert client.patch("/stats/users/root", json={"disabled": True}, headers=headers("alice")).status_code == 403
+
+    response = client.patch("/stats/users/alice", json={"disabled": True}, headers=headers("root"))
+    assert response.status_code == 204
+    # alice was served from the principal cache; the next request is rejected without waiting for its TTL
+    assert client.get("/stats/users/me", headers=headers("alice")).status_code == 401
+
+
+def test_system_endpoints_require_admin(mocker):
+    mocker.patch.object(settings.auth, "admin_usernames", ["root"])
+    app = FastAPI()
+    app.include_router(system_router)
+    client = TestClient(app)
+
+    for username, status_code in (("alice", 403), ("root", 200)):
+        app.dependency_overrides[get_current_user] = lambda: DBUser(id=1, username=username, disabled=False)
+        assert client.get("/system/analytics").status_code == status_code
+
+
+def test_verified_tokens_are_cached_until_exp(mocker):
+    service = JWTService()
+    token = service.create_access_token({"sub": "bob"}, TOKEN_TYPE_ACCESS)
+    decode = mocker.spy(jwt_module.jwt, "decode")
+
+    assert service.decode_token(token, TOKEN_TYPE_ACCESS) == "bob"
+    assert service.decode_token(token, TOKEN_TYPE_ACCESS) == "bob"
+    assert decode.call_count == 1
+    with pytest.raises(HTTPException):
+        service.decode_token(token, "refresh")
@@ -0,0 +1,72 @@
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import RateLimit, settings
+from app.db.redis_helper import redis_helper
+from app.services import rate_limiter as limiter_module
+from app.services.rate_limiter import TokenBucketLimiter, charge_ingest
+
+LIMIT = RateLimit(times=10, seconds=10, burst=4)
+
+
+@pytest.fixture
+def clock(mocker):
+    return mocker.patch.object(limiter_module.time, "monotonic", return_value=100.0)
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    limiter = TokenBucketLimiter()
+    assert [limiter.hit("analytics", "user:1", LIMIT) for _ in range(4)] == [0.0] * 4
+    assert limiter.hit("analytics", "user:1", LIMIT) == pytest.approx(1.0)
+    # Other clients have their own bucket
+    assert limiter.hit("analytics", "user:2", LIMIT) == 0.0
+
+    clock.return_value = 102.5
+    assert [limiter.hit("analytics", "user:1", LIMIT) for _ in range(3)] == [0.0, 0.0, pytest.approx(0.5)]
+    assert limiter.stats()["throttled"] == 2
+
+
+@pytest.mark.asyncio
+async def test_sync_takes_over_the_shared_level(clock, mocker):
+    limiter = TokenBucketLimiter()
+    limiter.hit("analytics", "user:1", LIMIT)
+    limiter.hit("analytics", "user:1", LIMIT)
+
+    # Other workers spent most of the shared bucket meanwhile
+    mocker.patch.object(type(redis_helper), "available", new_callable=mocker.PropertyMock, return_value=True)
+    call = mocker.patch.object(redis_helper, "call", mocker.AsyncMock(return_value=["0.5"]))
+    await limiter.sync()
+
+    pipe = call.await_args.args[0].__self__
+    assert pipe.command_stack[0][0][-4:] == ("ratelimit:analytics:user:1", 1.0, 4, 2.0)
+    assert limiter.hit("analytics", "user:1", LIMIT) == pytest.approx(0.5)
+
+    # Without Redis the spending stays local
+    call.return_value = None
+    clock.return_value = 101.0
+    limiter.hit("analytics", "user:1", LIMIT)
+    await limiter.sync()
+    assert limiter._buckets[("analytics", "user:1")].spent == 0
+
+
+def test_ingest_quota_is_charged_by_batch_size(clock, mocker):
+    mocker.patch.object(limiter_module, "rate_limiter", TokenBucketLimiter())
+    mocker.patch.object(settings.rate_limit, "ingest_events", RateLimit(times=100, seconds=1, burst=1000))
+    mocker.patch.object(settings.rate_limit, "ingest_bytes", RateLimit(times=10**6, seconds=1))
+
+    headers = charge_ingest("key:abc", events=600, size=50_000)
+    assert headers == {"X-Quota-Remaining-Events": "400", "X-Quota-Remaining-Bytes": "950000"}
+
+    with pytest.raises(HTTPException) as error:
+        charge_ingest("key:abc", events=500, size=50_000)
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "1"
+    # A rejected batch charges neither quota
+    assert error.value.headers["X-Quota-Remaining-Bytes"] == "950000"
+
+    with pytest.raises(HTTPException) as error:
+        charge_ingest("key:abc", events=1001, size=10)
+    assert error.value.status_code == 413
+
+    clock.return_value = 101.0
+    assert charge_ingest("key:abc", events=500, size=50_000)["X-Quota-Remaining-Events"] == "0"
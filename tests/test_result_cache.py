@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+import datetime
+
+from app.db.redis_helper import redis_helper
+from app.services.query_result import QueryResult
+from app.services.result_cache import AnalyticsResultCache
+from app.utils.lru_cache import LRUCache
+
+
+@pytest.fixture
+def cache(mocker):
+    # Local tier only: behave as if Redis is down
+    mocker.patch.object(type(redis_helper), "available", new_callable=mocker.PropertyMock, return_value=False)
+    return AnalyticsResultCache()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_compute_once(cache):
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return QueryResult(["dau"], [(42,)])
+
+    results = await asyncio.gather(*[
+        cache.get_or_compute("dau", {"from_date": "2025-01-01"}, compute) for _ in range(10)
+    ])
+
+    assert calls == 1
+    assert all(result.records() == [{"dau": 42}] for result in results)
+
+
+@pytest.mark.asyncio
+async def test_new_snapshot_version_invalidates(cache):
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        return QueryResult(["calls"], [(calls,)])
+
+    assert (await cache.get_or_compute("dau", {"limit": 1}, compute)).rows == [(1,)]
+    assert (await cache.get_or_compute("dau", {"limit": 1}, compute)).rows == [(1,)]
+
+    await cache.publish_version()
+
+    assert (await cache.get_or_compute("dau", {"limit": 1}, compute)).rows == [(2,)]
+
+
+@pytest.mark.asyncio
+async def test_failure_is_not_cached(cache):
+    async def failing():
+        raise RuntimeError("duckdb is locked")
+
+    async def compute():
+        return QueryResult(["status"], [("ok",)])
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_compute("retention", {}, failing)
+
+    assert (await cache.get_or_compute("retention", {}, compute)).rows == [("ok",)]
+
+
+@pytest.mark.asyncio
+async def test_shared_tier_stores_arrow_not_pickle(mocker):
+    stored = {}
+
+    async def call(method, *args, **kwargs):
+        if method.__name__ == "set":
+            stored[args[0]] = args[1]
+        elif method.__name__ == "get":
+            return stored.get(args[0])
+        return True
+
+    mocker.patch.object(type(redis_helper), "available", new_callable=mocker.PropertyMock, return_value=True)
+    mocker.patch.object(redis_helper, "call", side_effect=call)
+    result = QueryResult(
+        ["day", "at", "share", "country"],
+        [(datetime.date(2025, 1, 1), datetime.datetime(2025, 1, 1, 12, tzinfo=datetime.timezone.utc), 0.5, None)],
+    )
+    await AnalyticsResultCache().store("dau", {}, result)
+
+    (payload,) = stored.values()
+    assert payload.startswith(b"\xff\xff\xff\xff")  # Arrow IPC stream, not a pickle
+    assert await AnalyticsResultCache().peek("dau", {}) == result
+
+
+def test_params_are_normalized():
+    assert (
+        AnalyticsResultCache.make_key("dau", {"a": 1, "b": 2}, "1")
+        == AnalyticsResultCache.make_key("dau", {"b": 2, "a": 1}, "1")
+    )
+    assert AnalyticsResultCache.make_key("dau", {"a": 1}, "1") != AnalyticsResultCache.make_key("dau", {"a": 1}, "2")
+
+
+def test_lru_is_bounded_by_bytes():
+    lru = LRUCache(max_entries=100, max_bytes=10)
+    lru.set("a", 1, size=4)
+    lru.set("b", 2, size=4)
+    lru.get("a")
+    lru.set("c", 3, size=4)
+
+    assert "a" in lru and "c" in lru
+    assert "b" not in lru
+    assert lru.total_bytes == 8
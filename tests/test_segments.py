@@ -0,0 +1,135 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from app.services import analytics_service as analytics_module
+from app.services.analytics_service import AnalyticsService, EventTail, read_connection
+from app.services.retention_engine import RetentionEngine
+from app.services.segments import Segment
+
+EVENTS = [
+    ("2025-08-04 10:00:00+00", 1, "UA", "login"),
+    ("2025-08-04 11:00:00+00", 1, "UA", "purchase"),
+    ("2025-08-04 12:00:00+00", 2, "PL", "login"),
+    ("2025-08-11 10:00:00+00", 1, "UA", "login"),
+    ("2025-08-11 10:00:00+00", 2, "PL", "purchase"),
+]
+
+
+SEGMENT_STEPS = (
+    AnalyticsService._update_user_cohorts, RetentionEngine.build_bitmaps, AnalyticsService._build_segment_rollups,
+)
+
+
+@pytest.fixture
+def events_snapshot(snapshot):
+    snapshot.load(EVENTS, *SEGMENT_STEPS, columns=snapshot.COUNTRY_COLUMNS)
+    return snapshot
+
+
+def test_parse_is_canonical():
+    a = Segment.parse(["properties.country:UA,PL", "event_type=login"])
+    b = Segment.parse(["event_type:login", "properties.country = PL,UA"])
+
+    assert a == b
+    assert str(a) == "event_type:login;prop_country:PL,UA"
+    assert not a.sketchable
+    assert Segment.parse(["event_type:login"]).sketchable
+
+
+def test_unknown_field_is_rejected():
+    with pytest.raises(ValueError):
+        Segment.parse(["properties.email:x"])
+
+
+def test_dau_by_property(events_snapshot):
+    result = AnalyticsService.get_dau(date(2025, 8, 1), date(2025, 8, 31), Segment.parse(["properties.country:UA"]))
+
+    assert result.rows == [(date(2025, 8, 4), 1), (date(2025, 8, 11), 1)]
+
+
+def test_top_events_by_segment(events_snapshot):
+    result = AnalyticsService.get_top_events(
+        date(2025, 8, 1), date(2025, 8, 31), segment=Segment.parse(["properties.country:UA"])
+    )
+
+    assert result.rows == [("login", 2), ("purchase", 1)]
+
+
+def test_segmented_retention(events_snapshot):
+    result = AnalyticsService.get_retention(
+        date(2025, 8, 4), windows=2, segment=Segment.parse(["event_type:purchase"])
+    )
+
+    # Both users joined in week 2025-08-04; only user 1 purchased then, only user 2 a week later
+    assert result.rows == [(date(2025, 8, 4), 0, 1), (date(2025, 8, 4), 1, 1)]
+
+
+def test_tail_merge_matches_full_snapshot(events_snapshot):
+    tail_events = [
+        ("2025-08-11 12:00:00+00", 3, "PL", "login"),     # new user, first seen in the tail
+        ("2025-08-18 10:00:00+00", 1, "UA", "purchase"),
+    ]
+    watermark, time_zone = AnalyticsService.snapshot_state()
+    assert watermark == pd.Timestamp(EVENTS[-1][0])
+    # Rows as Postgres aggregates them: (day, event_type, country, user_id, events, first_ts, last_ts)
+    tail_rows = []
+    for ts, user_id, country, event_type in tail_events:
+        occurred_at = pd.Timestamp(ts).to_pydatetime()
+        day = pd.Timestamp(ts).tz_convert(time_zone).date()
+        tail_rows.append((day, event_type, country, user_id, 1, occurred_at, occurred_at))
+    tail = EventTail(watermark, tail_rows)
+    fresh = (
+        AnalyticsService.get_dau(date(2025, 8, 1), date(2025, 8, 31), tail=tail),
+        AnalyticsService.get_top_events(date(2025, 8, 1), date(2025, 8, 31), tail=tail),
+        AnalyticsService.get_retention(date(2025, 8, 4), windows=3, tail=tail),
+    )
+
+    events_snapshot.load(EVENTS + tail_events, *SEGMENT_STEPS, columns=events_snapshot.COUNTRY_COLUMNS)
+
+    assert fresh == (
+        AnalyticsService.get_dau(date(2025, 8, 1), date(2025, 8, 31)),
+        AnalyticsService.get_top_events(date(2025, 8, 1), date(2025, 8, 31)),
+        AnalyticsService.get_retention(date(2025, 8, 4), windows=3),
+    )
+    assert tail.effective_watermark == pd.Timestamp("2025-08-18 10:00:00+00")
+
+
+def test_synced_events_layout_and_incremental_rollups(snapshot):
+    def sync(events):
+        source = pd.DataFrame({
+            "event_id": [f"e{i}" for i in range(len(events))],
+            "occurred_at": pd.to_datetime([ts for ts, *_ in events]),
+            "user_id": [user_id for _, user_id, _, _ in events],
+            "properties_json": [f'{{"country": "{country}"}}' for _, _, country, _ in events],
+            "event_type": [event_type for *_, event_type in events],
+        })
+        with analytics_module.write_connection() as conn:
+            conn.register("pg_events", source)
+            AnalyticsService._replace_synced_events(conn, "pg_events")
+            since = AnalyticsService._incremental_watermark(conn)
+            AnalyticsService._build_segment_rollups(conn, since)
+            AnalyticsService._save_sync_state(conn)
+            return since
+
+    assert sync(EVENTS[::-1]) is None
+    # A later sync appends an event type the previous ENUM did not have
+    assert sync(EVENTS + [("2025-08-12 09:00:00+00", 2, "PL", "refund")]) is not None
+
+    columns = dict(snapshot.fetch("SELECT column_name, data_type FROM duckdb_columns() "
+                                  "WHERE table_name = 'synced_events'"))
+    occurred = [row[0] for row in snapshot.fetch("SELECT occurred_at FROM synced_events")]
+    assert "event_id" not in columns
+    assert columns["event_type"] == "ENUM('login', 'purchase', 'refund')"
+    assert occurred == sorted(occurred)
+    result = AnalyticsService.get_top_events(date(2025, 8, 1), date(2025, 8, 31))
+    assert result.rows == [("login", 3), ("purchase", 2), ("refund", 1)]
+
+
+def test_open_reader_sees_the_next_sync(events_snapshot):
+    with read_connection() as reader:
+        assert reader.execute("SELECT count(*) FROM synced_events").fetchone()[0] == len(EVENTS)
+        events_snapshot.load(EVENTS[:2], *SEGMENT_STEPS, columns=events_snapshot.COUNTRY_COLUMNS)
+
+        assert reader.execute("SELECT count(*) FROM synced_events").fetchone()[0] == 2
@@ -0,0 +1,49 @@
+from datetime import date
+
+from app.services.analytics_service import AnalyticsService
+
+
+def load_sessions(snapshot, events, incremental=True):
+    """Rebuilds sessions from `events` (incrementally when the watermark allows); returns the watermark and sessions."""
+    since = snapshot.load(
+        events, AnalyticsService._build_sessions, columns=snapshot.SESSION_COLUMNS, incremental=incremental
+    )
+    return since, snapshot.fetch("SELECT * FROM sessions ORDER BY ALL")
+
+
+def test_gap_and_explicit_sessions(snapshot):
+    events = [
+        ("2025-08-04 10:00:00+00", 1, None, "login"),
+        ("2025-08-04 10:20:00+00", 1, None, "view_item"),
+        ("2025-08-04 11:30:00+00", 1, None, "view_item"),  # > 30 min gap: new session
+        ("2025-08-04 10:00:00+00", 2, "abc", "login"),
+        ("2025-08-04 12:00:00+00", 2, "abc", "purchase"),  # same session_id, no gap split
+    ]
+    load_sessions(snapshot, events)
+
+    result = AnalyticsService.get_sessions(date(2025, 8, 4), date(2025, 8, 4))
+
+    # (1200 + 0 + 7200) / 3 seconds, (2 + 1 + 2) / 3 events
+    assert result.rows == [(date(2025, 8, 4), 3, 2, 2800.0, 1.67)]
+
+
+def test_incremental_matches_full_rebuild(snapshot):
+    events = [
+        ("2025-08-04 10:00:00+00", 1, None, "login"),
+        ("2025-08-04 10:20:00+00", 1, None, "view_item"),
+        ("2025-08-04 09:00:00+00", 2, "abc", "login"),
+        ("2025-08-04 08:00:00+00", 3, None, "login"),
+    ]
+    assert load_sessions(snapshot, events)[0] is None
+
+    events += [
+        ("2025-08-04 10:40:00+00", 1, None, "purchase"),  # extends the open gap session
+        ("2025-08-05 09:00:00+00", 2, "abc", "logout"),   # reuses an explicit session id
+        ("2025-08-05 09:00:00+00", 3, None, "login"),     # long after user 3's session
+    ]
+    since, incremental = load_sessions(snapshot, events)
+    assert since is not None
+
+    _, full = load_sessions(snapshot, events, incremental=False)
+    assert incremental == full
+    assert len(full) == 4
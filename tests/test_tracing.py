@@ -0,0 +1,42 @@
+import re
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.tracing import ServerTimingMiddleware, record, span
+from app.services.analytics_executor import AnalyticsLane
+
+
+def server_timing(response) -> dict[str, float]:
+    return {
+        name: float(dur)
+        for name, dur in re.findall(r"(\w+);dur=([\d.]+)", response.headers["server-timing"])
+    }
+
+
+def test_stages_are_reported_in_server_timing_header(mocker):
+    mocker.patch("app.services.analytics_executor.read_connection").return_value.__enter__.return_value = object()
+    lane = AnalyticsLane("test", workers=1, timeout=5, queue_timeout=5)
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware)
+
+    @app.get("/stats")
+    async def stats():
+        with span("auth"):
+            record("db_acquire", 0.002)
+        # Stages timed in the executor thread belong to the request too
+        return await lane.run(lambda conn: {"ok": True}, {}, metric="dau")
+
+    response = TestClient(app).get("/stats")
+
+    timings = server_timing(response)
+    assert list(timings) == ["db_acquire", "auth", "queue", "duckdb", "total"]
+    assert timings["db_acquire"] == 2.0
+    assert timings["total"] >= timings["auth"]
+    lane.shutdown()
+
+
+def test_span_outside_request_is_noop():
+    with span("encode"):
+        pass
+    record("db_acquire", 0.1)
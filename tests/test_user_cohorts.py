@@ -0,0 +1,70 @@
+from datetime import date
+
+from app.services.analytics_service import AnalyticsService
+from app.services.retention_engine import RetentionEngine
+
+# Cohort maintenance steps of the sync
+COHORT_STEPS = (AnalyticsService._update_user_cohorts, RetentionEngine.build_bitmaps)
+
+
+def test_cohort_is_first_seen_week(snapshot):
+    events = [
+        ("2025-08-04 10:00:00+00", 1, "login"),      # week 2025-08-04
+        ("2025-08-12 10:00:00+00", 1, "purchase"),   # week +1
+        ("2025-08-13 10:00:00+00", 2, "login"),      # user 2 first seen in week 2025-08-11
+        ("2025-08-19 10:00:00+00", 2, "login"),
+    ]
+    snapshot.load(events, *COHORT_STEPS)
+
+    rows = AnalyticsService.get_retention(date(2025, 8, 4), windows=3)
+
+    assert rows.rows == [
+        (date(2025, 8, 4), 0, 1),
+        (date(2025, 8, 4), 1, 1),
+        (date(2025, 8, 11), 0, 1),
+        (date(2025, 8, 11), 1, 1),
+    ]
+
+
+def test_appended_events_update_incrementally(snapshot):
+    events = [("2025-08-04 10:00:00+00", 1, "login")]
+    assert snapshot.load(events, *COHORT_STEPS) is None
+
+    events.append(("2025-08-20 10:00:00+00", 1, "login"))
+    events.append(("2025-08-20 11:00:00+00", 3, "login"))
+    assert snapshot.load(events, *COHORT_STEPS) is not None
+
+    first_seen = snapshot.fetch("SELECT user_id, cohort_week FROM user_first_seen ORDER BY 1")
+    assert first_seen == [(1, date(2025, 8, 4)), (3, date(2025, 8, 18))]
+
+
+def test_late_event_triggers_full_rebuild(snapshot):
+    events = [("2025-08-20 10:00:00+00", 1, "login")]
+    snapshot.load(events, *COHORT_STEPS)
+
+    # Backfilled event older than the watermark moves user 1 into an earlier cohort
+    events.append(("2025-08-01 10:00:00+00", 1, "login"))
+    assert snapshot.load(events, *COHORT_STEPS) is None
+
+    assert snapshot.fetch("SELECT cohort_week FROM user_first_seen WHERE user_id = 1") == [(date(2025, 7, 28),)]
+
+
+def test_daily_windows(snapshot):
+    events = [
+        ("2025-08-04 10:00:00+00", 1, "login"),
+        ("2025-08-05 10:00:00+00", 1, "login"),
+        ("2025-08-04 12:00:00+00", 2, "login"),
+        ("2025-08-06 12:00:00+00", 2, "login"),
+        ("2025-08-05 12:00:00+00", 3, "login"),
+    ]
+    snapshot.load(events, *COHORT_STEPS)
+
+    rows = AnalyticsService.get_retention(date(2025, 8, 4), windows=3, mode="daily")
+
+    assert rows.columns == ["cohort_day", "day_number", "retained_users"]
+    assert rows.rows == [
+        (date(2025, 8, 4), 0, 2),
+        (date(2025, 8, 4), 1, 1),
+        (date(2025, 8, 4), 2, 1),
+        (date(2025, 8, 5), 0, 1),
+    ]